@@ -1,17 +1,1289 @@
+import argparse
+import asyncio
+import concurrent.futures
+import copy
+import csv
+import gzip
+import heapq
+import http.server
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import re
+import shlex
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import zlib
+from array import array
+from collections import Counter, OrderedDict
+from contextlib import contextmanager, redirect_stdout
+
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.pool
+
+from album_catalog_async import (ALBUMS_BY_CATEGORY_SQL, ARTISTS_BY_YEAR_SQL, LIST_ALBUMS_SQL, LIST_ARTISTS_SQL,
+                                 LIST_CATEGORIES_SQL, LIST_SONGS_SQL, LISTING_QUERIES, SONGS_BY_ARTIST_SQL,
+                                 AsyncCatalog, page_query)
+
+# Optional dependencies are imported on first use: the asyncio API needs psycopg 3
+# (pip install "psycopg[binary,pool]") and Parquet exports need pyarrow
+
+# Connection settings; every value can be overridden from the environment
+DB_DSN = os.environ.get("ALBUM_DB_DSN",
+                        "dbname=AlbumCollection user=postgres password=CoolPassword123 host=localhost")
+DB_MIN_CONNECTIONS = int(os.environ.get("ALBUM_DB_MIN_CONNECTIONS", "1"))
+DB_MAX_CONNECTIONS = int(os.environ.get("ALBUM_DB_MAX_CONNECTIONS", "10"))
+# Milliseconds; 0 leaves statements unbounded
+DB_STATEMENT_TIMEOUT = int(os.environ.get("ALBUM_DB_STATEMENT_TIMEOUT", "0"))
+# Connections idle for longer than this many seconds are pinged before reuse
+DB_HEALTH_CHECK_INTERVAL = float(os.environ.get("ALBUM_DB_HEALTH_CHECK_INTERVAL", "30"))
+
+# Name -> ID lookups are cached per process and table, least recently used first out
+ID_CACHE_SIZE = int(os.environ.get("ALBUM_ID_CACHE_SIZE", "10000"))
+# Query results are cached per catalog version, for at most this many seconds
+RESULT_CACHE_SIZE = int(os.environ.get("ALBUM_RESULT_CACHE_SIZE", "256"))
+RESULT_CACHE_TTL = float(os.environ.get("ALBUM_RESULT_CACHE_TTL", "300"))
+# Statements slower than this many milliseconds are logged with their plan (0 disables)
+TRACE_SLOW_MS = float(os.environ.get("ALBUM_TRACE_SLOW_MS", "0"))
+EXPLAINABLE_STATEMENTS = ("select", "insert", "update", "delete", "with", "values", "execute")
+# Hot lookups and inserts run as server-side prepared statements, parsed and
+# planned once per connection; turn off behind transaction-pooling proxies
+PREPARED_STATEMENTS = os.environ.get("ALBUM_PREPARED_STATEMENTS", "1") != "0"
+
+class IdCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        # Reverse index so edits and deletes can drop every key of a row
+        self.keys_by_id = {}
+        self.hits = 0
+        self.misses = 0
+        # Catalog epoch the entries were read in; see catalog_epoch
+        self.epoch = None
+        self.lock = threading.Lock()
+
+    def _in_epoch(self, epoch):
+        # A newer epoch empties the cache; transactions still reading an older
+        # one neither use nor fill it
+        if self.epoch is None or epoch > self.epoch:
+            self.entries.clear()
+            self.keys_by_id.clear()
+            self.epoch = epoch
+        return epoch == self.epoch
+
+    def get(self, key, epoch):
+        with self.lock:
+            row_id = self.entries.get(key) if self._in_epoch(epoch) else None
+            if row_id is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            return row_id
 
-def connect_db():
+    def put(self, key, row_id, epoch):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            if not self._in_epoch(epoch):
+                return
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = row_id
+            self.keys_by_id.setdefault(row_id, set()).add(key)
+            while len(self.entries) > self.maxsize:
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        row_id = self.entries.pop(key)
+        keys = self.keys_by_id[row_id]
+        keys.discard(key)
+        if not keys:
+            del self.keys_by_id[row_id]
+
+    def discard_id(self, row_id):
+        with self.lock:
+            for key in self.keys_by_id.pop(row_id, ()):
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.keys_by_id.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self.entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
+
+ID_CACHES = {table: IdCache(ID_CACHE_SIZE) for table in ("Artists", "Albums", "Songs", "Categories")}
+
+class ResultCache:
+    # Keys include the catalog version, so a write makes every older entry
+    # unreachable; those age out through the LRU order or the TTL
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self.entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
+
+RESULT_CACHE = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+
+def forget_ids(table, row_ids):
+    cache = ID_CACHES[table]
+    for row_id in row_ids:
+        cache.discard_id(row_id)
+
+def clear_id_caches():
+    for cache in ID_CACHES.values():
+        cache.clear()
+
+class OperationStats:
+    # Per-operation totals of the traces recorded by traced()
+    FIELDS = ("calls", "statements", "rows", "db_seconds", "client_seconds", "seconds", "slow_statements")
+
+    def __init__(self):
+        self.totals = {}
+        self.lock = threading.Lock()
+
+    def add(self, operation, trace):
+        with self.lock:
+            totals = self.totals.setdefault(operation, dict.fromkeys(self.FIELDS, 0))
+            for field in self.FIELDS:
+                totals[field] += trace[field]
+
+    def snapshot(self):
+        with self.lock:
+            return {operation: dict(totals) for operation, totals in self.totals.items()}
+
+    def clear(self):
+        with self.lock:
+            self.totals.clear()
+
+    def summary(self):
+        lines = [f"{'operation':34} {'calls':>7} {'stmts/call':>10} {'rows':>9} {'db ms':>10} {'client ms':>10} "
+                 f"{'total ms':>10} {'slow':>5}"]
+        for operation, totals in sorted(self.snapshot().items(), key=lambda item: -item[1]["seconds"]):
+            lines.append(f"{operation:34} {totals['calls']:7} {totals['statements'] / totals['calls']:10.1f} "
+                         f"{totals['rows']:9} {totals['db_seconds'] * 1000:10.1f} "
+                         f"{totals['client_seconds'] * 1000:10.1f} {totals['seconds'] * 1000:10.1f} "
+                         f"{totals['slow_statements']:5}")
+        return "\n".join(lines)
+
+    def prometheus(self):
+        # Prometheus text exposition format, one counter family per field
+        snapshot = self.snapshot()
+        lines = []
+        for field in self.FIELDS:
+            name = f"album_manager_operation_{field}_total"
+            lines.append(f"# HELP {name} {field.replace('_', ' ').capitalize()} summed per top-level operation.")
+            lines.append(f"# TYPE {name} counter")
+            for operation, totals in sorted(snapshot.items()):
+                label = operation.replace("\\", "\\\\").replace('"', '\\"')
+                lines.append(f'{name}{{operation="{label}"}} {totals[field]}')
+        return "\n".join(lines) + "\n"
+
+OPERATION_STATS = OperationStats()
+
+def new_trace():
+    trace = dict.fromkeys(OperationStats.FIELDS, 0)
+    trace["calls"] = 1
+    return trace
+
+@contextmanager
+def traced(conn, operation):
+    # Attributes every statement on conn to one top-level operation; nested
+    # operations count towards the outermost one
+    if not isinstance(conn, CatalogConnection) or conn.trace is not None:
+        yield
+        return
+    trace = conn.trace = new_trace()
+    trace["operation"] = operation
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        conn.trace = None
+        trace["seconds"] = time.perf_counter() - start
+        trace["client_seconds"] = max(0.0, trace["seconds"] - trace["db_seconds"])
+        OPERATION_STATS.add(operation, trace)
+
+def caches():
+    return {**ID_CACHES, "results": RESULT_CACHE}
+
+def cache_prometheus():
+    lines = []
+    for field, kind in (("hits", "counter"), ("misses", "counter"), ("size", "gauge")):
+        name = f"album_manager_cache_{field}" + ("_total" if kind == "counter" else "")
+        lines.append(f"# HELP {name} Cache {field} per ID cache table and for query results.")
+        lines.append(f"# TYPE {name} {kind}")
+        for cache_name, cache in caches().items():
+            lines.append(f'{name}{{cache="{cache_name}"}} {cache.stats()[field]}')
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path):
+    # Written to a temporary file first, so a textfile collector never reads half of it
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, encoding="utf-8") as f:
+        f.write(OPERATION_STATS.prometheus())
+        f.write(cache_prometheus())
+    os.replace(f.name, path)
+
+class CatalogCursor(psycopg2.extensions.cursor):
+    # Counts the statements sent through the connection and, inside traced(),
+    # records their database time and fetched rows and explains slow ones
+    def record(self, seconds, statements=0, rows=0):
+        conn = self.connection
+        conn.statement_count += statements
+        trace = conn.trace
+        if trace is not None:
+            trace["statements"] += statements
+            trace["db_seconds"] += seconds
+            trace["rows"] += rows
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            result = super().execute(query, vars)
+        except BaseException:
+            self.record(time.perf_counter() - start, statements=1)
+            raise
+        elapsed = time.perf_counter() - start
+        self.record(elapsed, statements=1)
+        if TRACE_SLOW_MS and elapsed * 1000 >= TRACE_SLOW_MS:
+            self.log_slow_statement(elapsed)
+        return result
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self.record(time.perf_counter() - start, statements=1)
+
+    def copy_expert(self, sql, file, size=8192):
+        start = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            self.record(time.perf_counter() - start, statements=1)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self.record(time.perf_counter() - start, rows=row is not None)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        start = time.perf_counter()
+        rows = super().fetchmany(*args, **kwargs)
+        self.record(time.perf_counter() - start, rows=len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self.record(time.perf_counter() - start, rows=len(rows))
+        return rows
+
+    def __iter__(self):
+        # Named cursors fetch from the server while being iterated
+        rows = 0
+        seconds = 0.0
+        iterator = super().__iter__()
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    row = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    seconds += time.perf_counter() - start
+                rows += 1
+                yield row
+        finally:
+            self.record(seconds, rows=rows)
+
+    def log_slow_statement(self, elapsed):
+        # EXPLAIN ANALYZE runs the statement again, so it runs inside a savepoint
+        # that is rolled back; named cursors only declare theirs and are skipped
+        conn = self.connection
+        statement = self.query.decode("utf-8", "replace")
+        if self.name or conn.autocommit:
+            plan = "(no plan for cursor declarations or autocommit connections)"
+        elif not statement.lstrip().lower().startswith(EXPLAINABLE_STATEMENTS):
+            plan = "(only SELECT, INSERT, UPDATE, DELETE, WITH and EXECUTE statements are explained)"
+        else:
+            with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+                cur.execute("SAVEPOINT trace_explain;")
+                try:
+                    cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + statement)
+                    plan = "\n".join(row[0] for row in cur.fetchall())
+                except psycopg2.Error as e:
+                    plan = f"(plan unavailable: {e})"
+                cur.execute("ROLLBACK TO SAVEPOINT trace_explain;")
+                cur.execute("RELEASE SAVEPOINT trace_explain;")
+
+        operation = conn.trace["operation"] if conn.trace is not None else "untraced"
+        if conn.trace is not None:
+            conn.trace["slow_statements"] += 1
+        print(f"Slow statement in {operation} ({elapsed * 1000:.1f} ms):\n{statement.strip()}\n{plan}\n",
+              file=sys.stderr)
+
+class CatalogConnection(psycopg2.extensions.connection):
+    # Remembers the IDs of rows the open transaction created and cached; if it
+    # never commits they name rows that were rolled back, so they are dropped again
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending_ids = []
+        # Catalog epoch of the open transaction, read on its first ID lookup
+        self.epoch = None
+        self.statement_count = 0
+        self.trace = None
+        # Prepared statement name -> parameter names in $1, $2, ... order
+        self.prepared = {}
+        self.cursor_factory = CatalogCursor
+
+    def commit(self):
+        super().commit()
+        self.pending_ids.clear()
+        self.epoch = None
+
+    def rollback(self):
+        try:
+            super().rollback()
+        finally:
+            self.forget_pending_ids()
+            self.epoch = None
+
+    def close(self):
+        self.forget_pending_ids()
+        super().close()
+
+    def forget_pending_ids(self):
+        for table, row_id in self.pending_ids:
+            ID_CACHES[table].discard_id(row_id)
+        self.pending_ids.clear()
+
+# True for rows inserted by the current, still open transaction. xmin is the
+# 32-bit transaction ID while txid_current_if_assigned() carries the epoch, and
+# a transaction that has written nothing yet has no ID, which gives NULL
+CREATED_HERE_SQL = "xmin::text::bigint = mod(txid_current_if_assigned(), 4294967296)"
+
+def catalog_epoch(cur):
+    # Wipes and snapshot restores bump the epoch: they may give old IDs to new
+    # rows, so IDs cached in an earlier epoch must not be used. Read once per
+    # transaction on connections that can remember it, otherwise per lookup
+    conn = cur.connection
+    epoch = getattr(conn, "epoch", None)
+    if epoch is None:
+        cur.execute("SELECT Epoch FROM CatalogVersion;")
+        epoch = cur.fetchone()[0]
+        if isinstance(conn, CatalogConnection):
+            conn.epoch = epoch
+    return epoch
+
+def cache_id(cur, table, cache_key, row_id, created):
+    # Only connections that forget their pending IDs on rollback may fill the cache;
+    # committed rows survive a rollback, so only rows created here are pending
+    pending_ids = getattr(cur.connection, "pending_ids", None)
+    if pending_ids is not None:
+        ID_CACHES[table].put(cache_key, row_id, catalog_epoch(cur))
+        if created:
+            pending_ids.append((table, row_id))
+
+_pool = None
+_pool_lock = threading.Lock()
+_last_used = {}
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = psycopg2.pool.ThreadedConnectionPool(
+                DB_MIN_CONNECTIONS, DB_MAX_CONNECTIONS, DB_DSN,
+                connection_factory=CatalogConnection,
+                options=f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"
+            )
+        return _pool
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+        _pool = None
+        _last_used.clear()
+
+def is_healthy(conn):
+    if conn.closed or conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0) < DB_HEALTH_CHECK_INTERVAL:
+        return True
     try:
-        conn = psycopg2.connect(
-            dbname="AlbumCollection",
-            user="postgres",
-            password="CoolPassword123",
-            host="localhost"
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def checkout(pool):
+    # Broken connections are closed and replaced by the pool, up to one attempt per slot
+    for _ in range(DB_MAX_CONNECTIONS):
+        conn = pool.getconn()
+        if is_healthy(conn):
+            return conn
+        _last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError("could not get a working database connection")
+
+@contextmanager
+def connection():
+    # Lends a pooled connection to one operation; the operation commits its own work
+    pool = get_pool()
+    conn = checkout(pool)
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        broken = broken or conn.closed
+        if broken:
+            _last_used.pop(id(conn), None)
+        else:
+            _last_used[id(conn)] = time.monotonic()
+        pool.putconn(conn, close=broken)
+
+@contextmanager
+def transaction():
+    # Like connection(), but commits when the block succeeds and rolls back otherwise
+    with connection() as conn:
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            if not conn.closed:
+                conn.rollback()
+            raise
+
+# Junction tables with their composite primary key and the reverse-direction index
+JUNCTION_TABLES = (
+    ("SongArtists", "SongID", "ArtistID"),
+    ("SongAlbums", "SongID", "AlbumID"),
+    ("AlbumArtists", "AlbumID", "ArtistID"),
+    ("SongCategories", "SongID", "CategoryID"),
+)
+
+def junction_keys_sql():
+    # Existing databases may predate the primary keys; drop exact duplicate links
+    # first so the keys can be added in place
+    statements = []
+    for table, left, right in JUNCTION_TABLES:
+        statements.append(f"""
+        DELETE FROM {table} a USING {table} b
+        WHERE a.ctid < b.ctid AND a.{left} = b.{left} AND a.{right} = b.{right};
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = '{table}'::regclass AND contype = 'p') THEN
+                ALTER TABLE {table} ADD PRIMARY KEY ({left}, {right});
+            END IF;
+        END $$;
+        CREATE INDEX IF NOT EXISTS {table.lower()}_{right.lower()}_idx ON {table} ({right}, {left});
+        """)
+    return "".join(statements)
+
+# Entity tables with the columns of their unique lookup key, and the plain
+# foreign-key columns pointing at them besides the junction tables
+LOOKUP_KEYS = (
+    ("Artists", "ArtistID", ("Name",)),
+    ("Categories", "CategoryID", ("Name",)),
+    ("Albums", "AlbumID", ("Title", "Year")),
+    ("Songs", "SongID", ("Title",)),
+)
+LOOKUP_REFERENCES = (("Albums", "ArtistID"),)
+
+def duplicate_merge_sql():
+    # Existing databases may hold several rows with the same lookup key; each
+    # group is merged into its lowest ID (links repointed, the rest deleted) so
+    # the unique indexes can be built. NULL keys never clash, so they are left alone
+    statements = []
+    for table, id_column, key in LOOKUP_KEYS:
+        merge = f"{table.lower()}_merge"
+        statements.append(f"""
+        CREATE TEMP TABLE {merge} ON COMMIT DROP AS
+        SELECT OldID, NewID
+        FROM (
+            SELECT {id_column} AS OldID, min({id_column}) OVER (PARTITION BY {", ".join(key)}) AS NewID
+            FROM {table}
+            WHERE {" AND ".join(f"{column} IS NOT NULL" for column in key)}
+        ) ids
+        WHERE OldID <> NewID;
+        """)
+        for junction, left, right in JUNCTION_TABLES:
+            if id_column not in (left, right):
+                continue
+            other = right if left == id_column else left
+            statements.append(f"""
+        INSERT INTO {junction} ({id_column}, {other})
+        SELECT DISTINCT m.NewID, j.{other}
+        FROM {junction} j
+        JOIN {merge} m ON m.OldID = j.{id_column}
+        WHERE NOT EXISTS (SELECT 1 FROM {junction} k WHERE k.{id_column} = m.NewID AND k.{other} = j.{other});
+        DELETE FROM {junction} j USING {merge} m WHERE j.{id_column} = m.OldID;
+        """)
+        for referencing, column in LOOKUP_REFERENCES:
+            if column == id_column:
+                statements.append(f"""
+        UPDATE {referencing} r SET {column} = m.NewID FROM {merge} m WHERE r.{column} = m.OldID;
+        """)
+        statements.append(f"""
+        DELETE FROM {table} t USING {merge} m WHERE t.{id_column} = m.OldID;
+        """)
+    return "".join(statements)
+
+# SongDetails keeps each song's album, artist and category names pre-aggregated
+# for the song screens; statement-level triggers refresh only the songs a write
+# touched, unless album.defer_song_details is on and the writer refreshes them itself
+SONG_DETAILS_SQL = """
+        CREATE TABLE IF NOT EXISTS SongDetails (
+            SongID integer PRIMARY KEY REFERENCES Songs (SongID) ON DELETE CASCADE,
+            Title text NOT NULL,
+            Albums text[] NOT NULL DEFAULT '{}',
+            Artists text[] NOT NULL DEFAULT '{}',
+            Categories text[] NOT NULL DEFAULT '{}'
+        );
+        CREATE INDEX IF NOT EXISTS songdetails_title_idx ON SongDetails (Title, SongID);
+
+        CREATE OR REPLACE FUNCTION refresh_song_details(song_ids integer[]) RETURNS void LANGUAGE plpgsql
+        SET plan_cache_mode = force_generic_plan AS $$
+        BEGIN
+            INSERT INTO SongDetails (SongID, Title, Albums, Artists, Categories)
+            SELECT s.SongID, s.Title,
+                   ARRAY(SELECT DISTINCT al.Title
+                         FROM SongAlbums sa
+                         JOIN Albums al ON sa.AlbumID = al.AlbumID
+                         WHERE sa.SongID = s.SongID
+                         ORDER BY al.Title),
+                   ARRAY(SELECT DISTINCT art.Name
+                         FROM SongArtists saa
+                         JOIN Artists art ON saa.ArtistID = art.ArtistID
+                         WHERE saa.SongID = s.SongID
+                         ORDER BY art.Name),
+                   ARRAY(SELECT DISTINCT c.Name
+                         FROM SongCategories sc
+                         JOIN Categories c ON sc.CategoryID = c.CategoryID
+                         WHERE sc.SongID = s.SongID
+                         ORDER BY c.Name)
+            FROM Songs s
+            JOIN (SELECT DISTINCT unnest(song_ids) AS SongID) changed ON changed.SongID = s.SongID
+            ON CONFLICT (SongID) DO UPDATE
+            SET Title = EXCLUDED.Title, Albums = EXCLUDED.Albums,
+                Artists = EXCLUDED.Artists, Categories = EXCLUDED.Categories;
+        END $$;
+
+        CREATE OR REPLACE FUNCTION song_details_from_links() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF current_setting('album.defer_song_details', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP = 'DELETE' THEN
+                PERFORM refresh_song_details(ARRAY(SELECT SongID FROM old_rows));
+            ELSE
+                PERFORM refresh_song_details(ARRAY(SELECT SongID FROM new_rows));
+            END IF;
+            RETURN NULL;
+        END $$;
+
+        CREATE OR REPLACE FUNCTION song_details_from_names() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF current_setting('album.defer_song_details', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+            IF TG_TABLE_NAME = 'songs' THEN
+                PERFORM refresh_song_details(ARRAY(SELECT SongID FROM new_rows));
+            ELSIF TG_TABLE_NAME = 'albums' THEN
+                PERFORM refresh_song_details(ARRAY(
+                    SELECT sa.SongID
+                    FROM new_rows n
+                    JOIN old_rows o ON o.AlbumID = n.AlbumID
+                    JOIN SongAlbums sa ON sa.AlbumID = n.AlbumID
+                    WHERE o.Title IS DISTINCT FROM n.Title));
+            ELSIF TG_TABLE_NAME = 'artists' THEN
+                PERFORM refresh_song_details(ARRAY(
+                    SELECT sa.SongID
+                    FROM new_rows n
+                    JOIN old_rows o ON o.ArtistID = n.ArtistID
+                    JOIN SongArtists sa ON sa.ArtistID = n.ArtistID
+                    WHERE o.Name IS DISTINCT FROM n.Name));
+            ELSE
+                PERFORM refresh_song_details(ARRAY(
+                    SELECT sc.SongID
+                    FROM new_rows n
+                    JOIN old_rows o ON o.CategoryID = n.CategoryID
+                    JOIN SongCategories sc ON sc.CategoryID = n.CategoryID
+                    WHERE o.Name IS DISTINCT FROM n.Name));
+            END IF;
+            RETURN NULL;
+        END $$;
+"""
+
+# Tables whose writes change SongDetails, with the trigger events and transition tables they need
+SONG_DETAILS_TRIGGERS = (
+    ("SongAlbums", "song_details_from_links", (("INSERT", "NEW TABLE AS new_rows"), ("DELETE", "OLD TABLE AS old_rows"))),
+    ("SongArtists", "song_details_from_links", (("INSERT", "NEW TABLE AS new_rows"), ("DELETE", "OLD TABLE AS old_rows"))),
+    ("SongCategories", "song_details_from_links", (("INSERT", "NEW TABLE AS new_rows"), ("DELETE", "OLD TABLE AS old_rows"))),
+    ("Songs", "song_details_from_names", (("INSERT", "NEW TABLE AS new_rows"),
+                                          ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"))),
+    ("Albums", "song_details_from_names", (("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),)),
+    ("Artists", "song_details_from_names", (("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),)),
+    ("Categories", "song_details_from_names", (("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),)),
+)
+
+def song_details_sql():
+    # Transition tables allow a single event per trigger, hence one trigger per event
+    statements = [SONG_DETAILS_SQL]
+    for table, function, events in SONG_DETAILS_TRIGGERS:
+        for event, transition_tables in events:
+            trigger = f"{table.lower()}_details_{event.lower()}"
+            statements.append(f"""
+        DROP TRIGGER IF EXISTS {trigger} ON {table};
+        CREATE TRIGGER {trigger} AFTER {event} ON {table}
+            REFERENCING {transition_tables} FOR EACH STATEMENT EXECUTE FUNCTION {function}();
+        """)
+    statements.append("""
+        SELECT refresh_song_details(ARRAY(SELECT SongID FROM Songs));
+        """)
+    return "".join(statements)
+
+# Each entity's name column gets a 'simple' full-text index (no stemming, so
+# names match word for word) and a lower-case prefix index; trigram indexes for
+# fuzzy matching are added when the pg_trgm extension can be installed
+SEARCH_COLUMNS = (
+    ("Artists", "Name"),
+    ("Albums", "Title"),
+    ("Songs", "Title"),
+    ("Categories", "Name"),
+)
+
+def search_indexes_sql():
+    statements = []
+    for table, column in SEARCH_COLUMNS:
+        prefix = f"{table.lower()}_{column.lower()}"
+        statements.append(f"""
+        CREATE INDEX IF NOT EXISTS {prefix}_text_idx ON {table} USING gin (to_tsvector('simple', {column}));
+        CREATE INDEX IF NOT EXISTS {prefix}_prefix_idx ON {table} (lower({column}) text_pattern_ops);
+        """)
+    trigram_indexes = "".join(
+        f"\n                EXECUTE 'CREATE INDEX IF NOT EXISTS {table.lower()}_{column.lower()}_trgm_idx "
+        f"ON {table} USING gin ({column} gin_trgm_ops)';"
+        for table, column in SEARCH_COLUMNS)
+    statements.append(f"""
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+                CREATE EXTENSION IF NOT EXISTS pg_trgm;{trigram_indexes}
+            END IF;
+        EXCEPTION WHEN insufficient_privilege THEN
+            RAISE NOTICE 'pg_trgm could not be installed; fuzzy search is disabled';
+        END $$;
+        """)
+    return "".join(statements)
+
+# Pickers page through names in case-insensitive order and narrow them by
+# prefix; with the ID as tie-breaker, every page is one range scan of these
+PICK_INDEXES = (
+    ("Artists", "Name", "ArtistID"),
+    ("Albums", "Title", "AlbumID"),
+    ("Songs", "Title", "SongID"),
+    ("Categories", "Name", "CategoryID"),
+)
+
+def pick_indexes_sql():
+    return "".join(f"""
+        CREATE INDEX IF NOT EXISTS {table.lower()}_{column.lower()}_pick_idx
+            ON {table} ((lower({column}) COLLATE "C"), {id_column});
+        """ for table, column, id_column in PICK_INDEXES)
+
+# Every writing statement on a catalog table bumps CatalogVersion, so readers
+# can tell whether anything changed since they last looked; readers that take
+# the version and the data from one snapshot never label old data as new
+CATALOG_TABLES = ("Artists", "Albums", "Songs", "Categories",
+                  "SongArtists", "SongAlbums", "AlbumArtists", "SongCategories")
+
+def catalog_version_sql():
+    statements = ["""
+        CREATE TABLE IF NOT EXISTS CatalogVersion (
+            Version bigint NOT NULL
+        );
+        INSERT INTO CatalogVersion (Version) SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM CatalogVersion);
+
+        CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE CatalogVersion SET Version = Version + 1;
+            RETURN NULL;
+        END;
+        $$;
+        """]
+    for table in CATALOG_TABLES:
+        trigger = f"{table.lower()}_catalog_version"
+        statements.append(f"""
+        DROP TRIGGER IF EXISTS {trigger} ON {table};
+        CREATE TRIGGER {trigger} AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+        """)
+    return "".join(statements)
+
+# Parallel imports record every loaded chunk, with the songs it touched, so an
+# interrupted import can resume; bulk loaders set album.defer_catalog_version
+# and bump the version once per committed transaction instead of per statement
+IMPORT_CHECKPOINTS_SQL = """
+    CREATE TABLE IF NOT EXISTS ImportCheckpoints (
+        ImportKey text NOT NULL,
+        Chunk text NOT NULL,
+        Tracks integer NOT NULL,
+        SongIDs integer[] NOT NULL DEFAULT '{}',
+        Refreshed boolean NOT NULL DEFAULT false,
+        CompletedAt timestamptz NOT NULL DEFAULT now(),
+        PRIMARY KEY (ImportKey, Chunk)
+    );
+
+    CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        IF current_setting('album.defer_catalog_version', true) = 'on' THEN
+            RETURN NULL;
+        END IF;
+        UPDATE CatalogVersion SET Version = Version + 1;
+        RETURN NULL;
+    END;
+    $$;
+"""
+
+# The epoch counts wipes and snapshot restores, after which IDs may name other
+# rows than before; every TRUNCATE bumps it, even in a bulk loader's transaction
+CATALOG_EPOCH_SQL = """
+    ALTER TABLE CatalogVersion ADD COLUMN IF NOT EXISTS Epoch bigint NOT NULL DEFAULT 1;
+
+    CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'TRUNCATE' THEN
+            UPDATE CatalogVersion SET Version = Version + 1, Epoch = Epoch + 1;
+            RETURN NULL;
+        END IF;
+        IF current_setting('album.defer_catalog_version', true) = 'on' THEN
+            RETURN NULL;
+        END IF;
+        UPDATE CatalogVersion SET Version = Version + 1;
+        RETURN NULL;
+    END;
+    $$;
+"""
+
+# Writes to the junction tables are logged with their transaction, so a cached
+# catalog graph can catch up by applying the links added and removed since its
+# snapshot. Bulk writers (anything deferring the version or song details) and
+# TRUNCATE log a single row without a link instead, which makes graphs rebuild
+LINK_CHANGES_SQL = """
+    CREATE TABLE IF NOT EXISTS LinkChanges (
+        ChangeID bigserial PRIMARY KEY,
+        TxID xid8 NOT NULL DEFAULT pg_current_xact_id(),
+        LinkTable text,
+        FromID integer,
+        ToID integer,
+        Added boolean
+    );
+    CREATE INDEX IF NOT EXISTS linkchanges_txid ON LinkChanges (TxID);
+
+    CREATE OR REPLACE FUNCTION log_link_changes() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'TRUNCATE' OR current_setting('album.defer_catalog_version', true) = 'on'
+                OR current_setting('album.defer_song_details', true) = 'on' THEN
+            INSERT INTO LinkChanges DEFAULT VALUES;
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            EXECUTE format('INSERT INTO LinkChanges (LinkTable, FromID, ToID, Added) '
+                           'SELECT %L, %s, %s, false FROM old_rows', TG_ARGV[0], TG_ARGV[1], TG_ARGV[2]);
+        END IF;
+        IF TG_OP IN ('UPDATE', 'INSERT') THEN
+            EXECUTE format('INSERT INTO LinkChanges (LinkTable, FromID, ToID, Added) '
+                           'SELECT %L, %s, %s, true FROM new_rows', TG_ARGV[0], TG_ARGV[1], TG_ARGV[2]);
+        END IF;
+        RETURN NULL;
+    END $$;
+"""
+
+# The log prunes itself: at most once per LINK_CHANGES_PRUNE_INTERVAL, the first
+# writer to get the lock deletes the changes older than LINK_CHANGES_RETENTION and
+# records the newest pruned transaction as the horizon. A graph whose snapshot
+# may have missed a pruned change rebuilds, so graphs used within the retention
+# just keep catching up. Both intervals are fixed when the migration runs
+LINK_CHANGES_RETENTION = "1 hour"
+LINK_CHANGES_PRUNE_INTERVAL = "1 minute"
+LINK_CHANGES_PRUNING_SQL = f"""
+    ALTER TABLE LinkChanges ADD COLUMN IF NOT EXISTS ChangedAt timestamptz NOT NULL DEFAULT now();
+    CREATE TABLE IF NOT EXISTS LinkChangesHorizon (
+        TxID xid8 NOT NULL,
+        PrunedAt timestamptz NOT NULL
+    );
+    INSERT INTO LinkChangesHorizon (TxID, PrunedAt)
+    SELECT '0'::xid8, now() WHERE NOT EXISTS (SELECT 1 FROM LinkChangesHorizon);
+
+    CREATE OR REPLACE FUNCTION prune_link_changes() RETURNS void LANGUAGE plpgsql AS $$
+    BEGIN
+        IF (SELECT PrunedAt FROM LinkChangesHorizon) > now() - interval '{LINK_CHANGES_PRUNE_INTERVAL}' THEN
+            RETURN;
+        END IF;
+        IF NOT pg_try_advisory_xact_lock(hashtext('LinkChanges')) THEN
+            RETURN;
+        END IF;
+        WITH pruned AS (
+            DELETE FROM LinkChanges
+            WHERE ChangedAt < now() - interval '{LINK_CHANGES_RETENTION}' AND TxID <> pg_current_xact_id()
+            RETURNING TxID
         )
-        return conn
-    except Exception as e:
-        print(f"Error connecting to the database: {e}")
-        exit()
+        UPDATE LinkChangesHorizon
+        SET TxID = GREATEST(TxID, COALESCE((SELECT max(TxID) FROM pruned), TxID)), PrunedAt = now();
+    END $$;
+
+    CREATE OR REPLACE FUNCTION log_link_changes() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'TRUNCATE' OR current_setting('album.defer_catalog_version', true) = 'on'
+                OR current_setting('album.defer_song_details', true) = 'on' THEN
+            INSERT INTO LinkChanges DEFAULT VALUES;
+        ELSE
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                EXECUTE format('INSERT INTO LinkChanges (LinkTable, FromID, ToID, Added) '
+                               'SELECT %L, %s, %s, false FROM old_rows', TG_ARGV[0], TG_ARGV[1], TG_ARGV[2]);
+            END IF;
+            IF TG_OP IN ('UPDATE', 'INSERT') THEN
+                EXECUTE format('INSERT INTO LinkChanges (LinkTable, FromID, ToID, Added) '
+                               'SELECT %L, %s, %s, true FROM new_rows', TG_ARGV[0], TG_ARGV[1], TG_ARGV[2]);
+            END IF;
+        END IF;
+        PERFORM prune_link_changes();
+        RETURN NULL;
+    END $$;
+"""
+
+# Junction tables in the catalog graph, with the columns their changes are logged as
+LINK_TABLES = {
+    "SongArtists": ("ArtistID", "SongID"),
+    "AlbumArtists": ("ArtistID", "AlbumID"),
+    "SongCategories": ("SongID", "CategoryID"),
+}
+LINK_TRIGGER_EVENTS = (
+    ("INSERT", "REFERENCING NEW TABLE AS new_rows "),
+    ("UPDATE", "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows "),
+    ("DELETE", "REFERENCING OLD TABLE AS old_rows "),
+    ("TRUNCATE", ""),
+)
+
+def link_changes_sql():
+    statements = [LINK_CHANGES_SQL]
+    for table, (from_column, to_column) in LINK_TABLES.items():
+        for event, transition_tables in LINK_TRIGGER_EVENTS:
+            trigger = f"{table.lower()}_links_{event.lower()}"
+            statements.append(f"""
+        DROP TRIGGER IF EXISTS {trigger} ON {table};
+        CREATE TRIGGER {trigger} AFTER {event} ON {table}
+            {transition_tables}FOR EACH STATEMENT
+            EXECUTE FUNCTION log_link_changes('{table}', '{from_column}', '{to_column}');
+        """)
+    return "".join(statements)
+
+# Applied in order and recorded in SchemaVersion; never edit a released migration, add a new one
+MIGRATIONS = (
+    (1, "catalog tables", """
+        CREATE TABLE IF NOT EXISTS Artists (
+            ArtistID serial PRIMARY KEY,
+            Name text NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS Categories (
+            CategoryID serial PRIMARY KEY,
+            Name text NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS Albums (
+            AlbumID serial PRIMARY KEY,
+            Title text NOT NULL,
+            Year integer,
+            ArtistID integer REFERENCES Artists (ArtistID) ON DELETE SET NULL
+        );
+        CREATE TABLE IF NOT EXISTS Songs (
+            SongID serial PRIMARY KEY,
+            Title text NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS SongArtists (
+            SongID integer NOT NULL REFERENCES Songs (SongID),
+            ArtistID integer NOT NULL REFERENCES Artists (ArtistID),
+            PRIMARY KEY (SongID, ArtistID)
+        );
+        CREATE TABLE IF NOT EXISTS SongAlbums (
+            SongID integer NOT NULL REFERENCES Songs (SongID),
+            AlbumID integer NOT NULL REFERENCES Albums (AlbumID),
+            PRIMARY KEY (SongID, AlbumID)
+        );
+        CREATE TABLE IF NOT EXISTS AlbumArtists (
+            AlbumID integer NOT NULL REFERENCES Albums (AlbumID),
+            ArtistID integer NOT NULL REFERENCES Artists (ArtistID),
+            PRIMARY KEY (AlbumID, ArtistID)
+        );
+        CREATE TABLE IF NOT EXISTS SongCategories (
+            SongID integer NOT NULL REFERENCES Songs (SongID),
+            CategoryID integer NOT NULL REFERENCES Categories (CategoryID),
+            PRIMARY KEY (SongID, CategoryID)
+        );
+    """),
+    (2, "unique lookup keys and junction indexes", duplicate_merge_sql() + """
+        CREATE UNIQUE INDEX IF NOT EXISTS artists_name_key ON Artists (Name);
+        CREATE UNIQUE INDEX IF NOT EXISTS categories_name_key ON Categories (Name);
+        CREATE UNIQUE INDEX IF NOT EXISTS albums_title_year_key ON Albums (Title, Year);
+        CREATE UNIQUE INDEX IF NOT EXISTS songs_title_key ON Songs (Title);
+        CREATE INDEX IF NOT EXISTS albums_artistid_idx ON Albums (ArtistID);
+    """ + junction_keys_sql()),
+    (3, "song details summary table", song_details_sql()),
+    (4, "search indexes", search_indexes_sql()),
+    (5, "catalog version counter", catalog_version_sql()),
+    (6, "import checkpoints", IMPORT_CHECKPOINTS_SQL),
+    (7, "picker indexes", pick_indexes_sql()),
+    (8, "graph link changes", link_changes_sql()),
+    (9, "catalog epoch", CATALOG_EPOCH_SQL),
+    (10, "link change pruning", LINK_CHANGES_PRUNING_SQL),
+)
+
+def migrate_schema(conn):
+    with conn.cursor() as cur:
+        try:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS SchemaVersion (
+                    Version integer PRIMARY KEY,
+                    Description text NOT NULL,
+                    AppliedAt timestamptz NOT NULL DEFAULT now()
+                );
+            """)
+            # Serialize concurrent migrators; the lock is released at commit
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext('SchemaVersion'));")
+            cur.execute("SELECT COALESCE(MAX(Version), 0) FROM SchemaVersion;")
+            current = cur.fetchone()[0]
+
+            pending = [migration for migration in MIGRATIONS if migration[0] > current]
+            for version, description, sql in pending:
+                cur.execute(sql)
+                cur.execute("INSERT INTO SchemaVersion (Version, Description) VALUES (%s, %s);", (version, description))
+                print(f"Applied migration {version}: {description}")
+                current = version
+
+            conn.commit()
+        except psycopg2.Error as e:
+            conn.rollback()
+            print(f"Migration failed, no changes were made: {e}")
+            return 1
+    print(f"Schema is at version {current}.")
+    return 0
+
+def prepare_sql(sql):
+    # Rewrites %(name)s placeholders as $1, $2, ... and returns the parameter order
+    names = []
+    def number(match):
+        if match.group(1) not in names:
+            names.append(match.group(1))
+        return f"${names.index(match.group(1)) + 1}"
+    return re.sub(r"%\((\w+)\)s", number, sql), names
+
+def execute_prepared(cur, name, sql, params):
+    # PREPAREs sql the first time a connection runs it and EXECUTEs it from then
+    # on. Prepared statements outlive rollbacks, so the registry never has to
+    # forget one; plain connections just run sql
+    conn = cur.connection
+    if not PREPARED_STATEMENTS or not isinstance(conn, CatalogConnection):
+        cur.execute(sql, params)
+        return
+    order = conn.prepared.get(name)
+    if order is None:
+        text, order = prepare_sql(sql)
+        cur.execute(f"PREPARE {name} AS {text}")
+        conn.prepared[name] = order
+    cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(order))});", [params[key] for key in order])
+
+def lookup_id(cur, table, id_column, key):
+    cache_key = tuple(key.items())
+    row_id = ID_CACHES[table].get(cache_key, catalog_epoch(cur))
+    if row_id is not None:
+        return row_id
+
+    match = " AND ".join(f"{column} = %({column})s" for column in key)
+    execute_prepared(cur, f"lookup_{table}_{'_'.join(key)}".lower(),
+                     f"SELECT {id_column}, {CREATED_HERE_SQL} FROM {table} "
+                     f"WHERE {match} ORDER BY {id_column} LIMIT 1;", key)
+    row = cur.fetchone()
+    if row is None:
+        return None
+    cache_id(cur, table, cache_key, row[0], row[1])
+    return row[0]
+
+def upsert_id(cur, table, id_column, key, values=None):
+    # Get-or-create in one round trip; key holds the columns of the table's unique
+    # index and values any extra columns to set when the row is created
+    cache_key = tuple(key.items())
+    row_id = ID_CACHES[table].get(cache_key, catalog_epoch(cur))
+    if row_id is not None:
+        return row_id
+
+    columns = {**key, **(values or {})}
+    match = " AND ".join(f"{column} = %({column})s" for column in key)
+    execute_prepared(cur, f"upsert_{table}_{'_'.join(columns)}".lower(), f"""
+        WITH inserted AS (
+            INSERT INTO {table} ({", ".join(columns)})
+            VALUES ({", ".join(f"%({column})s" for column in columns)})
+            ON CONFLICT DO NOTHING
+            RETURNING {id_column}
+        )
+        SELECT {id_column}, true FROM inserted
+        UNION ALL
+        SELECT {id_column}, {CREATED_HERE_SQL} FROM {table} WHERE {match}
+        LIMIT 1;
+    """, columns)
+    row = cur.fetchone()
+    if row is None:
+        # A concurrent writer committed the same key after this statement's snapshot
+        cur.execute(f"SELECT {id_column}, false FROM {table} WHERE {match};", key)
+        row = cur.fetchone()
+    cache_id(cur, table, cache_key, row[0], row[1])
+    return row[0]
+
+# All junction rows of one song in a single statement; links that already exist are kept
+LINK_SONG_SQL = """
+    WITH song_artists AS (
+        INSERT INTO SongArtists (SongID, ArtistID)
+        SELECT %(song_id)s, unnest(%(artist_ids)s::integer[])
+        ON CONFLICT DO NOTHING
+    ), song_albums AS (
+        INSERT INTO SongAlbums (SongID, AlbumID)
+        SELECT %(song_id)s, unnest(%(album_ids)s::integer[])
+        ON CONFLICT DO NOTHING
+    ), album_artists AS (
+        INSERT INTO AlbumArtists (AlbumID, ArtistID)
+        SELECT * FROM unnest(%(pair_album_ids)s::integer[], %(pair_artist_ids)s::integer[])
+        ON CONFLICT DO NOTHING
+    )
+    INSERT INTO SongCategories (SongID, CategoryID)
+    SELECT %(song_id)s, unnest(%(category_ids)s::integer[])
+    ON CONFLICT DO NOTHING;
+"""
+
+def link_song(cur, song_id, artist_ids=(), album_ids=(), category_ids=(), album_artist_ids=()):
+    execute_prepared(cur, "link_song", LINK_SONG_SQL, {
+        "song_id": song_id,
+        "artist_ids": list(artist_ids),
+        "album_ids": list(album_ids),
+        "category_ids": list(category_ids),
+        "pair_album_ids": [album_id for album_id, _ in album_artist_ids],
+        "pair_artist_ids": [artist_id for _, artist_id in album_artist_ids],
+    })
+
+class CatalogError(Exception):
+    # A request the catalog rules reject, such as a duplicate or unknown name
+    pass
+
+def apply(conn, operation, *args, **kwargs):
+    # Runs one core operation in its own transaction and reports failures;
+    # returns the operation's result, or None when it was canceled
+    try:
+        with conn.cursor() as cur:
+            result = operation(cur, *args, **kwargs)
+        conn.commit()
+        return result
+    except CatalogError as e:
+        conn.rollback()
+        print(f"{e} Operation canceled.")
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"An error occurred: {e}. Operation canceled.")
+
+# Name hints before free-form prompts only help someone typing at a terminal
+NAME_HINTS = sys.stdin.isatty()
+
+def show_existing(conn, label, kind):
+    # One picker page of names, never the whole table
+    if NAME_HINTS:
+        with conn.cursor() as cur:
+            names = [name for name, _ in pick_page(cur, kind)]
+        more = ", ..." if len(names) == PICK_PAGE_SIZE else ""
+        print(f"Existing {label}: {', '.join(names) or 'none'}{more}")
+
+def require(names, message, empty_message=None):
+    # Rejects a missing list of names, or one with blank entries
+    if not names:
+        raise CatalogError(message)
+    if not all(names):
+        raise CatalogError(empty_message or message)
+
+def resolve_albums(cur, album_titles, album_years=None, values=None):
+    # Existing albums are matched by title; missing ones are created from the
+    # year given in album_years. Returns the album IDs and the newly created ones
+    album_ids = []
+    new_album_ids = []
+    for album_title in album_titles:
+        album_id = lookup_id(cur, "Albums", "AlbumID", {"Title": album_title})
+        if album_id is None:
+            year = (album_years or {}).get(album_title)
+            if year is None:
+                raise CatalogError(f"Album '{album_title}' does not exist and no release year was given.")
+            album_id = upsert_id(cur, "Albums", "AlbumID", {"Title": album_title, "Year": year}, values)
+            new_album_ids.append(album_id)
+        album_ids.append(album_id)
+    return album_ids, new_album_ids
+
+def resolve_categories(cur, category_names):
+    return [upsert_id(cur, "Categories", "CategoryID", {"Name": category_name}) for category_name in category_names]
+
+def add_artist(cur, name, songs, album_years=None):
+    # songs is a list of (song title, album titles, category names)
+    require([name], "Artist name cannot be empty.")
+    require(songs, "An artist must have at least one song.")
+
+    # Create the artist unless one with this name exists
+    cur.execute("INSERT INTO Artists (Name) VALUES (%s) ON CONFLICT DO NOTHING RETURNING ArtistID;", (name,))
+    artist = cur.fetchone()
+    if not artist:
+        raise CatalogError("Artist already exists.")
+    artist_id = artist[0]
+
+    for song_title, album_titles, category_names in songs:
+        require([song_title], "Song title cannot be empty.")
+        require(album_titles, "Each song must belong to at least one album.", "Album title cannot be empty.")
+        require(category_names, "Each song must have at least one category.", "Category name cannot be empty.")
+
+        # New albums are created for the artist; every album gets the artist linked
+        album_ids, _ = resolve_albums(cur, album_titles, album_years, {"ArtistID": artist_id})
+        category_ids = resolve_categories(cur, category_names)
+        song_id = upsert_id(cur, "Songs", "SongID", {"Title": song_title})
+        link_song(cur, song_id, [artist_id], album_ids, category_ids,
+                  [(album_id, artist_id) for album_id in album_ids])
+    return artist_id
+
+def add_album(cur, title, year, artist_names, songs):
+    # songs is a list of (song title, category names)
+    require([title], "Album title cannot be empty.")
+    require(artist_names, "You must enter at least one artist name.", "Artist name cannot be empty.")
+    require(songs, "You must enter at least one song title.")
+    song_titles = [song_title for song_title, _ in songs]
+    if len(set(song_titles)) != len(song_titles):
+        raise CatalogError("Duplicate song titles found.")
+
+    # Create the album unless it already exists
+    cur.execute("INSERT INTO Albums (Title, Year) VALUES (%s, %s) ON CONFLICT DO NOTHING RETURNING AlbumID;",
+                (title, year))
+    album = cur.fetchone()
+    if not album:
+        raise CatalogError(f"Album '{title}' from year {year} already exists. No duplicates are allowed.")
+    album_id = album[0]
+
+    # Resolve every artist linked to this album, creating missing ones
+    artist_ids = [upsert_id(cur, "Artists", "ArtistID", {"Name": artist_name}) for artist_name in artist_names]
+    album_artist_ids = [(album_id, artist_id) for artist_id in artist_ids]
+
+    # Link each song with the album, its artists and categories
+    for song_title, category_names in songs:
+        require([song_title], "Song title cannot be empty.")
+        song_id = upsert_id(cur, "Songs", "SongID", {"Title": song_title})
+        link_song(cur, song_id, artist_ids, [album_id], resolve_categories(cur, category_names), album_artist_ids)
+        album_artist_ids = ()
+    return album_id
+
+def add_category(cur, name):
+    require([name], "Category name cannot be empty.")
+    # Create the category unless it already exists
+    cur.execute("INSERT INTO Categories (Name) VALUES (%s) ON CONFLICT DO NOTHING RETURNING CategoryID;", (name,))
+    category = cur.fetchone()
+    if not category:
+        raise CatalogError("Category already exists.")
+    return category[0]
+
+def add_song(cur, title, artist_names, album_titles, category_names, album_years=None):
+    require([title], "Song title cannot be empty.")
+    require(artist_names, "Each song must have at least one artist.", "Artist name cannot be empty.")
+    require(album_titles, "Each song must belong to at least one album.", "Album title cannot be empty.")
+    require(category_names, "Each song must have at least one category.", "Category name cannot be empty.")
+    if lookup_id(cur, "Songs", "SongID", {"Title": title}) is not None:
+        raise CatalogError("Song already exists.")
+
+    artist_ids = [upsert_id(cur, "Artists", "ArtistID", {"Name": artist_name}) for artist_name in artist_names]
+    # New albums are credited to the song's artists
+    album_ids, new_album_ids = resolve_albums(cur, album_titles, album_years)
+    category_ids = resolve_categories(cur, category_names)
+
+    # Create the song and write all of its links at once
+    song_id = upsert_id(cur, "Songs", "SongID", {"Title": title})
+    link_song(cur, song_id, artist_ids, album_ids, category_ids,
+              [(album_id, artist_id) for album_id in new_album_ids for artist_id in artist_ids])
+    return song_id
+
+def split_input(text):
+    # Comma-separated prompt answers; empty entries are kept so callers can reject them
+    return [name.strip() for name in text.split(',')] if text.strip() else []
+
+def prompt_year(album_title):
+    while True:
+        year = input(f"Enter the year the album '{album_title}' was released: ").strip()
+        if year.isdigit():
+            return int(year)
+        print("Invalid year. Please enter a numeric year.")
+
+def prompt_new_album_years(cur, album_titles, album_years):
+    # Asks once for the release year of each album that does not exist yet
+    for album_title in album_titles:
+        if album_title and album_title not in album_years \
+                and lookup_id(cur, "Albums", "AlbumID", {"Title": album_title}) is None:
+            album_years[album_title] = prompt_year(album_title)
 
 def create_artist(conn):
     name = input("Enter artist name: ")
@@ -20,116 +1292,43 @@ def create_artist(conn):
         return
 
     with conn.cursor() as cur:
-        cur.execute("SELECT ArtistID FROM Artists WHERE Name = %s;", (name,))
-        artist = cur.fetchone()
-        if artist:
+        if lookup_id(cur, "Artists", "ArtistID", {"Name": name}) is not None:
             print("Artist already exists.")
             return
 
-        # Create the artist
-        cur.execute("INSERT INTO Artists (Name) VALUES (%s) RETURNING ArtistID;", (name,))
-        artist_id = cur.fetchone()[0]
-
         # Prompt for songs
-        print("Existing songs:")
-        list_songs(conn)
-        song_titles = input("Enter song titles separated by commas for the new artist: ").strip()
-        if not song_titles or not any(song.strip() for song in song_titles.split(',')):
+        show_existing(conn, "songs", "song")
+        song_titles = split_input(input("Enter song titles separated by commas for the new artist: "))
+        if not any(song_titles):
             print("An artist must have at least one song. Operation canceled.")
-            conn.rollback()
             return
 
-        for song_title in song_titles.split(','):
-            song_title = song_title.strip()
+        songs = []
+        album_years = {}
+        show_existing(conn, "albums", "album")
+        show_existing(conn, "categories", "category")
+        for song_title in song_titles:
             if not song_title:
                 print("Song title cannot be empty. Operation canceled.")
-                conn.rollback()
                 return
 
             # Prompt for albums
-            print("Existing albums:")
-            list_albums(conn)
-            album_titles = input(f"Enter album titles separated by commas for the song '{song_title}': ").strip()
-            if not album_titles or not any(album.strip() for album in album_titles.split(',')):
+            album_titles = split_input(input(f"Enter album titles separated by commas for the song '{song_title}': "))
+            if not any(album_titles):
                 print("Each song must belong to at least one album. Operation canceled.")
-                conn.rollback()
                 return
 
             # Prompt for categories
-            print("Existing categories:")
-            list_categories(conn)
-            categories = input(f"Enter category names separated by commas for the song '{song_title}': ").strip()
-            if not categories or not any(category.strip() for category in categories.split(',')):
+            category_names = split_input(input(f"Enter category names separated by commas for the song '{song_title}': "))
+            if not any(category_names):
                 print("Each song must have at least one category. Operation canceled.")
-                conn.rollback()
                 return
 
-            # Process each album mentioned for the song
-            for album_title in album_titles.split(','):
-                album_title = album_title.strip()
-                if not album_title:
-                    print("Album title cannot be empty. Operation canceled.")
-                    conn.rollback()
-                    return
-
-                # Validate and insert album
-                cur.execute("SELECT AlbumID FROM Albums WHERE Title = %s;", (album_title,))
-                album = cur.fetchone()
-
-                if not album:
-                    while True:
-                        year = input(f"Enter the year the album '{album_title}' was released: ").strip()
-                        if not year.isdigit():
-                            print("Invalid year. Please enter a numeric year.")
-                        else:
-                            year = int(year)
-                            break
-                    # Create the album and link it to the artist
-                    cur.execute("INSERT INTO Albums (Title, Year, ArtistID) VALUES (%s, %s, %s) RETURNING AlbumID;", (album_title, year, artist_id))
-                    album_id = cur.fetchone()[0]
-                else:
-                    album_id = album[0]
-
-                # Validate and insert song
-                cur.execute("SELECT SongID FROM Songs WHERE Title = %s;", (song_title,))
-                song = cur.fetchone()
-                if not song:
-                    cur.execute("INSERT INTO Songs (Title) VALUES (%s) RETURNING SongID;", (song_title,))
-                    song_id = cur.fetchone()[0]
-                else:
-                    song_id = song[0]
-
-                # Handle links
-                cur.execute("SELECT * FROM SongArtists WHERE SongID = %s AND ArtistID = %s;", (song_id, artist_id))
-                if not cur.fetchone():
-                    cur.execute("INSERT INTO SongArtists (SongID, ArtistID) VALUES (%s, %s);", (song_id, artist_id))
-                cur.execute("SELECT 1 FROM SongAlbums WHERE SongID = %s AND AlbumID = %s;", (song_id, album_id))
-                if not cur.fetchone():
-                    cur.execute("INSERT INTO SongAlbums (SongID, AlbumID) VALUES (%s, %s);", (song_id, album_id))
-                cur.execute("SELECT * FROM AlbumArtists WHERE AlbumID = %s AND ArtistID = %s;", (album_id, artist_id))
-                if not cur.fetchone():
-                    cur.execute("INSERT INTO AlbumArtists (AlbumID, ArtistID) VALUES (%s, %s);", (album_id, artist_id))
-
-                # Process categories
-                for category in categories:
-                    category = category.strip()
-                    if not category:
-                        print("Category name cannot be empty. Operation canceled.")
-                        conn.rollback()
-                        return
-                    cur.execute("SELECT CategoryID FROM Categories WHERE Name = %s;", (category,))
-                    category_record = cur.fetchone()
-                    if not category_record:
-                        cur.execute("INSERT INTO Categories (Name) VALUES (%s) RETURNING CategoryID;", (category,))
-                        category_id = cur.fetchone()[0]
-                    else:
-                        category_id = category_record[0]
-                    cur.execute("SELECT * FROM SongCategories WHERE SongID = %s AND CategoryID = %s;",
-                                (song_id, category_id))
-                    if not cur.fetchone():
-                        cur.execute("INSERT INTO SongCategories (SongID, CategoryID) VALUES (%s, %s);", (song_id, category_id))
+            prompt_new_album_years(cur, album_titles, album_years)
+            songs.append((song_title, album_titles, category_names))
 
-        conn.commit()
+    if apply(conn, add_artist, name, songs, album_years) is not None:
+        print(f"Artist '{name}' created successfully.")
 
 def create_album(conn):
     # Input album title and validate
@@ -148,124 +1347,42 @@ def create_album(conn):
             print("Invalid input. Please enter a valid year (integer).")
 
     # Input artist names and validate
+    show_existing(conn, "artists", "artist")
     while True:
-        print("Existing artists:")
-        list_artists(conn)
-        artist_names = input("Enter the artist names separated by commas for the album: ").strip()
+        artist_names = [name for name in split_input(input("Enter the artist names separated by commas for the album: ")) if name]
         if artist_names:
-            artist_names = [name.strip() for name in artist_names.split(',') if name.strip()]
-            if artist_names:
-                break
+            break
         print("You must enter at least one artist name. Please try again.")
 
     # Input song titles and validate
+    show_existing(conn, "songs", "song")
     while True:
-        print("Existing songs:")
-        list_songs(conn)
-        song_titles = input("Enter song titles separated by commas for this album: ").strip()
+        song_titles = [song for song in split_input(input("Enter song titles separated by commas for this album: ")) if song]
+        # Check for duplicate song titles
+        if len(set(song_titles)) != len(song_titles):
+            print("Duplicate song titles found. Please provide unique song titles.")
+            continue
         if song_titles:
-            song_titles = [title.strip() for title in song_titles.split(',') if title.strip()]
-            # Check for duplicate song titles
-            if len(set(song_titles)) != len(song_titles):
-                print("Duplicate song titles found. Please provide unique song titles.")
-                continue
-            if song_titles:
-                break
+            break
         print("You must enter at least one song title. Please try again.")
 
-    with conn.cursor() as cur:
-        try:
-            # Check if the album already exists
-            cur.execute("SELECT AlbumID FROM Albums WHERE Title = %s AND Year = %s;", (title, year))
-            album = cur.fetchone()
-            if album:
-                print(f"Album '{title}' from year {year} already exists. No duplicates are allowed.")
-                return
-
-            # Create the album if it does not exist
-            cur.execute("INSERT INTO Albums (Title, Year) VALUES (%s, %s) RETURNING AlbumID;", (title, year))
-            album_id = cur.fetchone()[0]
-
-            # Process each artist linked to this album
-            for artist_name in artist_names:
-                cur.execute("SELECT ArtistID FROM Artists WHERE Name = %s;", (artist_name,))
-                artist = cur.fetchone()
-                if not artist:
-                    # Create the artist if they do not exist
-                    cur.execute("INSERT INTO Artists (Name) VALUES (%s) RETURNING ArtistID;", (artist_name,))
-                    artist_id = cur.fetchone()[0]
-                else:
-                    artist_id = artist[0]
-
-                # Link the album with the artist
-                cur.execute("INSERT INTO AlbumArtists (AlbumID, ArtistID) VALUES (%s, %s) ON CONFLICT DO NOTHING;", (album_id, artist_id))
-
-            # Process each song linked to this album
-            for song_title in song_titles:
-                print("Existing categories:")
-                list_categories(conn)
-                category_names = input(f"Enter category names separated by commas for the song '{song_title}': ").strip()
-                category_names = [name.strip() for name in category_names.split(',') if name.strip()]
-
-                # Check if the song already exists and link or create it
-                cur.execute("SELECT SongID FROM Songs WHERE Title = %s;", (song_title,))
-                song = cur.fetchone()
-                if not song:
-                    cur.execute("INSERT INTO Songs (Title) VALUES (%s) RETURNING SongID;", (song_title,))
-                    song_id = cur.fetchone()[0]
-                else:
-                    song_id = song[0]
-
-                # Link the song with the album
-                cur.execute("INSERT INTO SongAlbums (SongID, AlbumID) VALUES (%s, %s) ON CONFLICT DO NOTHING;", (song_id, album_id))
-
-                # Link the song with each artist mentioned for the album
-                for artist_name in artist_names:
-                    cur.execute("SELECT ArtistID FROM Artists WHERE Name = %s;", (artist_name,))
-                    artist_id = cur.fetchone()[0]
-                    cur.execute("INSERT INTO SongArtists (SongID, ArtistID) VALUES (%s, %s) ON CONFLICT DO NOTHING;", (song_id, artist_id))
-
-                # Handle and link categories to the song
-                for category_name in category_names:
-                    cur.execute("SELECT CategoryID FROM Categories WHERE Name = %s;", (category_name,))
-                    category = cur.fetchone()
-                    if not category:
-                        cur.execute("INSERT INTO Categories (Name) VALUES (%s) RETURNING CategoryID;", (category_name,))
-                        category_id = cur.fetchone()[0]
-                    else:
-                        category_id = category[0]
-
-                    # Link the song with the category
-                    cur.execute("INSERT INTO SongCategories (SongID, CategoryID) VALUES (%s, %s) ON CONFLICT DO NOTHING;", (song_id, category_id))
+    songs = []
+    show_existing(conn, "categories", "category")
+    for song_title in song_titles:
+        category_names = split_input(input(f"Enter category names separated by commas for the song '{song_title}': "))
+        songs.append((song_title, [name for name in category_names if name]))
 
-            conn.commit()
-            print(f"Album '{title}' linked with artists: {', '.join(artist_names)} and songs: {', '.join(song_titles)}.")
+    if apply(conn, add_album, title, year, artist_names, songs) is not None:
+        print(f"Album '{title}' linked with artists: {', '.join(artist_names)} and songs: {', '.join(song_titles)}.")
 
-        except Exception as e:
-            conn.rollback()
-            print(f"An error occurred while creating the album: {e}")
 def create_category(conn):
     name = input("Enter category name: ").strip()
     if not name:
         print("Category name cannot be empty. Operation canceled.")
         return
 
-    with conn.cursor() as cur:
-        cur.execute("SELECT CategoryID FROM Categories WHERE Name = %s;", (name,))
-        category = cur.fetchone()
-        if category:
-            print("Category already exists. Operation canceled.")
-            return
-
-        try:
-            # Create the category
-            cur.execute("INSERT INTO Categories (Name) VALUES (%s) RETURNING CategoryID;", (name,))
-            category_id = cur.fetchone()[0]
-            conn.commit()
-            print(f"Category '{name}' created successfully.")
-        except Exception as e:
-            conn.rollback()
-            print(f"An error occurred: {e}. Operation canceled.")
+    if apply(conn, add_category, name) is not None:
+        print(f"Category '{name}' created successfully.")
 
 def create_song(conn):
     title = input("Enter song title: ")
@@ -274,895 +1391,2874 @@ def create_song(conn):
         return
 
     with conn.cursor() as cur:
-        cur.execute("SELECT SongID FROM Songs WHERE Title = %s;", (title,))
-        song = cur.fetchone()
-        if song:
+        if lookup_id(cur, "Songs", "SongID", {"Title": title}) is not None:
             print("Song already exists. Operation canceled.")
             return
 
-        try:
-            print("Existing artists:")
-            list_artists(conn)
-            artist_names = input("Enter the artist names separated by commas for the song: ").strip()
-            if not artist_names or not any(artist.strip() for artist in artist_names.split(',')):
-                print("Each song must have at least one artist. Operation canceled.")
-                conn.rollback()
-                return
-
-            print("Existing albums:")
-            list_albums(conn)
-            album_titles = input("Enter the album titles separated by commas this song belongs to: ").strip()
-            if not album_titles or not any(album.strip() for album in album_titles.split(',')):
-                print("Each song must belong to at least one album. Operation canceled.")
-                conn.rollback()
-                return
-
-            print("Existing categories:")
-            list_categories(conn)
-            category_names = input("Enter category names separated by commas for the song: ").strip()
-            if not category_names or not any(category.strip() for category in category_names.split(',')):
-                print("Each song must have at least one category. Operation canceled.")
-                conn.rollback()
-                return
-
-            # Create the song
-            cur.execute("INSERT INTO Songs (Title) VALUES (%s) RETURNING SongID;", (title,))
-            song_id = cur.fetchone()[0]
+        show_existing(conn, "artists", "artist")
+        artist_names = split_input(input("Enter the artist names separated by commas for the song: "))
+        if not any(artist_names):
+            print("Each song must have at least one artist. Operation canceled.")
+            return
 
-            # Link artists
-            for artist_name in artist_names.split(','):
-                artist_name = artist_name.strip()
-                if not artist_name:
-                    print("Artist name cannot be empty. Operation canceled.")
-                    conn.rollback()
-                    return
+        show_existing(conn, "albums", "album")
+        album_titles = split_input(input("Enter the album titles separated by commas this song belongs to: "))
+        if not any(album_titles):
+            print("Each song must belong to at least one album. Operation canceled.")
+            return
 
-                cur.execute("SELECT ArtistID FROM Artists WHERE Name = %s;", (artist_name,))
-                artist = cur.fetchone()
-                if not artist:
-                    cur.execute("INSERT INTO Artists (Name) VALUES (%s) RETURNING ArtistID;", (artist_name,))
-                    artist_id = cur.fetchone()[0]
-                else:
-                    artist_id = artist[0]
+        show_existing(conn, "categories", "category")
+        category_names = split_input(input("Enter category names separated by commas for the song: "))
+        if not any(category_names):
+            print("Each song must have at least one category. Operation canceled.")
+            return
 
-                cur.execute("INSERT INTO SongArtists (SongID, ArtistID) VALUES (%s, %s);", (song_id, artist_id))
+        album_years = {}
+        prompt_new_album_years(cur, album_titles, album_years)
 
-            # Link albums
-            for album_title in album_titles.split(','):
-                album_title = album_title.strip()
-                if not album_title:
-                    print("Album title cannot be empty. Operation canceled.")
-                    conn.rollback()
-                    return
+    if apply(conn, add_song, title, artist_names, album_titles, category_names, album_years) is not None:
+        print(f"Song '{title}' created successfully.")
 
-                cur.execute("SELECT AlbumID FROM Albums WHERE Title = %s;", (album_title,))
-                album = cur.fetchone()
-                if not album:
-                    while True:
-                        year = input(f"Enter the year the album '{album_title}' was released: ").strip()
-                        if not year.isdigit():
-                            print("Invalid year. Please enter a numeric year.")
-                        else:
-                            year = int(year)
-                            break
-                    cur.execute("INSERT INTO Albums (Title, Year) VALUES (%s, %s) RETURNING AlbumID;", (album_title, year))
-                    album_id = cur.fetchone()[0]
-                    cur.execute("INSERT INTO AlbumArtists (AlbumID, ArtistID) VALUES (%s, %s);", (album_id, artist_id))
-                else:
-                    album_id = album[0]
-
-                cur.execute("INSERT INTO SongAlbums (SongID, AlbumID) VALUES (%s, %s);", (song_id, album_id))
+# Listings are fetched a page at a time (0 streams everything without pausing)
+LIST_PAGE_SIZE = 50
+# Rows transferred per round trip by the server-side cursors
+LIST_ITERSIZE = 2000
 
-            # Link categories
-            for category_name in category_names.split(','):
-                category_name = category_name.strip()
-                if not category_name:
-                    print("Category name cannot be empty. Operation canceled.")
-                    conn.rollback()
-                    return
+_cursor_names = itertools.count(1)
 
-                cur.execute("SELECT CategoryID FROM Categories WHERE Name = %s;", (category_name,))
-                category = cur.fetchone()
-                if not category:
-                    cur.execute("INSERT INTO Categories (Name) VALUES (%s) RETURNING CategoryID;",
-                                (category_name,))
-                    category_id = cur.fetchone()[0]
-                else:
-                    category_id = category[0]
+def stream_rows(conn, query, params=None):
+    # Named cursors keep the result set on the server and fetch it in itersize batches
+    with conn.cursor(name=f"stream_{next(_cursor_names)}") as cur:
+        cur.itersize = LIST_ITERSIZE
+        cur.execute(query, params)
+        yield from cur
 
-                cur.execute("INSERT INTO SongCategories (SongID, CategoryID) VALUES (%s, %s);",
-                            (song_id, category_id))
+def page_rows(conn, query, key_columns, page_size=None):
+    if page_size is None:
+        page_size = LIST_PAGE_SIZE
+    if not page_size:
+        yield from stream_rows(conn, query.format(where="", limit=""))
+        return
 
-            # Commit the transaction
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            print(f"An error occurred: {e}. Operation canceled.")
+    last_key = None
+    while True:
+        sql, params = page_query(query, key_columns, last_key, page_size)
+        rows = 0
+        for row in stream_rows(conn, sql, params):
+            rows += 1
+            last_key = row[:len(key_columns)]
+            yield row
+        if rows < page_size:
+            return
+        if input("-- Press Enter for the next page or 'q' to stop: ").strip().lower() == 'q':
+            return
 
-def list_artists(conn):
-    with conn.cursor() as cur:
-        cur.execute("""
-        SELECT a.Name, array_agg(al.Title) AS Albums
-        FROM Artists a
-        LEFT JOIN AlbumArtists aa ON a.ArtistID = aa.ArtistID
-        LEFT JOIN Albums al ON aa.AlbumID = al.AlbumID
-        GROUP BY a.ArtistID
-        ORDER BY a.Name;
-        """)
-        artists = cur.fetchall()
-        if not artists:
-            print("No artists found.")
-        else:
+def list_artists(conn, page_size=None):
+    found = False
+    for name, _, albums in page_rows(conn, *LISTING_QUERIES["artist"], page_size):
+        if not found:
             print("Artists and their albums:")
-            for name, albums in artists:
-                album_list = ', '.join(filter(None, albums)) if albums[0] is not None else "No albums"
-                print(f"Artist: {name}, Albums: {album_list}")
-
-def list_albums(conn):
-    with conn.cursor() as cur:
-        cur.execute("""
-        SELECT al.Title, al.Year, array_agg(DISTINCT a.Name) AS Artists, array_agg(DISTINCT s.Title) AS Songs
-        FROM Albums al
-        LEFT JOIN AlbumArtists aa ON al.AlbumID = aa.AlbumID
-        LEFT JOIN Artists a ON aa.ArtistID = a.ArtistID
-        LEFT JOIN SongAlbums sa ON al.AlbumID = sa.AlbumID
-        LEFT JOIN Songs s ON sa.SongID = s.SongID
-        GROUP BY al.AlbumID
-        ORDER BY al.Title;
-        """)
-        albums = cur.fetchall()
-        if not albums:
-            print("No albums found.")
-        else:
+            found = True
+        album_list = ', '.join(filter(None, albums)) if albums else "No albums"
+        print(f"Artist: {name}, Albums: {album_list}")
+    if not found:
+        print("No artists found.")
+
+def list_albums(conn, page_size=None):
+    found = False
+    for title, _, year, artists, songs in page_rows(conn, *LISTING_QUERIES["album"], page_size):
+        if not found:
             print("Albums and their details:")
-            for title, year, artists, songs in albums:
-                artist_list = ', '.join(filter(None, artists)) if artists[0] is not None else "No artists"
-                song_list = ', '.join(filter(None, songs)) if songs[0] is not None else "No songs"
-                print(f"Album: {title}, Year: {year}, Artists: {artist_list}, Songs: {song_list}")
-
-def list_categories(conn):
-    with conn.cursor() as cur:
-        cur.execute("""
-        SELECT c.Name, array_agg(s.Title) AS Songs
-        FROM Categories c
-        LEFT JOIN SongCategories sc ON c.CategoryID = sc.CategoryID
-        LEFT JOIN Songs s ON sc.SongID = s.SongID
-        GROUP BY c.CategoryID
-        ORDER BY c.Name;
-        """)
-        categories = cur.fetchall()
-        if not categories:
-            print("No categories found.")
-        else:
+            found = True
+        artist_list = ', '.join(filter(None, artists)) if artists else "No artists"
+        song_list = ', '.join(filter(None, songs)) if songs else "No songs"
+        print(f"Album: {title}, Year: {year}, Artists: {artist_list}, Songs: {song_list}")
+    if not found:
+        print("No albums found.")
+
+def list_categories(conn, page_size=None):
+    found = False
+    for name, _, songs in page_rows(conn, *LISTING_QUERIES["category"], page_size):
+        if not found:
             print("Categories and their songs:")
-            for name, songs in categories:
-                if songs[0] is not None:
-                    print(f"Category: {name}, Songs: {', '.join(songs)}")
-                else:
-                    print(f"Category: {name}, Songs: None")
-
-def list_songs(conn):
-    with conn.cursor() as cur:
-        cur.execute("""
-        SELECT s.Title, array_agg(DISTINCT al.Title) AS Albums, array_agg(DISTINCT art.Name) AS Artists, array_agg(DISTINCT c.Name) AS Categories
-        FROM Songs s
-        LEFT JOIN SongAlbums sa ON s.SongID = sa.SongID
-        LEFT JOIN Albums al ON sa.AlbumID = al.AlbumID
-        LEFT JOIN SongArtists saa ON s.SongID = saa.SongID
-        LEFT JOIN Artists art ON saa.ArtistID = art.ArtistID
-        LEFT JOIN SongCategories sc ON s.SongID = sc.SongID
-        LEFT JOIN Categories c ON sc.CategoryID = c.CategoryID
-        GROUP BY s.SongID
-        ORDER BY s.Title;
-        """)
-        songs = cur.fetchall()
-        if not songs:
-            print("No songs found.")
+            found = True
+        if songs:
+            print(f"Category: {name}, Songs: {', '.join(songs)}")
         else:
+            print(f"Category: {name}, Songs: None")
+    if not found:
+        print("No categories found.")
+
+def list_songs(conn, page_size=None):
+    found = False
+    for title, _, albums, artists, categories in page_rows(conn, *LISTING_QUERIES["song"], page_size):
+        if not found:
             print("Songs and their details:")
-            for title, albums, artists, categories in songs:
-                album_list = ', '.join(filter(None, set(albums)))  # Remove None and duplicates
-                artist_list = ', '.join(filter(None, set(artists)))  # Remove None and duplicates
-                category_list = ', '.join(filter(None, set(categories)))  # Remove None and duplicates
-                print(f"Song: {title}, Albums: {album_list}, Artists: {artist_list}, Categories: {category_list}")
-
-def delete_artist(conn):
+            found = True
+        album_list = ', '.join(filter(None, albums))
+        artist_list = ', '.join(filter(None, artists))
+        category_list = ', '.join(filter(None, categories))
+        print(f"Song: {title}, Albums: {album_list}, Artists: {artist_list}, Categories: {category_list}")
+    if not found:
+        print("No songs found.")
+
+# Field names of the listing rows in JSON and exported files
+LISTING_FIELDS = {
+    "artist": ("name", "id", "albums"),
+    "album": ("title", "id", "year", "artists", "songs"),
+    "category": ("name", "id", "songs"),
+    "song": ("title", "id", "albums", "artists", "categories"),
+}
+
+# Ranked matches per search; exact names score 3, prefixes 2, full-text word
+# matches 1 to 2 and fuzzy trigram matches below 1
+SEARCH_LIMIT = 10
+SEARCH_MODES = ("auto", "prefix", "text", "fuzzy")
+# kind -> table, ID column, name column
+SEARCH_KINDS = {
+    "artist": ("Artists", "ArtistID", "Name"),
+    "album": ("Albums", "AlbumID", "Title"),
+    "song": ("Songs", "SongID", "Title"),
+    "category": ("Categories", "CategoryID", "Name"),
+}
+
+_trigram_available = None
+
+def trigram_available(cur):
+    global _trigram_available
+    if _trigram_available is None:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm');")
+        _trigram_available = cur.fetchone()[0]
+    return _trigram_available
+
+def escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def prefix_tsquery(text):
+    # Every word must match the start of a word in the name: 'blue mo' -> blue:* & mo:*
+    words = re.findall(r"\w+", text.lower())
+    return " & ".join(f"{word}:*" for word in words)
+
+def search(cur, text, kinds=None, mode="auto", limit=None):
+    # Returns up to limit (kind, id, name, score) matches, best first
+    text = text.strip()
+    if not text:
+        return []
+    if mode not in SEARCH_MODES:
+        raise CatalogError(f"Unknown search mode '{mode}'.")
+    limit = limit or SEARCH_LIMIT
+    params = {"text": text, "prefix": escape_like(text.lower()) + "%", "tsquery": prefix_tsquery(text),
+              "limit": limit}
+
+    conditions = []
+    scores = ["CASE WHEN lower({name}) = lower(%(text)s) THEN 3 ELSE 0 END"]
+    if mode in ("auto", "prefix"):
+        conditions.append("lower({name}) LIKE %(prefix)s")
+        scores.append("CASE WHEN lower({name}) LIKE %(prefix)s THEN 2 ELSE 0 END")
+    if mode in ("auto", "text") and params["tsquery"]:
+        conditions.append("to_tsvector('simple', {name}) @@ to_tsquery('simple', %(tsquery)s)")
+        scores.append("CASE WHEN to_tsvector('simple', {name}) @@ to_tsquery('simple', %(tsquery)s) "
+                      "THEN 1 + ts_rank(to_tsvector('simple', {name}), to_tsquery('simple', %(tsquery)s)) ELSE 0 END")
+    if mode == "fuzzy" or (mode == "auto" and trigram_available(cur)):
+        if not trigram_available(cur):
+            raise CatalogError("Fuzzy search needs the pg_trgm extension.")
+        conditions.append("{name} %% %(text)s")
+        scores.append("similarity({name}, %(text)s)")
+    if not conditions:
+        return []
+
+    subqueries = []
+    for kind in kinds or SEARCH_KINDS:
+        table, id_column, name = SEARCH_KINDS[kind]
+        score = f"GREATEST({', '.join(scores)})".format(name=name)
+        subqueries.append(f"""
+            (SELECT '{kind}', {id_column}, {name}, {score} AS score
+             FROM {table}
+             WHERE {' OR '.join(conditions).format(name=name)}
+             ORDER BY score DESC, {name}
+             LIMIT %(limit)s)""")
+    # Starting parallel workers costs more than these index lookups take, and
+    # prefix tsqueries are estimated far too high; LOCAL ends with the transaction
+    cur.execute(f"""
+        SET LOCAL max_parallel_workers_per_gather = 0;
+        SELECT * FROM ({" UNION ALL ".join(subqueries)}
+        ) matches
+        ORDER BY score DESC, 3
+        LIMIT %(limit)s;
+    """, params)
+    return cur.fetchall()
+
+def song_summaries(cur, song_ids):
+    cur.execute("SELECT SongID, Artists, Albums, Categories FROM SongDetails WHERE SongID = ANY(%s);", (list(song_ids),))
+    return {song_id: f" | Artists: {', '.join(artists) or 'No Artists'} | Albums: {', '.join(albums) or 'No Albums'}"
+                     f" | Categories: {', '.join(categories) or 'No Categories'}"
+            for song_id, artists, albums, categories in cur.fetchall()}
+
+def choose(conn, kind, text):
+    # Resolves what the user typed to an exact name: exact names are taken as
+    # they are, anything else is searched and the user picks from the matches
+    table, id_column, name = SEARCH_KINDS[kind]
     with conn.cursor() as cur:
-        # List existing artists
-        list_artists(conn)
-        artist_name = input("Enter the name of the artist to delete: ")
-
-        # Check if the artist exists
-        cur.execute("SELECT ArtistID FROM Artists WHERE Name = %s;", (artist_name,))
-        artist = cur.fetchone()
-        if not artist:
-            print("Artist not found.")
-            return
-
-        artist_id = artist[0]
-
-        print(f"WARNING: Deleting artist '{artist_name}' will also delete their exclusive albums and songs.")
-        confirm = input("Do you want to proceed? (yes/no): ")
-        if confirm.lower() != "yes":
-            print("Deletion canceled.")
+        if lookup_id(cur, table, id_column, {name: text}) is not None:
+            return text
+        matches = search(cur, text, [kind])
+        details = song_summaries(cur, [match[1] for match in matches]) if kind == "song" and matches else {}
+    if not matches:
+        return None
+
+    print(f"No {kind} is named '{text}'. Did you mean:")
+    for number, (_, row_id, match_name, _) in enumerate(matches, 1):
+        print(f"{number}. {match_name}{details.get(row_id, '')}")
+    choice = input("Enter the number of your choice, or press Enter to cancel: ").strip()
+    if choice.isdigit() and 1 <= int(choice) <= len(matches):
+        return matches[int(choice) - 1][2]
+    return None
+
+# Pickers show a page of names at a time; the keyset of the last row shown
+# bounds the next page, so a prompt costs the same on any catalog size
+PICK_PAGE_SIZE = 20
+
+def pick_page(cur, kind, prefix="", last_key=("", 0), page_size=None):
+    # Names starting with prefix (any case) after last_key, in picker order;
+    # returns (name, sort key) pairs
+    table, id_column, column = SEARCH_KINDS[kind]
+    sort_name = f'lower({column}) COLLATE "C"'
+    cur.execute(f"""
+        SELECT {column}, {sort_name}, {id_column}
+        FROM {table}
+        WHERE {sort_name} LIKE %s AND ({sort_name}, {id_column}) > (%s, %s)
+        ORDER BY {sort_name}, {id_column}
+        LIMIT %s;
+    """, (escape_like(prefix.lower()) + "%", *last_key, page_size or PICK_PAGE_SIZE))
+    return [(name, (sort_name, row_id)) for name, sort_name, row_id in cur.fetchall()]
+
+def pick(conn, kind, prompt):
+    # Returns the name the user picked, or None when they cancel. They can
+    # enter a number from the page shown, an exact name, or the start of a
+    # name to narrow the list; Enter shows the next page and cancels after the last
+    prefix, last_key = "", ("", 0)
+    table, id_column, column = SEARCH_KINDS[kind]
+    while True:
+        with conn.cursor() as cur:
+            page = pick_page(cur, kind, prefix, last_key)
+        conn.rollback()
+        if not page and not prefix and last_key == ("", 0):
+            return None
+        for number, (name, _) in enumerate(page, 1):
+            print(f"{number}. {name}")
+        more = len(page) == PICK_PAGE_SIZE
+        if more:
+            print("-- Press Enter for more names --")
+        answer = input(f"{prompt}: ").strip()
+
+        if not answer:
+            if not more:
+                return None
+            last_key = page[-1][1]
+            continue
+        if answer.isdigit() and 1 <= int(answer) <= len(page):
+            return page[int(answer) - 1][0]
+        with conn.cursor() as cur:
+            exists = lookup_id(cur, table, id_column, {column: answer}) is not None
+            narrowed = not exists and pick_page(cur, kind, answer, page_size=1)
+        conn.rollback()
+        if exists:
+            return answer
+        if not narrowed:
+            # Nothing starts with it; offer the closest spellings instead
+            return choose(conn, kind, answer)
+        prefix, last_key = answer, ("", 0)
+
+def delete_catalog_rows(cur, song_ids=(), album_ids=(), artist_ids=(), category_ids=()):
+    # Deletes the given rows and every junction row that references them with a
+    # fixed set of statements, children first so foreign keys stay enforced
+    song_ids, album_ids, artist_ids, category_ids = (list(ids) for ids in (song_ids, album_ids, artist_ids, category_ids))
+
+    if song_ids or artist_ids:
+        cur.execute("DELETE FROM SongArtists WHERE SongID = ANY(%s) OR ArtistID = ANY(%s);", (song_ids, artist_ids))
+    if song_ids or category_ids:
+        cur.execute("DELETE FROM SongCategories WHERE SongID = ANY(%s) OR CategoryID = ANY(%s);", (song_ids, category_ids))
+    if song_ids or album_ids:
+        cur.execute("DELETE FROM SongAlbums WHERE SongID = ANY(%s) OR AlbumID = ANY(%s);", (song_ids, album_ids))
+    if album_ids or artist_ids:
+        cur.execute("DELETE FROM AlbumArtists WHERE AlbumID = ANY(%s) OR ArtistID = ANY(%s);", (album_ids, artist_ids))
+    if artist_ids:
+        # Albums.ArtistID records the artist an album was created for
+        cur.execute("UPDATE Albums SET ArtistID = NULL WHERE ArtistID = ANY(%s);", (artist_ids,))
+
+    counts = {}
+    for key, table, column, ids in (("songs", "Songs", "SongID", song_ids),
+                                    ("albums", "Albums", "AlbumID", album_ids),
+                                    ("artists", "Artists", "ArtistID", artist_ids),
+                                    ("categories", "Categories", "CategoryID", category_ids)):
+        if ids:
+            cur.execute(f"DELETE FROM {table} WHERE {column} = ANY(%s);", (ids,))
+            counts[key] = cur.rowcount
+            forget_ids(table, ids)
+        else:
+            counts[key] = 0
+    return counts
+
+def deletion_counts(song_ids=(), album_ids=(), artist_ids=(), category_ids=()):
+    return {"songs": len(song_ids), "albums": len(album_ids), "artists": len(artist_ids), "categories": len(category_ids)}
+
+def describe_counts(counts):
+    return ", ".join(f"{count} {key}" for key, count in counts.items() if count) or "nothing"
+
+# Albums only this artist appears on, and songs that only appear on those albums
+ARTIST_DELETION_SQL = """
+    WITH albums AS (
+        SELECT aa.AlbumID
+        FROM AlbumArtists aa
+        WHERE aa.ArtistID = %(artist_id)s
+        AND NOT EXISTS (
+            SELECT 1 FROM AlbumArtists aa2
+            WHERE aa2.AlbumID = aa.AlbumID AND aa2.ArtistID != %(artist_id)s
+        )
+    ), songs AS (
+        SELECT DISTINCT sa.SongID
+        FROM SongAlbums sa
+        WHERE sa.AlbumID IN (SELECT AlbumID FROM albums)
+        AND NOT EXISTS (
+            SELECT 1 FROM SongAlbums sa2
+            WHERE sa2.SongID = sa.SongID AND sa2.AlbumID NOT IN (SELECT AlbumID FROM albums)
+        )
+    )
+    SELECT ARRAY(SELECT SongID FROM songs), ARRAY(SELECT AlbumID FROM albums);
+"""
+
+def plan_artist_deletion(cur, artist_id):
+    cur.execute(ARTIST_DELETION_SQL, {"artist_id": artist_id})
+    song_ids, album_ids = cur.fetchone()
+    return {"song_ids": song_ids, "album_ids": album_ids, "artist_ids": [artist_id]}
+
+# Songs found on no other album, and artists credited on no other album
+ALBUM_DELETION_SQL = """
+    SELECT
+        ARRAY(SELECT sa.SongID
+              FROM SongAlbums sa
+              WHERE sa.AlbumID = %(album_id)s
+              AND NOT EXISTS (
+                  SELECT 1 FROM SongAlbums sa2
+                  WHERE sa2.SongID = sa.SongID AND sa2.AlbumID != %(album_id)s
+              )),
+        ARRAY(SELECT aa.ArtistID
+              FROM AlbumArtists aa
+              WHERE aa.AlbumID = %(album_id)s
+              AND NOT EXISTS (
+                  SELECT 1 FROM AlbumArtists aa2
+                  WHERE aa2.ArtistID = aa.ArtistID AND aa2.AlbumID != %(album_id)s
+              ));
+"""
+
+def plan_album_deletion(cur, album_id):
+    cur.execute(ALBUM_DELETION_SQL, {"album_id": album_id})
+    song_ids, artist_ids = cur.fetchone()
+    return {"song_ids": song_ids, "album_ids": [album_id], "artist_ids": artist_ids}
+
+# Songs filed under no other category, albums holding only those songs, and
+# artists linked to nothing else. Each step only looks at rows reachable from
+# the category, so the cost follows the size of the category, not the catalog
+CATEGORY_DELETION_SQL = """
+    WITH songs AS (
+        SELECT sc.SongID
+        FROM SongCategories sc
+        WHERE sc.CategoryID = %(category_id)s
+        AND NOT EXISTS (
+            SELECT 1 FROM SongCategories sc2
+            WHERE sc2.SongID = sc.SongID AND sc2.CategoryID != %(category_id)s
+        )
+    ), albums AS (
+        SELECT DISTINCT sa.AlbumID
+        FROM SongAlbums sa
+        WHERE sa.SongID IN (SELECT SongID FROM songs)
+        AND NOT EXISTS (
+            SELECT 1 FROM SongAlbums sa2
+            WHERE sa2.AlbumID = sa.AlbumID AND sa2.SongID NOT IN (SELECT SongID FROM songs)
+        )
+    ), artists AS (
+        SELECT ArtistID FROM SongArtists WHERE SongID IN (SELECT SongID FROM songs)
+        UNION
+        SELECT ArtistID FROM AlbumArtists WHERE AlbumID IN (SELECT AlbumID FROM albums)
+    )
+    SELECT
+        ARRAY(SELECT SongID FROM songs ORDER BY SongID),
+        ARRAY(SELECT AlbumID FROM albums ORDER BY AlbumID),
+        ARRAY(SELECT a.ArtistID
+              FROM artists a
+              WHERE NOT EXISTS (
+                  SELECT 1 FROM SongArtists sa
+                  WHERE sa.ArtistID = a.ArtistID AND sa.SongID NOT IN (SELECT SongID FROM songs)
+              )
+              AND NOT EXISTS (
+                  SELECT 1 FROM AlbumArtists aa
+                  WHERE aa.ArtistID = a.ArtistID AND aa.AlbumID NOT IN (SELECT AlbumID FROM albums)
+              )
+              ORDER BY a.ArtistID);
+"""
+
+def plan_category_deletion(cur, category_id):
+    cur.execute(CATEGORY_DELETION_SQL, {"category_id": category_id})
+    song_ids, album_ids, artist_ids = cur.fetchone()
+    return {"song_ids": song_ids, "album_ids": album_ids, "artist_ids": artist_ids, "category_ids": [category_id]}
+
+# Of the song's albums and artists, the ones no other song is linked to
+SONG_DELETION_SQL = """
+    SELECT
+        ARRAY(SELECT sa.AlbumID
+              FROM SongAlbums sa
+              WHERE sa.SongID = %(song_id)s
+              AND NOT EXISTS (
+                  SELECT 1 FROM SongAlbums sa2
+                  WHERE sa2.AlbumID = sa.AlbumID AND sa2.SongID != %(song_id)s
+              )),
+        ARRAY(SELECT sa.ArtistID
+              FROM SongArtists sa
+              WHERE sa.SongID = %(song_id)s
+              AND NOT EXISTS (
+                  SELECT 1 FROM SongArtists sa2
+                  WHERE sa2.ArtistID = sa.ArtistID AND sa2.SongID != %(song_id)s
+              ));
+"""
+
+def plan_song_deletion(cur, song_id):
+    cur.execute(SONG_DELETION_SQL, {"song_id": song_id})
+    album_ids, artist_ids = cur.fetchone()
+    return {"song_ids": [song_id], "album_ids": album_ids, "artist_ids": artist_ids}
+
+# table, ID column, lookup column, not-found message and deletion planner per entity
+DELETION_PLANS = {
+    "artist": ("Artists", "ArtistID", "Name", "Artist not found.", plan_artist_deletion),
+    "album": ("Albums", "AlbumID", "Title", "Album not found.", plan_album_deletion),
+    "category": ("Categories", "CategoryID", "Name", "Category not found.", plan_category_deletion),
+    "song": ("Songs", "SongID", "Title", "Song not found.", plan_song_deletion),
+}
+
+def plan_deletion(cur, kind, name):
+    table, id_column, key_column, not_found, planner = DELETION_PLANS[kind]
+    row_id = lookup_id(cur, table, id_column, {key_column: name})
+    if row_id is None:
+        raise CatalogError(not_found)
+    return planner(cur, row_id)
+
+def remove(cur, kind, name, dry_run=False):
+    # Deletes the named entity with everything only it kept in the catalog;
+    # returns the number of rows deleted (or that would be) per entity table
+    plan = plan_deletion(cur, kind, name)
+    if dry_run:
+        return deletion_counts(**plan)
+    return delete_catalog_rows(cur, **plan)
+
+def confirm_deletion(conn, kind, name, warning):
+    # Shows what deleting the entity would take with it; returns the plan once confirmed
+    with conn.cursor() as cur:
+        try:
+            plan = plan_deletion(cur, kind, name)
+        except CatalogError as e:
+            print(e)
             return
+        finally:
+            conn.rollback()
+    print(f"{warning} ({describe_counts(deletion_counts(**plan))}).")
+    return plan
 
-        try:
-            # Disable foreign key constraints
-            cur.execute("SET session_replication_role = 'replica';")
+def delete_artist(conn):
+    artist_name = pick(conn, "artist", "Enter the name or number of the artist to delete")
+    if artist_name is None:
+        print("Artist not found.")
+        return
 
-            # Identify and delete albums exclusively linked to this artist
-            cur.execute("""
-                SELECT al.AlbumID
-                FROM Albums al
-                JOIN AlbumArtists aa ON al.AlbumID = aa.AlbumID
-                WHERE aa.ArtistID = %s
-                AND NOT EXISTS (
-                    SELECT 1 FROM AlbumArtists aa2
-                    WHERE aa2.AlbumID = al.AlbumID AND aa2.ArtistID != %s
-                );
-            """, (artist_id, artist_id))
-            albums = cur.fetchall()
-
-            for album in albums:
-                album_id = album[0]
-
-                # Identify and delete songs exclusively linked to this album
-                cur.execute("""
-                    SELECT s.SongID
-                    FROM Songs s
-                    JOIN SongAlbums sa ON s.SongID = sa.SongID
-                    WHERE sa.AlbumID = %s
-                    AND NOT EXISTS (
-                        SELECT 1 FROM SongAlbums sa2
-                        WHERE sa2.SongID = s.SongID AND sa2.AlbumID != %s
-                    );
-                """, (album_id, album_id))
-                songs = cur.fetchall()
-
-                for song in songs:
-                    song_id = song[0]
-                    # Delete references to the song in junction tables
-                    cur.execute("DELETE FROM SongArtists WHERE SongID = %s;", (song_id,))
-                    cur.execute("DELETE FROM SongCategories WHERE SongID = %s;", (song_id,))
-                    cur.execute("DELETE FROM SongAlbums WHERE SongID = %s;", (song_id,))
-                    cur.execute("DELETE FROM Songs WHERE SongID = %s;", (song_id,))
-
-                # Delete references to the album in junction tables
-                cur.execute("DELETE FROM AlbumArtists WHERE AlbumID = %s;", (album_id,))
-                cur.execute("DELETE FROM SongAlbums WHERE AlbumID = %s;", (album_id,))
-                cur.execute("DELETE FROM Albums WHERE AlbumID = %s;", (album_id,))
-
-            # Delete references to the artist in junction tables
-            cur.execute("DELETE FROM AlbumArtists WHERE ArtistID = %s;", (artist_id,))
-            cur.execute("DELETE FROM SongArtists WHERE ArtistID = %s;", (artist_id,))
-
-            # Delete the artist
-            cur.execute("DELETE FROM Artists WHERE ArtistID = %s;", (artist_id,))
-
-            # Commit the transaction
-            conn.commit()
-            print(f"Artist '{artist_name}' and all associated data deleted successfully.")
+    plan = confirm_deletion(conn, "artist", artist_name,
+                            f"WARNING: Deleting artist '{artist_name}' will also delete their exclusive albums and songs")
+    if plan is None:
+        return
+    confirm = input("Do you want to proceed? (yes/no): ")
+    if confirm.lower() != "yes":
+        print("Deletion canceled.")
+        return
 
-        except Exception as e:
-            conn.rollback()
-            print(f"An error occurred: {e}")
-        finally:
-            # Re-enable foreign key constraints
-            cur.execute("SET session_replication_role = 'origin';")
+    counts = apply(conn, remove, "artist", artist_name)
+    if counts is not None:
+        print(f"Artist '{artist_name}' and all associated data deleted successfully.")
+    return counts
 
 def delete_album(conn):
-    cur = conn.cursor()
-    print("Existing albums:")
-    cur.execute("SELECT AlbumID, Title FROM Albums;")
-    for album in cur.fetchall():
-        print(f"- {album[1]}")
-
-    album_title = input("Enter the title of the album to delete: ")
-    cur.execute("SELECT AlbumID FROM Albums WHERE Title = %s;", (album_title,))
-    album = cur.fetchone()
-
-    if not album:
+    album_title = pick(conn, "album", "Enter the title or number of the album to delete")
+    if album_title is None:
         print("Album not found.")
         return
-
-    print("WARNING: Deleting album '{album_title}' will also delete its exclusive artists and songs.")
+    plan = confirm_deletion(conn, "album", album_title,
+                            f"WARNING: Deleting album '{album_title}' will also delete its exclusive artists and songs")
+    if plan is None:
+        return
     confirm = input("Do you want to proceed? (yes/no): ")
     if confirm.lower() != 'yes':
         print("Deletion canceled.")
         return
 
-    cur.execute("BEGIN;")
-
-    try:
-        album_id = album[0]
-
-        # Identify songs that are only linked to this album
-        cur.execute("""
-            SELECT SongID FROM SongAlbums WHERE AlbumID = %s
-        """, (album[0],))
-        song_ids_for_deletion = [song[0] for song in cur.fetchall()]
-
-        # Remove these songs from the SongAlbums table
-        cur.execute("DELETE FROM SongAlbums WHERE AlbumID = %s;", (album[0],))
-
-        # For each song only linked to this deleted album, clear out entries from related tables
-        for song_id in song_ids_for_deletion:
-            cur.execute("SELECT COUNT(*) FROM SongAlbums WHERE SongID = %s;", (song_id,))
-            if cur.fetchone()[0] == 0:
-                cur.execute("DELETE FROM SongArtists WHERE SongID = %s;", (song_id,))
-                cur.execute("DELETE FROM SongCategories WHERE SongID = %s;", (song_id,))
-                cur.execute("DELETE FROM Songs WHERE SongID = %s;", (song_id,))
-
-                # Check for artists exclusively linked to this album and its songs
-            cur.execute("""
-                   SELECT a.ArtistID
-                   FROM Artists a
-                   JOIN AlbumArtists aa ON a.ArtistID = aa.ArtistID
-                   WHERE aa.AlbumID = %s
-                   AND NOT EXISTS (
-                       SELECT 1 FROM AlbumArtists aa2
-                       WHERE aa2.ArtistID = a.ArtistID
-                       AND aa2.AlbumID != %s
-                   )
-               """, (album_id, album_id))
-            artist_ids_for_deletion = [artist[0] for artist in cur.fetchall()]
-
-            # Delete these artists from junction tables and the main table
-            for artist_id in artist_ids_for_deletion:
-                cur.execute("DELETE FROM SongArtists WHERE ArtistID = %s;", (artist_id,))
-                cur.execute("DELETE FROM AlbumArtists WHERE ArtistID = %s;", (artist_id,))
-                cur.execute("DELETE FROM Artists WHERE ArtistID = %s;", (artist_id,))
-
-        # Delete the album
-        cur.execute("DELETE FROM Albums WHERE AlbumID = %s;", (album[0],))
-
-        # Commit the transaction
-        cur.execute("COMMIT;")
+    counts = apply(conn, remove, "album", album_title)
+    if counts is not None:
         print("Album and any exclusive songs and artists successfully deleted.")
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        cur.execute("ROLLBACK;")
-    finally:
-        cur.execute("SET session_replication_role = 'origin';")
+    return counts
 
 def delete_category(conn):
-    cur = conn.cursor()
-    try:
-        cur.execute("SET session_replication_role = replica;")
-
-        # Display existing categories
-        cur.execute("SELECT CategoryID, Name FROM Categories;")
-        categories = cur.fetchall()
-        if not categories:
-            print("No categories found.")
-            return
-
-        print("Existing categories:")
-        for cat in categories:
-            print(f"- {cat[1]}")
-
-        category_name = input("Enter the name of the category to delete: ")
-        cur.execute("SELECT CategoryID FROM Categories WHERE Name = %s;", (category_name,))
-        category = cur.fetchone()
-
-        if not category:
-            print("Category not found.")
-            return
-
-        print(f"WARNING: Deleting category '{category_name}' will also delete songs, albums, and artists related to it.")
-        confirm = input("Do you want to proceed? (yes/no): ")
-        if confirm.lower() != 'yes':
-            print("Deletion canceled.")
-            return
-
-        category_id = category[0]
-
-        # Check songs that only belong to this category
-        cur.execute("""
-            SELECT s.SongID
-            FROM Songs s
-            JOIN SongCategories sc ON s.SongID = sc.SongID
-            WHERE sc.CategoryID = %s
-            AND NOT EXISTS (
-                SELECT 1 FROM SongCategories sc2
-                WHERE sc2.SongID = s.SongID AND sc2.CategoryID != %s
-            );
-        """, (category_id, category_id))
-        songs = cur.fetchall()
-        song_ids = [song[0] for song in songs]
-
-        if song_ids:
-            for song_id in song_ids:
-                cur.execute("SELECT Title FROM Songs WHERE SongID = %s;", (song_id,))
-                song_title = cur.fetchone()[0]
-                print(f"- {song_title}")
-
-            # Delete all references to these songs
-            for song_id in song_ids:
-                # Remove references to the song from other junction tables
-                cur.execute("DELETE FROM SongAlbums WHERE SongID = %s;", (song_id,))
-                cur.execute("DELETE FROM SongArtists WHERE SongID = %s;", (song_id,))
-                cur.execute("DELETE FROM SongCategories WHERE SongID = %s;", (song_id,))
-                # Delete the song itself
-                cur.execute("DELETE FROM Songs WHERE SongID = %s;", (song_id,))
-
-        # Identify albums linked exclusively to these songs
-        if song_ids:
-            cur.execute("""
-                    SELECT al.AlbumID, al.Title
-                    FROM Albums al
-                    LEFT JOIN SongAlbums sa ON al.AlbumID = sa.AlbumID
-                    WHERE NOT EXISTS (
-                        SELECT 1 FROM SongAlbums sa2
-                        WHERE sa2.AlbumID = al.AlbumID AND sa2.SongID NOT IN %s
-                    );
-                """, (tuple(song_ids),))
-            albums_for_deletion = cur.fetchall()
-        else:
-            albums_for_deletion = []
-
-        for album in albums_for_deletion:
-            album_id = album[0]
-            # Delete album references
-            cur.execute("DELETE FROM AlbumArtists WHERE AlbumID = %s;", (album_id,))
-            cur.execute("DELETE FROM SongAlbums WHERE AlbumID = %s;", (album_id,))
-            cur.execute("DELETE FROM Albums WHERE AlbumID = %s;", (album_id,))
-
-        # Identify artists linked exclusively to these albums and songs
-        if song_ids or albums_for_deletion:
-            cur.execute("""
-                    SELECT a.ArtistID, a.Name
-                    FROM Artists a
-                    LEFT JOIN SongArtists sa ON a.ArtistID = sa.ArtistID
-                    LEFT JOIN AlbumArtists aa ON a.ArtistID = aa.ArtistID
-                    WHERE NOT EXISTS (
-                        SELECT 1 FROM SongArtists sa2
-                        WHERE sa2.ArtistID = a.ArtistID AND sa2.SongID NOT IN %s
-                    )
-                    AND NOT EXISTS (
-                        SELECT 1 FROM AlbumArtists aa2
-                        WHERE aa2.ArtistID = a.ArtistID AND aa2.AlbumID NOT IN %s
-                    );
-                """, (tuple(song_ids), tuple([album[0] for album in albums_for_deletion])))
-            artists_for_deletion = cur.fetchall()
-        else:
-            artists_for_deletion = []
+    category_name = pick(conn, "category", "Enter the name or number of the category to delete")
+    if category_name is None:
+        print("Category not found.")
+        return
+    plan = confirm_deletion(conn, "category", category_name,
+                            f"WARNING: Deleting category '{category_name}' will also delete songs, albums, and artists related to it")
+    if plan is None:
+        return
+    with conn.cursor() as cur:
+        cur.execute("SELECT Title FROM Songs WHERE SongID = ANY(%s) ORDER BY Title;", (plan["song_ids"],))
+        for song_title, in cur.fetchall():
+            print(f"- {song_title}")
+    conn.rollback()
 
-        for artist in artists_for_deletion:
-            artist_id = artist[0]
-            # Delete the artist
-            cur.execute("DELETE FROM Artists WHERE ArtistID = %s;", (artist_id,))
+    confirm = input("Do you want to proceed? (yes/no): ")
+    if confirm.lower() != 'yes':
+        print("Deletion canceled.")
+        return
 
-        # Finally, delete the category
-        cur.execute("DELETE FROM Categories WHERE CategoryID = %s;", (category[0],))
-        conn.commit()
+    counts = apply(conn, remove, "category", category_name)
+    if counts is not None:
         print("Category and related songs deleted successfully.")
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        conn.rollback()  # Rollback in case of error
-    finally:
-        cur.execute("SET session_replication_role = DEFAULT;")
+    return counts
 
 def delete_song(conn):
-    with conn.cursor() as cur:
-        # Display existing songs
-        cur.execute("""
-            SELECT s.SongID, s.Title, 
-                   array_agg(DISTINCT a.Name) AS Artists,
-                   array_agg(DISTINCT al.Title) AS Albums,
-                   array_agg(DISTINCT c.Name) AS Categories
-            FROM Songs s
-            LEFT JOIN SongArtists sa ON s.SongID = sa.SongID
-            LEFT JOIN Artists a ON sa.ArtistID = a.ArtistID
-            LEFT JOIN SongAlbums sal ON s.SongID = sal.SongID
-            LEFT JOIN Albums al ON sal.AlbumID = al.AlbumID
-            LEFT JOIN SongCategories sc ON s.SongID = sc.SongID
-            LEFT JOIN Categories c ON sc.CategoryID = c.CategoryID
-            GROUP BY s.SongID
-            ORDER BY s.Title;
-        """)
-        songs = cur.fetchall()
-
-        if not songs:
-            print("No songs found.")
-            return
-
-        print("Existing songs:")
-        for s_row in songs:
-            title = s_row[1]
-            artist_list = ', '.join([art for art in s_row[2] if art]) if s_row[2] and s_row[2][0] is not None else "No Artists"
-            album_list = ', '.join([alb for alb in s_row[3] if alb]) if s_row[3] and s_row[3][0] is not None else "No Albums"
-            category_list = ', '.join([cat for cat in s_row[4] if cat]) if s_row[4] and s_row[4][0] is not None else "No Categories"
-            print(f"- {title} | Artists: {artist_list} | Albums: {album_list} | Categories: {category_list}")
+    song_title = pick(conn, "song", "Enter the title or number of the song to delete")
+    if song_title is None:
+        print("Song not found.")
+        return
+    plan = confirm_deletion(conn, "song", song_title,
+                            f"WARNING: Deleting the song '{song_title}' will remove it from all associated albums, artists, and categories")
+    if plan is None:
+        return
+    print("Additionally, any artists or albums that have no other songs will also be deleted.")
+    confirm = input("Do you want to proceed? (yes/no): ")
+    if confirm.lower() != 'yes':
+        print("Deletion canceled.")
+        return
 
-    song_title = input("Enter the title of the song to delete: ")
+    counts = apply(conn, remove, "song", song_title)
+    if counts is not None:
+        print(f"Song '{song_title}' and any orphaned albums/artists deleted successfully.")
+    return counts
+
+# Albums with no songs and artists credited on no song
+ORPHANS_SQL = """
+    SELECT
+        ARRAY(SELECT al.AlbumID
+              FROM Albums al
+              WHERE NOT EXISTS (SELECT 1 FROM SongAlbums sa WHERE sa.AlbumID = al.AlbumID)),
+        ARRAY(SELECT a.ArtistID
+              FROM Artists a
+              WHERE NOT EXISTS (SELECT 1 FROM SongArtists sa WHERE sa.ArtistID = a.ArtistID));
+"""
+
+def collect_orphans(conn, dry_run=False, confirm=True):
     with conn.cursor() as cur:
-        cur.execute("SELECT SongID FROM Songs WHERE Title = %s;", (song_title,))
-        song = cur.fetchone()
-
-        if not song:
-            print("Song not found.")
-            return
-
-        print(f"WARNING: Deleting the song '{song_title}' will remove it from all associated albums, artists, and categories.")
-        print("Additionally, any artists or albums that have no other songs will also be deleted.")
-        confirm = input("Do you want to proceed? (yes/no): ")
-        if confirm.lower() != 'yes':
-            print("Deletion canceled.")
+        cur.execute(ORPHANS_SQL)
+        album_ids, artist_ids = cur.fetchone()
+        counts = deletion_counts(album_ids=album_ids, artist_ids=artist_ids)
+        if not album_ids and not artist_ids:
+            print("No orphaned albums or artists found.")
+            return counts
+
+        print(f"Found orphaned albums and artists ({describe_counts(counts)}).")
+        if dry_run:
+            print("Dry run: nothing was deleted.")
+            return counts
+        if confirm and input("Do you want to delete them? (yes/no): ").lower() != 'yes':
+            print("Cleanup canceled.")
             return
 
-        song_id = song[0]
-
         try:
-            cur.execute("BEGIN;")
-            cur.execute("SET session_replication_role = 'replica';")
-
-            # Delete references from junction tables for this song
-            cur.execute("DELETE FROM SongArtists WHERE SongID = %s;", (song_id,))
-            cur.execute("DELETE FROM SongCategories WHERE SongID = %s;", (song_id,))
-            cur.execute("DELETE FROM SongAlbums WHERE SongID = %s;", (song_id,))
-
-            # Delete the song itself
-            cur.execute("DELETE FROM Songs WHERE SongID = %s;", (song_id,))
+            counts = delete_catalog_rows(cur, album_ids=album_ids, artist_ids=artist_ids)
+            conn.commit()
+            print("Orphaned albums and artists deleted successfully.")
+            return counts
+        except Exception as e:
+            conn.rollback()
+            print(f"An error occurred: {e}")
 
-            # Albums that have zero songs left
-            cur.execute("""
-                SELECT al.AlbumID
-                FROM Albums al
-                LEFT JOIN SongAlbums sa ON al.AlbumID = sa.AlbumID
-                GROUP BY al.AlbumID
-                HAVING COUNT(sa.SongID) = 0;
-            """)
-            orphan_albums = cur.fetchall()
-            for album_row in orphan_albums:
-                orphan_album_id = album_row[0]
-                # Remove references to this album from AlbumArtists
-                cur.execute("DELETE FROM AlbumArtists WHERE AlbumID = %s;", (orphan_album_id,))
-                # Remove the album itself
-                cur.execute("DELETE FROM Albums WHERE AlbumID = %s;", (orphan_album_id,))
-
-            # Artists that have no songs remaining
-            cur.execute("""
-                SELECT a.ArtistID
-                FROM Artists a
-                LEFT JOIN SongArtists sa ON a.ArtistID = sa.ArtistID
-                GROUP BY a.ArtistID
-                HAVING COUNT(sa.SongID) = 0;
-            """)
-            orphan_artists = cur.fetchall()
-            for artist_row in orphan_artists:
-                orphan_artist_id = artist_row[0]
-                # Remove references to this artist from AlbumArtists
-                cur.execute("DELETE FROM AlbumArtists WHERE ArtistID = %s;", (orphan_artist_id,))
-                # Remove the artist
-                cur.execute("DELETE FROM Artists WHERE ArtistID = %s;", (orphan_artist_id,))
+def catalog_version(cur):
+    cur.execute("SELECT Version FROM CatalogVersion;")
+    return cur.fetchone()[0]
+
+def cached_query(cur, name, params, run):
+    # Checking the version is a single-row read. Transactions that have written
+    # bypass the cache: the version they see includes their own uncommitted work
+    cur.execute("SELECT Version, txid_current_if_assigned() IS NULL FROM CatalogVersion;")
+    version, unwritten = cur.fetchone()
+    if not unwritten:
+        return run()
+    key = (name, params, version)
+    result = RESULT_CACHE.get(key)
+    if result is None:
+        result = run()
+        RESULT_CACHE.put(key, result)
+    return result
+
+def songs_by_artist(cur, artist_name):
+    def run():
+        cur.execute(SONGS_BY_ARTIST_SQL, (artist_name,))
+        return [song[0] for song in cur.fetchall()]
+    return cached_query(cur, "songs_by_artist", (artist_name,), run)
+
+def artists_by_year(cur, year):
+    def run():
+        cur.execute(ARTISTS_BY_YEAR_SQL, (year,))
+        return [artist[0] for artist in cur.fetchall()]
+    return cached_query(cur, "artists_by_year", (str(year),), run)
+
+def albums_by_category(cur, category_name):
+    # (album title, artist names) pairs
+    def run():
+        cur.execute(ALBUMS_BY_CATEGORY_SQL, (category_name,))
+        return cur.fetchall()
+    return cached_query(cur, "albums_by_category", (category_name,), run)
+
+def print_songs_by_artist(artist_name, songs):
+    if songs:
+        print(f"Songs by {artist_name}:")
+        for song in songs:
+            print(f"- {song}")
+    else:
+        print(f"No songs found for artist {artist_name}.")
 
-            cur.execute("COMMIT;")
-            print(f"Song '{song_title}' and any orphaned albums/artists deleted successfully.")
+def print_artists_by_year(year, artists):
+    if artists:
+        print(f"Artists with albums released in {year}:")
+        for artist in artists:
+            print(f"- {artist}")
+    else:
+        print(f"No artists found with albums released in {year}.")
 
-        except Exception as e:
-            cur.execute("ROLLBACK;")
-            print(f"An error occurred: {e}")
-        finally:
-            cur.execute("SET session_replication_role = 'origin';")
+def print_albums_by_category(category_name, albums):
+    if not albums:
+        print("No albums found containing songs in the category '{0}'.".format(category_name))
+    else:
+        print(f"Albums containing songs in the category '{category_name}':")
+        for title, artists in albums:
+            artist_names = ', '.join(set(artists))
+            print(f"- {title} by {artist_names}")
 
 def list_songs_by_artist(conn):
-    print("Existing artists:")
-    list_artists(conn)
-    artist_name = input("Enter artist name to list songs: ")
+    artist_name = pick(conn, "artist", "Enter the name or number of the artist to list songs")
+    if artist_name is None:
+        print("Artist not found.")
+        return
     with conn.cursor() as cur:
-        cur.execute("""
-        SELECT s.Title
-        FROM Songs s
-        JOIN SongArtists sa ON s.SongID = sa.SongID
-        JOIN Artists a ON sa.ArtistID = a.ArtistID
-        WHERE a.Name = %s;
-        """, (artist_name,))
-        songs = cur.fetchall()
-        if songs:
-            print(f"Songs by {artist_name}:")
-            for song in songs:
-                print(f"- {song[0]}")
-        else:
-            print(f"No songs found for artist {artist_name}.")
+        print_songs_by_artist(artist_name, songs_by_artist(cur, artist_name))
 
 def list_artists_with_albums_by_year(conn):
     year = input("Enter the year to list artists: ")
     with conn.cursor() as cur:
-        cur.execute("""
-        SELECT DISTINCT a.Name
-        FROM Artists a
-        JOIN AlbumArtists aa ON a.ArtistID = aa.ArtistID
-        JOIN Albums al ON aa.AlbumID = al.AlbumID
-        WHERE al.Year = %s;
-        """, (year,))
-        artists = cur.fetchall()
-        if artists:
-            print(f"Artists with albums released in {year}:")
-            for artist in artists:
-                print(f"- {artist[0]}")
-        else:
-            print(f"No artists found with albums released in {year}.")
+        print_artists_by_year(year, artists_by_year(cur, year))
 
 def list_albums_by_category(conn):
-    print("Existing categories:")
-    list_categories(conn)
-    category_name = input("Enter the category name to list albums: ")
+    category_name = pick(conn, "category", "Enter the name or number of the category to list albums")
+    if category_name is None:
+        print("Category not found.")
+        return
     with conn.cursor() as cur:
-        cur.execute("""
-        SELECT al.Title, array_agg(DISTINCT a.Name) AS Artists
-        FROM Albums al
-        JOIN SongAlbums sa ON al.AlbumID = sa.AlbumID
-        JOIN Songs s ON sa.SongID = s.SongID
-        JOIN SongCategories sc ON s.SongID = sc.SongID
-        JOIN Categories c ON sc.CategoryID = c.CategoryID
-        JOIN AlbumArtists aa ON al.AlbumID = aa.AlbumID
-        JOIN Artists a ON aa.ArtistID = a.ArtistID
-        WHERE c.Name = %s
-        GROUP BY al.AlbumID
-        ORDER BY al.Title;
-        """, (category_name,))
-        albums = cur.fetchall()
-        if not albums:
-            print("No albums found containing songs in the category '{0}'.".format(category_name))
-        else:
-            print(f"Albums containing songs in the category '{category_name}':")
-            for title, artists in albums:
-                artist_names = ', '.join(set(artists))
-                print(f"- {title} by {artist_names}")
+        print_albums_by_category(category_name, albums_by_category(cur, category_name))
+
+# Related-content queries walk the junction tables as a graph held in memory:
+# one compressed sparse row index per link direction, built in one statement
+# (one snapshot) and brought forward from the LinkChanges log after that
+GRAPH_LIMIT = 10
+GRAPH_MAX_HOPS = 6
+# Logged changes a graph takes on top of its arrays before it is rebuilt instead
+GRAPH_MAX_CHANGES = 10000
+# name -> junction table, from column, to column
+GRAPH_LINKS = {
+    "artist_songs": ("SongArtists", "ArtistID", "SongID"),
+    "song_artists": ("SongArtists", "SongID", "ArtistID"),
+    "artist_albums": ("AlbumArtists", "ArtistID", "AlbumID"),
+    "album_artists": ("AlbumArtists", "AlbumID", "ArtistID"),
+    "song_categories": ("SongCategories", "SongID", "CategoryID"),
+    "category_songs": ("SongCategories", "CategoryID", "SongID"),
+}
+
+class Adjacency:
+    # The neighbours of node n are targets[offsets[n]:offsets[n + 1]]; nodes
+    # are row IDs, so offsets is as long as the largest ID with a link. Nodes
+    # whose links changed since the build keep their neighbours in changed
+    def __init__(self, sources, targets):
+        counts = [0] * ((sources[-1] + 2) if sources else 1)
+        for source in sources:
+            counts[source + 1] += 1
+        self.offsets = array("i", itertools.accumulate(counts))
+        self.targets = array("i", targets)
+        self.changed = {}
+        self.size = len(self.targets)
+
+    def __getitem__(self, node):
+        neighbours = self.changed.get(node)
+        if neighbours is not None:
+            return neighbours
+        if 0 <= node < len(self.offsets) - 1:
+            return self.targets[self.offsets[node]:self.offsets[node + 1]]
+        return self.targets[:0]
+
+    def __len__(self):
+        return self.size
+
+    def with_changes(self, changes):
+        # A copy sharing the arrays, with (source, target, added) changes applied in order
+        adjacency = copy.copy(self)
+        adjacency.changed = dict(self.changed)
+        for source, target, added in changes:
+            neighbours = adjacency[source]
+            if added and target not in neighbours:
+                adjacency.changed[source] = neighbours + array("i", [target])
+                adjacency.size += 1
+            elif not added and target in neighbours:
+                adjacency.changed[source] = array("i", [node for node in neighbours if node != target])
+                adjacency.size -= 1
+        return adjacency
+
+class CatalogGraph:
+    # horizon is the LinkChangesHorizon the graph last saw
+    def __init__(self, snapshot, horizon, links, seconds, changes=0):
+        self.snapshot = snapshot
+        self.horizon = horizon
+        self.links = links
+        self.seconds = seconds
+        self.changes = changes
+
+    def with_changes(self, changes, snapshot=None, horizon=None):
+        # changes are LinkChanges rows, (table, from ID, to ID, added), in log order
+        links = {}
+        for name, (table, source, target) in GRAPH_LINKS.items():
+            forward = LINK_TABLES[table] == (source, target)
+            applied = [(from_id, to_id, added) if forward else (to_id, from_id, added)
+                       for link_table, from_id, to_id, added in changes if link_table == table]
+            links[name] = self.links[name].with_changes(applied) if applied else self.links[name]
+        return CatalogGraph(snapshot or self.snapshot, horizon or self.horizon, links, self.seconds,
+                            self.changes + len(changes))
+
+def build_graph(cur):
+    start = time.perf_counter()
+    columns = ["pg_current_snapshot()::text", "(SELECT TxID::text FROM LinkChangesHorizon)"]
+    for table, source, target in GRAPH_LINKS.values():
+        for column in (source, target):
+            columns.append(f"(SELECT array_agg({column} ORDER BY {source}, {target}) FROM {table})")
+    cur.execute(f"SELECT {', '.join(columns)};")
+    snapshot, horizon, *arrays = cur.fetchone()
+    links = {name: Adjacency(arrays[2 * i] or [], arrays[2 * i + 1] or [])
+             for i, name in enumerate(GRAPH_LINKS)}
+    return CatalogGraph(snapshot, horizon, links, time.perf_counter() - start)
+
+# Changes committed since the since snapshot and visible now, with the current
+# snapshot and horizon; the outer join returns those even when nothing changed.
+# Pruning moved the horizon past changes the graph may not have seen when it
+# reached the since snapshot's oldest running transaction
+GRAPH_CHANGES_SQL = """
+    SELECT pg_current_snapshot()::text, h.TxID::text,
+        h.TxID <> %(horizon)s::xid8 AND h.TxID >= pg_snapshot_xmin(%(since)s::pg_snapshot),
+        c.ChangeID, c.LinkTable, c.FromID, c.ToID, c.Added
+    FROM LinkChangesHorizon h
+    LEFT JOIN LATERAL (
+        SELECT ChangeID, LinkTable, FromID, ToID, Added
+        FROM LinkChanges
+        WHERE TxID >= pg_snapshot_xmin(%(since)s::pg_snapshot)
+            AND NOT pg_visible_in_snapshot(TxID, %(since)s::pg_snapshot)
+            AND pg_visible_in_snapshot(TxID, pg_current_snapshot())
+        ORDER BY ChangeID
+        LIMIT %(limit)s
+    ) c ON true;
+"""
+
+def refresh_graph(cur, graph):
+    # The graph moved to the current snapshot, or None when it has to be rebuilt
+    cur.execute(GRAPH_CHANGES_SQL, {"since": graph.snapshot, "horizon": graph.horizon,
+                                    "limit": GRAPH_MAX_CHANGES + 1})
+    rows = cur.fetchall()
+    snapshot, horizon, pruned = rows[0][:3]
+    changes = [row[4:] for row in rows if row[3] is not None]
+    if (pruned or graph.changes + len(changes) > GRAPH_MAX_CHANGES
+            or any(table is None for table, *_ in changes)):
+        return None
+    return graph.with_changes(changes, snapshot, horizon)
+
+def own_link_changes(cur):
+    # The open transaction's own changes in log order, or None when they cannot
+    # be applied to a graph (a bulk write, or too many to be worth it)
+    cur.execute("SELECT LinkTable, FromID, ToID, Added FROM LinkChanges "
+                "WHERE TxID = pg_current_xact_id_if_assigned() ORDER BY ChangeID LIMIT %s;",
+                (GRAPH_MAX_CHANGES + 1,))
+    changes = cur.fetchall()
+    if len(changes) > GRAPH_MAX_CHANGES or any(table is None for table, *_ in changes):
+        return None
+    return changes
+
+def undo_link_changes(changes):
+    # Links are unique, so a link existed before the transaction exactly when
+    # the transaction's first change to it removed it
+    first = {}
+    for table, from_id, to_id, added in changes:
+        first.setdefault((table, from_id, to_id), added)
+    return [(table, from_id, to_id, not added) for (table, from_id, to_id), added in first.items()]
+
+_catalog_graph = None
+_graph_lock = threading.Lock()
+
+def catalog_graph(cur):
+    # The shared graph holds committed links only; a transaction that has
+    # written links walks a copy with its own changes on top. A graph built
+    # inside such a transaction sees those changes, so they are undone first
+    global _catalog_graph
+    own = own_link_changes(cur)
+    if own is None:
+        return build_graph(cur)
+    with _graph_lock:
+        graph = None
+        if _catalog_graph is not None:
+            graph = refresh_graph(cur, _catalog_graph)
+        if graph is None:
+            graph = build_graph(cur)
+            if own:
+                graph = graph.with_changes(undo_link_changes(own))
+        _catalog_graph = graph
+    return graph.with_changes(own) if own else graph
+
+def graph_names(cur, kind, row_ids):
+    table, id_column, name = SEARCH_KINDS[kind]
+    cur.execute(f"SELECT {id_column}, {name} FROM {table} WHERE {id_column} = ANY(%s);", (list(row_ids),))
+    return dict(cur.fetchall())
+
+def graph_node(cur, kind, name):
+    table, id_column, key_column = SEARCH_KINDS[kind]
+    row_id = lookup_id(cur, table, id_column, {key_column: name})
+    if row_id is None:
+        raise CatalogError(f"{kind.capitalize()} not found.")
+    return row_id
+
+def collaborators(cur, artist_name, hops=1, limit=None):
+    # Artists reachable through shared songs or albums within hops steps, as
+    # (name, hops, shared) where shared counts the songs and albums linking
+    # them to the previous step; nearest and strongest first
+    if not 1 <= hops <= GRAPH_MAX_HOPS:
+        raise CatalogError(f"Hops must be between 1 and {GRAPH_MAX_HOPS}.")
+    artist_id = graph_node(cur, "artist", artist_name)
+    graph = catalog_graph(cur)
+    distance = {artist_id: 0}
+    shared = Counter()
+    frontier = [artist_id]
+    for hop in range(1, hops + 1):
+        found = Counter()
+        for source in frontier:
+            for link, back in (("artist_songs", "song_artists"), ("artist_albums", "album_artists")):
+                for node in graph.links[link][source]:
+                    for other in graph.links[back][node]:
+                        if other not in distance:
+                            found[other] += 1
+        if not found:
+            break
+        for other in found:
+            distance[other] = hop
+        shared.update(found)
+        frontier = list(found)
+    del distance[artist_id]
+    top = heapq.nsmallest(limit or GRAPH_LIMIT, distance, key=lambda other: (distance[other], -shared[other], other))
+    names = graph_names(cur, "artist", top)
+    return [(names[other], distance[other], shared[other]) for other in top]
+
+def similar_songs(cur, song_title, limit=None):
+    # Songs sharing the most categories with the song, as (title, shared);
+    # ties go to songs with fewer other categories, then to the older song
+    song_id = graph_node(cur, "song", song_title)
+    graph = catalog_graph(cur)
+    categories = graph.links["song_categories"][song_id]
+    shared = Counter()
+    for category_id in categories:
+        shared.update(graph.links["category_songs"][category_id])
+    del shared[song_id]
+    top = heapq.nsmallest(limit or GRAPH_LIMIT, shared, key=lambda other: (
+        -shared[other], len(graph.links["song_categories"][other]) - shared[other], other))
+    names = graph_names(cur, "song", top)
+    return [(names[other], shared[other]) for other in top]
+
+def top_categories(cur, artist_name, limit=None):
+    # The categories most of the artist's songs are filed under, as (name, songs)
+    artist_id = graph_node(cur, "artist", artist_name)
+    graph = catalog_graph(cur)
+    songs = Counter()
+    for song_id in graph.links["artist_songs"][artist_id]:
+        songs.update(graph.links["song_categories"][song_id])
+    top = heapq.nsmallest(limit or GRAPH_LIMIT, songs, key=lambda category_id: (-songs[category_id], category_id))
+    names = graph_names(cur, "category", top)
+    return [(names[category_id], songs[category_id]) for category_id in top]
+
+def print_collaborators(artist_name, artists):
+    if artists:
+        print(f"Artists connected to {artist_name}:")
+        for name, hops, shared in artists:
+            print(f"- {name} ({hops} {'hop' if hops == 1 else 'hops'}, {shared} shared songs and albums)")
+    else:
+        print(f"No collaborators found for artist {artist_name}.")
+
+def print_similar_songs(song_title, songs):
+    if songs:
+        print(f"Songs most similar to {song_title}:")
+        for title, shared in songs:
+            print(f"- {title} ({shared} shared {'category' if shared == 1 else 'categories'})")
+    else:
+        print(f"No songs share a category with {song_title}.")
+
+def print_top_categories(artist_name, categories):
+    if categories:
+        print(f"Top categories for {artist_name}:")
+        for name, songs in categories:
+            print(f"- {name} ({songs} {'song' if songs == 1 else 'songs'})")
+    else:
+        print(f"No categories found for artist {artist_name}.")
+
+def list_collaborators(conn):
+    artist_name = pick(conn, "artist", "Enter the name or number of the artist")
+    if artist_name is None:
+        print("Artist not found.")
+        return
+    hops = input(f"Enter the number of hops (1-{GRAPH_MAX_HOPS}, default 1): ").strip()
+    if hops and not hops.isdigit():
+        print("Invalid number of hops.")
+        return
+    artists = apply(conn, collaborators, artist_name, int(hops or 1))
+    if artists is not None:
+        print_collaborators(artist_name, artists)
+
+def list_similar_songs(conn):
+    song_title = pick(conn, "song", "Enter the title or number of the song")
+    if song_title is None:
+        print("Song not found.")
+        return
+    songs = apply(conn, similar_songs, song_title)
+    if songs is not None:
+        print_similar_songs(song_title, songs)
+
+def list_top_categories(conn):
+    artist_name = pick(conn, "artist", "Enter the name or number of the artist")
+    if artist_name is None:
+        print("Artist not found.")
+        return
+    categories = apply(conn, top_categories, artist_name)
+    if categories is not None:
+        print_top_categories(artist_name, categories)
+
+# Every table holding catalog rows, entities before the tables referencing them
+SNAPSHOT_TABLES = CATALOG_TABLES + ("SongDetails",)
+SNAPSHOT_PREFIX = "snapshot_"
+
+def wipe_catalog(cur):
+    # One TRUNCATE empties every table at once without leaving dead rows for
+    # vacuum; it locks the tables exclusively until commit, and its triggers
+    # still bump the catalog version and epoch. The ID sequences keep running,
+    # so an ID another process still holds never names a new row
+    cur.execute(f"TRUNCATE {', '.join(SNAPSHOT_TABLES)} CASCADE;")
+    clear_id_caches()
+    return True
+
+# Snapshots copy the catalog tables into a schema of their own on the server,
+# so a known seed catalog is restored without going through the importer
+def snapshot_schema(name):
+    if not re.fullmatch(r"\w+", name):
+        raise CatalogError("Snapshot names may only contain letters, digits and underscores.")
+    return SNAPSHOT_PREFIX + name.lower()
+
+def snapshot_exists(cur, name):
+    cur.execute("SELECT 1 FROM pg_namespace WHERE nspname = %s;", (snapshot_schema(name),))
+    return cur.fetchone() is not None
+
+def save_snapshot(cur, name):
+    if snapshot_exists(cur, name):
+        raise CatalogError(f"Snapshot '{name}' already exists.")
+    schema = snapshot_schema(name)
+    cur.execute(f"CREATE SCHEMA {schema};")
+    for table in SNAPSHOT_TABLES:
+        cur.execute(f"CREATE TABLE {schema}.{table} AS TABLE {table};")
+    cur.execute(f"SELECT count(*) FROM {schema}.Songs;")
+    return cur.fetchone()[0]
+
+def restore_snapshot(cur, name):
+    # Replaces the catalog with the snapshot; SongDetails is copied as saved
+    # instead of being rebuilt, and the version is bumped once by the wipe
+    if not snapshot_exists(cur, name):
+        raise CatalogError(f"Snapshot '{name}' does not exist.")
+    schema = snapshot_schema(name)
+    wipe_catalog(cur)
+    cur.execute("SET LOCAL album.defer_song_details = on;")
+    cur.execute("SET LOCAL album.defer_catalog_version = on;")
+    # The snapshot was consistent when saved, so the foreign keys are dropped
+    # for the copy and validated once afterwards instead of row by row; the
+    # wipe already holds exclusive locks on every table
+    cur.execute("SELECT conrelid::regclass, conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                "WHERE contype = 'f' AND conrelid = ANY(%s::regclass[]);", (list(SNAPSHOT_TABLES),))
+    foreign_keys = cur.fetchall()
+    for table, constraint, _ in foreign_keys:
+        cur.execute(f"ALTER TABLE {table} DROP CONSTRAINT {constraint};")
+    for table in SNAPSHOT_TABLES:
+        cur.execute(f"INSERT INTO {table} SELECT * FROM {schema}.{table};")
+    for table, constraint, definition in foreign_keys:
+        cur.execute(f"ALTER TABLE {table} ADD CONSTRAINT {constraint} {definition};")
+    # New rows continue after the restored IDs, and the sequences never move
+    # back to IDs that were handed out before
+    for table, id_column, _ in SEARCH_KINDS.values():
+        sequence = f"pg_get_serial_sequence('{table}', '{id_column.lower()}')"
+        cur.execute(f"SELECT setval({sequence}, GREATEST(COALESCE(max({id_column}), 0) + 1, nextval({sequence})), "
+                    f"false) FROM {table};")
+    cur.execute("".join(f"ANALYZE {table};" for table in SNAPSHOT_TABLES))
+    clean_search_indexes(cur)
+    cur.execute("SELECT count(*) FROM Songs;")
+    return cur.fetchone()[0]
+
+def delete_snapshot(cur, name):
+    if not snapshot_exists(cur, name):
+        raise CatalogError(f"Snapshot '{name}' does not exist.")
+    cur.execute(f"DROP SCHEMA {snapshot_schema(name)} CASCADE;")
+
+def list_snapshots(cur):
+    # (name, song count) pairs
+    cur.execute("SELECT nspname FROM pg_namespace WHERE starts_with(nspname, %s) ORDER BY nspname;",
+                (SNAPSHOT_PREFIX,))
+    snapshots = []
+    for schema, in cur.fetchall():
+        cur.execute(f"SELECT count(*) FROM {schema}.Songs;")
+        snapshots.append((schema[len(SNAPSHOT_PREFIX):], cur.fetchone()[0]))
+    return snapshots
 
 def wipe_database(conn):
     print("WARNING: You are about to wipe the entire database. This action cannot be undone.")
     confirm = input("Type 'DELETE' to confirm: ")
     if confirm == 'DELETE':
-        with conn.cursor() as cur:
-            try:
-                # Disable foreign key checks to allow deletion of all tables without constraint conflicts
-                cur.execute("SET session_replication_role = 'replica';")
-
-                # Order of deletion should respect foreign key constraints
-                # Assuming SongAlbums, SongArtists, SongCategories, AlbumArtists are junction tables
-                cur.execute("DELETE FROM SongCategories;")
-                cur.execute("DELETE FROM SongAlbums;")
-                cur.execute("DELETE FROM SongArtists;")
-                cur.execute("DELETE FROM AlbumArtists;")
-
-                # Deleting main entity tables
-                cur.execute("DELETE FROM Songs;")
-                cur.execute("DELETE FROM Albums;")
-                cur.execute("DELETE FROM Artists;")
-                cur.execute("DELETE FROM Categories;")
-
-                # Commit changes to ensure all data is deleted
-                conn.commit()
-                print("Database wiped successfully.")
-            except Exception as e:
-                # Rollback in case of any error during deletion
-                conn.rollback()
-                print("Failed to wipe the database:", str(e))
-            finally:
-                # Re-enable foreign key checks
-                cur.execute("SET session_replication_role = 'origin';")
+        if apply(conn, wipe_catalog) is not None:
+            print("Database wiped successfully.")
     else:
         print("Database wipe canceled.")
 
-def edit_artist(conn):
-    with conn.cursor() as cur:
-        # Show all available artists
-        cur.execute("SELECT Name FROM Artists ORDER BY Name;")
-        all_artists = cur.fetchall()
-        if not all_artists:
-            print("No artists found in the database.")
-            return
-
-        print("Available Artists:")
-        for artist_row in all_artists:
-            print(f"- {artist_row[0]}")
+def rename(cur, table, id_column, key_column, name, new_name, not_found, exists):
+    row_id = lookup_id(cur, table, id_column, {key_column: name})
+    if row_id is None:
+        raise CatalogError(not_found)
+    if not new_name:
+        raise CatalogError(f"The new {key_column.lower()} cannot be empty.")
+    if lookup_id(cur, table, id_column, {key_column: new_name}) is not None:
+        raise CatalogError(exists)
+    cur.execute(f"UPDATE {table} SET {key_column} = %s WHERE {id_column} = %s;", (new_name, row_id))
+    forget_ids(table, [row_id])
+    return row_id
+
+def rename_artist(cur, name, new_name):
+    return rename(cur, "Artists", "ArtistID", "Name", name, new_name, "Artist not found.",
+                  f"An artist with the name '{new_name}' already exists.")
+
+def rename_album(cur, title, new_title):
+    return rename(cur, "Albums", "AlbumID", "Title", title, new_title, "Album not found.",
+                  f"An album with the title '{new_title}' already exists.")
+
+def rename_category(cur, name, new_name):
+    return rename(cur, "Categories", "CategoryID", "Name", name, new_name, "Category not found.",
+                  f"A category with the name '{new_name}' already exists.")
+
+def rename_song(cur, title, new_title):
+    return rename(cur, "Songs", "SongID", "Title", title, new_title, "Song not found.",
+                  f"A song with the title '{new_title}' already exists.")
+
+def set_album_year(cur, title, year):
+    album_id = lookup_id(cur, "Albums", "AlbumID", {"Title": title})
+    if album_id is None:
+        raise CatalogError("Album not found.")
+    # The album itself holds the key when its year already is year
+    if lookup_id(cur, "Albums", "AlbumID", {"Title": title, "Year": year}) not in (None, album_id):
+        raise CatalogError(f"An album '{title}' from year {year} already exists.")
+    cur.execute("UPDATE Albums SET Year = %s WHERE AlbumID = %s;", (year, album_id))
+    forget_ids("Albums", [album_id])
+    return album_id
+
+# Bulk edits read a CSV or JSON-lines mapping file with name and new_name
+# columns, plus year for albums; a blank column keeps the current value
+BULK_EDITS = {
+    "artist": ("Artists", "ArtistID", "Name", None),
+    "album": ("Albums", "AlbumID", "Title", "Year"),
+    "category": ("Categories", "CategoryID", "Name", None),
+    "song": ("Songs", "SongID", "Title", None),
+}
+
+def read_edits(path, year_column):
+    # (line, name, new name, new year) per mapping row; lines count from the
+    # first data row. Rows that cannot be used come back with their reason
+    edits, invalid = [], {}
+    try:
+        for line, row in enumerate(read_catalog(path), 1):
+            if not isinstance(row, dict):
+                invalid[line] = "not an object with name and new_name fields"
+                edits.append((line, "", None, None))
+                continue
+            name = str(row.get("name") or "").strip()
+            new_name = str(row.get("new_name") or "").strip() or None
+            year = str(row.get("year") or "").strip() or None
+            if not name:
+                invalid[line] = "no name given"
+            elif year is not None and year_column is None:
+                invalid[line] = "only albums have a year"
+            elif year is not None and not year.isdigit():
+                invalid[line] = f"invalid year '{year}'"
+            elif new_name is None and year is None:
+                invalid[line] = "nothing to change"
+            edits.append((line, name, new_name, int(year) if year and year.isdigit() else None))
+    except (OSError, ValueError, csv.Error) as e:
+        raise CatalogError(f"Could not read mapping file '{path}': {e}.")
+    return edits, invalid
+
+# Prefix of the temporary keys rows hold between the two steps of a bulk edit,
+# starting with a control character no real name is expected to contain
+BULK_EDIT_PLACEHOLDER = "\x1fbulk-edit "
+
+def bulk_edit_sql(table, id_column, key_column, year_column):
+    # One row per edit: the row it names, its current key and any other row
+    # already holding the key the edit would give it
+    year = f"t.{year_column}" if year_column else "NULL::integer"
+    clash_year = f" AND c.{year_column} = COALESCE(e.new_year, t.{year_column})" if year_column else ""
+    return f"""
+        SELECT e.line, t.{id_column}, t.{key_column}, {year}, clash.{id_column}
+        FROM unnest(%(lines)s::integer[], %(names)s::text[], %(new_names)s::text[], %(new_years)s::integer[])
+            AS e (line, name, new_name, new_year)
+        LEFT JOIN LATERAL (
+            SELECT {id_column}, {key_column}{f", {year_column}" if year_column else ""}
+            FROM {table} WHERE {key_column} = e.name ORDER BY {id_column} LIMIT 1
+        ) t ON true
+        LEFT JOIN LATERAL (
+            SELECT c.{id_column} FROM {table} c
+            WHERE c.{key_column} = COALESCE(e.new_name, t.{key_column}){clash_year}
+            AND c.{id_column} != t.{id_column}
+            LIMIT 1
+        ) clash ON true
+        ORDER BY e.line;
+    """
+
+def bulk_edit(cur, kind, path, dry_run=False):
+    # Validates every edit in one query and applies the valid ones with one
+    # UPDATE; returns (line, name, new name, new year, outcome) per mapping row
+    table, id_column, key_column, year_column = BULK_EDITS[kind]
+    edits, outcomes = read_edits(path, year_column)
+    usable = [edit for edit in edits if edit[0] not in outcomes]
+    cur.execute(bulk_edit_sql(table, id_column, key_column, year_column), {
+        "lines": [line for line, _, _, _ in usable],
+        "names": [name for _, name, _, _ in usable],
+        "new_names": [new_name for _, _, new_name, _ in usable],
+        "new_years": [new_year for _, _, _, new_year in usable],
+    })
+
+    # line -> (row ID, new key, ID of the row holding that key now)
+    candidates, claimed_ids, claimed_keys = {}, {}, {}
+    for line, row_id, current, current_year, clash_id in cur.fetchall():
+        _, _, new_name, new_year = edits[line - 1]
+        key = (new_name or current, new_year if new_year is not None else current_year)
+        if row_id is None:
+            outcomes[line] = f"{kind} not found"
+        elif row_id in claimed_ids:
+            outcomes[line] = f"already edited on line {claimed_ids[row_id]}"
+        elif key == (current, current_year):
+            outcomes[line] = "unchanged"
+        elif key in claimed_keys:
+            outcomes[line] = f"same result as line {claimed_keys[key]}"
+        else:
+            claimed_ids[row_id] = claimed_keys[key] = line
+            candidates[line] = (row_id, key, clash_id)
 
-    artist_name = input("Enter the artist name to edit: ")
-    with conn.cursor() as cur:
-        cur.execute("SELECT ArtistID FROM Artists WHERE Name = %s;", (artist_name,))
-        artist = cur.fetchone()
-        if not artist:
-            print("Artist not found.")
-            return
+    # A key held by another row is only free when this batch moves that row
+    # too, as in chained renames; rejecting an edit keeps its row's key taken,
+    # so repeat until no further edit is rejected
+    while True:
+        moving = {row_id for row_id, _, _ in candidates.values()}
+        clashes = [line for line, (_, _, clash_id) in candidates.items()
+                   if clash_id is not None and clash_id not in moving]
+        if not clashes:
+            break
+        for line in clashes:
+            del candidates[line]
+            outcomes[line] = (f"another {kind} already has that {key_column.lower()}"
+                              + (f" and {year_column.lower()}" if year_column else ""))
+    updates = {row_id: key for row_id, key, _ in candidates.values()}
+    for line in candidates:
+        outcomes[line] = "would be updated" if dry_run else "updated"
+
+    if updates and not dry_run:
+        row_ids = list(updates)
+        # The unique index is checked row by row, so every edited row first
+        # takes a placeholder key; chains and swaps then never collide midway
+        cur.execute(f"UPDATE {table} SET {key_column} = %s || {id_column} WHERE {id_column} = ANY(%s);",
+                    (BULK_EDIT_PLACEHOLDER, row_ids))
+        year_set = f", {year_column} = e.year" if year_column else ""
+        cur.execute(f"""
+            UPDATE {table} t SET {key_column} = e.key{year_set}
+            FROM unnest(%s::integer[], %s::text[], %s::integer[]) AS e (id, key, year)
+            WHERE t.{id_column} = e.id;
+        """, (row_ids, [updates[row_id][0] for row_id in row_ids], [updates[row_id][1] for row_id in row_ids]))
+        forget_ids(table, row_ids)
+
+    return [(line, name, new_name, new_year, outcomes[line]) for line, name, new_name, new_year in edits]
 
-        new_name = input("Enter the new artist name: ")
-        if cur.fetchone():
-            print(f"An artist with the name '{new_name}' already exists. Operation canceled.")
-            return
+def edit_artist(conn):
+    artist_name = pick(conn, "artist", "Enter the name or number of the artist to edit")
+    if artist_name is None:
+        print("Artist not found.")
+        return
 
-        cur.execute("UPDATE Artists SET Name = %s WHERE ArtistID = %s;", (new_name, artist[0]))
-        conn.commit()
+    new_name = input("Enter the new artist name: ")
+    if apply(conn, rename_artist, artist_name, new_name) is not None:
         print("Artist name updated successfully.")
 
 def edit_album(conn):
+    album_title = pick(conn, "album", "Enter the title or number of the album to edit")
+    if album_title is None:
+        print("Album not found.")
+        return
     with conn.cursor() as cur:
-        # Show all available albums
-        cur.execute("SELECT Title, Year FROM Albums ORDER BY Title;")
-        all_albums = cur.fetchall()
-        if not all_albums:
-            print("No albums found in the database.")
-            return
+        cur.execute("SELECT Title, Year FROM Albums WHERE Title = %s;", (album_title,))
+        current_title, current_year = cur.fetchone()
 
-        print("Available Albums:")
-        for album_row in all_albums:
-            print(f"- {album_row[0]} (Year: {album_row[1]})")
+    print("What would you like to edit?")
+    print("1. Album title")
+    print("2. Release year")
+    choice = input("Enter choice (1 or 2): ")
 
-    album_title = input("Enter the album title to edit: ")
-    with conn.cursor() as cur:
-        cur.execute("SELECT AlbumID, Title, Year FROM Albums WHERE Title = %s;", (album_title,))
-        album = cur.fetchone()
-        if not album:
-            print("Album not found.")
+    if choice == '1':
+        new_title = input(f"Current title: '{current_title}'. Enter the new album title: ")
+        if apply(conn, rename_album, current_title, new_title) is not None:
+            print("Album title updated successfully.")
+    elif choice == '2':
+        new_year = input(f"Current year: '{current_year}'. Enter the new release year: ").strip()
+        if not new_year.isdigit():
+            print("Invalid year. No changes made.")
             return
+        if apply(conn, set_album_year, current_title, int(new_year)) is not None:
+            print("Release year updated successfully.")
+    else:
+        print("Invalid choice. No changes made.")
 
-        # album = (AlbumID, Title, Year)
-        album_id, current_title, current_year = album
+def edit_category(conn):
+    category_name = pick(conn, "category", "Enter the name or number of the category to edit")
+    if category_name is None:
+        print("Category not found.")
+        return
 
-        print("What would you like to edit?")
-        print("1. Album title")
-        print("2. Release year")
-        choice = input("Enter choice (1 or 2): ")
+    new_name = input("Enter the new category name: ")
+    if apply(conn, rename_category, category_name, new_name) is not None:
+        print("Category name updated successfully.")
 
-        if choice == '1':
-            new_title = input(f"Current title: '{current_title}'. Enter the new album title: ")
-            cur.execute("SELECT 1 FROM Albums WHERE Title = %s;", (new_title,))
-            if cur.fetchone():
-                print(f"An album with the title '{new_title}' already exists. Operation canceled.")
-                return
-            cur.execute("UPDATE Albums SET Title = %s WHERE AlbumID = %s;", (new_title, album_id))
-            print("Album title updated successfully.")
-        elif choice == '2':
-            new_year = input(f"Current year: '{current_year}'. Enter the new release year: ")
-            cur.execute("UPDATE Albums SET Year = %s WHERE AlbumID = %s;", (new_year, album_id))
-            print("Release year updated successfully.")
-        else:
-            print("Invalid choice. No changes made.")
-            return
+def edit_song(conn):
+    song_title = pick(conn, "song", "Enter the title or number of the song to edit")
+    if song_title is None:
+        print("Song not found.")
+        return
 
-        conn.commit()
+    new_title = input("Enter the new song title: ")
+    if apply(conn, rename_song, song_title, new_title) is not None:
+        print("Song name updated successfully.")
 
-def edit_category(conn):
-    with conn.cursor() as cur:
-        # Show all available categories
-        cur.execute("SELECT Name FROM Categories ORDER BY Name;")
-        all_categories = cur.fetchall()
-        if not all_categories:
-            print("No categories found in the database.")
-            return
+# Catalog dumps have song, album, year, artists and categories columns;
+# artists and categories hold comma-separated names like the interactive prompts
+IMPORT_PROGRESS_EVERY = 100000
+IMPORT_SPOOL_SIZE = 64 * 1024 * 1024
+IMPORT_WORK_MEM = "256MB"
+
+def read_catalog(path):
+    # Yields one dict per track from a CSV (with header row) or JSON-lines dump
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith((".jsonl", ".ndjson", ".json")):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            for row in csv.DictReader(f):
+                yield {key.strip().lower(): value for key, value in row.items() if key}
+
+def split_names(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [str(name).strip() for name in value if str(name).strip()]
+
+def copy_text(value):
+    # Escape a value for COPY's text format
+    if value is None:
+        return "\\N"
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+def copy_row(f, *values):
+    f.write("\t".join(copy_text(value) for value in values) + "\n")
+
+def parse_track(count, track):
+    if not isinstance(track, dict):
+        raise ValueError(f"track {count}: expected an object with song, album, year, artists and categories")
+    song = str(track.get("song") or "").strip()
+    album = str(track.get("album") or "").strip()
+    year = str(track.get("year") or "").strip()
+    artists = split_names(track.get("artists"))
+    categories = split_names(track.get("categories"))
+    if not song or not album:
+        raise ValueError(f"track {count}: song and album are required")
+    if not year.isdigit():
+        raise ValueError(f"track {count}: invalid year '{year}' for album '{album}'")
+    if not artists or not categories:
+        raise ValueError(f"track {count}: song '{song}' needs at least one artist and one category")
+    return song, album, year, artists, categories
+
+def write_track(tracks, track_artists, track_categories, song, album, year, artists, categories):
+    copy_row(tracks, song, album, year)
+    for artist in artists:
+        copy_row(track_artists, song, album, year, artist)
+    for category in categories:
+        copy_row(track_categories, song, category)
+
+def stage_catalog(path, tracks, track_artists, track_categories):
+    # Single pass over the dump, spooling one COPY stream per staging table
+    count = 0
+    start = time.perf_counter()
+    for count, track in enumerate(read_catalog(path), start=1):
+        write_track(tracks, track_artists, track_categories, *parse_track(count, track))
+        if count % IMPORT_PROGRESS_EVERY == 0:
+            elapsed = time.perf_counter() - start
+            print(f"Staged {count} tracks ({count / elapsed:.0f} rows/s)...")
+    return count
+
+# Set-based statements resolving the staged names into IDs, in dependency order.
+# Rows are inserted in key order, so concurrent importers take each other's
+# keys in the same order and conflicts wait instead of deadlocking
+IMPORT_STATEMENTS = (
+    ("Artists", """
+        INSERT INTO Artists (Name)
+        SELECT DISTINCT t.Artist FROM import_track_artists t
+        WHERE NOT EXISTS (SELECT 1 FROM Artists a WHERE a.Name = t.Artist)
+        ORDER BY 1
+        ON CONFLICT DO NOTHING;
+    """),
+    ("Categories", """
+        INSERT INTO Categories (Name)
+        SELECT DISTINCT t.Category FROM import_track_categories t
+        WHERE NOT EXISTS (SELECT 1 FROM Categories c WHERE c.Name = t.Category)
+        ORDER BY 1
+        ON CONFLICT DO NOTHING;
+    """),
+    ("Albums", """
+        INSERT INTO Albums (Title, Year)
+        SELECT DISTINCT t.Album, t.Year FROM import_tracks t
+        WHERE NOT EXISTS (SELECT 1 FROM Albums al WHERE al.Title = t.Album AND al.Year = t.Year)
+        ORDER BY 1, 2
+        ON CONFLICT DO NOTHING;
+    """),
+    ("Songs", """
+        INSERT INTO Songs (Title)
+        SELECT DISTINCT t.Song FROM import_tracks t
+        WHERE NOT EXISTS (SELECT 1 FROM Songs s WHERE s.Title = t.Song)
+        ORDER BY 1
+        ON CONFLICT DO NOTHING;
+    """),
+    ("SongAlbums", """
+        INSERT INTO SongAlbums (SongID, AlbumID)
+        SELECT DISTINCT s.SongID, al.AlbumID
+        FROM import_tracks t
+        JOIN Songs s ON s.Title = t.Song
+        JOIN Albums al ON al.Title = t.Album AND al.Year = t.Year
+        WHERE NOT EXISTS (SELECT 1 FROM SongAlbums sa WHERE sa.SongID = s.SongID AND sa.AlbumID = al.AlbumID)
+        ORDER BY 1, 2
+        ON CONFLICT DO NOTHING;
+    """),
+    ("SongArtists", """
+        INSERT INTO SongArtists (SongID, ArtistID)
+        SELECT DISTINCT s.SongID, a.ArtistID
+        FROM import_track_artists t
+        JOIN Songs s ON s.Title = t.Song
+        JOIN Artists a ON a.Name = t.Artist
+        WHERE NOT EXISTS (SELECT 1 FROM SongArtists sa WHERE sa.SongID = s.SongID AND sa.ArtistID = a.ArtistID)
+        ORDER BY 1, 2
+        ON CONFLICT DO NOTHING;
+    """),
+    ("AlbumArtists", """
+        INSERT INTO AlbumArtists (AlbumID, ArtistID)
+        SELECT DISTINCT al.AlbumID, a.ArtistID
+        FROM import_track_artists t
+        JOIN Albums al ON al.Title = t.Album AND al.Year = t.Year
+        JOIN Artists a ON a.Name = t.Artist
+        WHERE NOT EXISTS (SELECT 1 FROM AlbumArtists aa WHERE aa.AlbumID = al.AlbumID AND aa.ArtistID = a.ArtistID)
+        ORDER BY 1, 2
+        ON CONFLICT DO NOTHING;
+    """),
+    ("SongCategories", """
+        INSERT INTO SongCategories (SongID, CategoryID)
+        SELECT DISTINCT s.SongID, c.CategoryID
+        FROM import_track_categories t
+        JOIN Songs s ON s.Title = t.Song
+        JOIN Categories c ON c.Name = t.Category
+        WHERE NOT EXISTS (SELECT 1 FROM SongCategories sc WHERE sc.SongID = s.SongID AND sc.CategoryID = c.CategoryID)
+        ORDER BY 1, 2
+        ON CONFLICT DO NOTHING;
+    """),
+)
+
+IMPORT_STAGING_TABLES = ("import_tracks", "import_track_artists", "import_track_categories")
+IMPORT_STAGING_SQL = """
+    CREATE TEMP TABLE import_tracks (Song text, Album text, Year int) ON COMMIT DROP;
+    CREATE TEMP TABLE import_track_artists (Song text, Album text, Year int, Artist text) ON COMMIT DROP;
+    CREATE TEMP TABLE import_track_categories (Song text, Category text) ON COMMIT DROP;
+"""
+
+IMPORT_SONG_DETAILS_SQL = """
+    WITH imported AS (
+        SELECT DISTINCT s.SongID
+        FROM Songs s
+        JOIN import_tracks t ON t.Song = s.Title
+    )
+    SELECT count(*), refresh_song_details(array_agg(SongID)) FROM imported;
+"""
+
+def clean_search_indexes(cur):
+    # GIN indexes queue bulk inserts in a pending list that every search scans until vacuum
+    cur.execute("""
+        SELECT gin_clean_pending_list(index_name)
+        FROM unnest(%s::text[]) AS names (name), to_regclass(name) AS index_name
+        WHERE index_name IS NOT NULL;
+    """, ([f"{table.lower()}_{column.lower()}_{kind}_idx"
+           for table, column in SEARCH_COLUMNS for kind in ("text", "trgm")],))
+
+def import_catalog(conn, path):
+    start = time.perf_counter()
+    spools = [tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_SIZE, mode="w+", encoding="utf-8", newline="")
+              for _ in range(3)]
+    try:
+        tracks, track_artists, track_categories = spools
+        try:
+            count = stage_catalog(path, tracks, track_artists, track_categories)
+        except (OSError, ValueError, csv.Error) as e:
+            print(f"Could not read catalog '{path}': {e}. Import canceled.")
+            return 1
+        if not count:
+            print("The catalog file contains no tracks.")
+            return 0
 
-        print("Available Categories:")
-        for cat_row in all_categories:
-            print(f"- {cat_row[0]}")
+        with conn.cursor() as cur:
+            try:
+                cur.execute("SET LOCAL work_mem = %s;", (IMPORT_WORK_MEM,))
+                cur.execute("SET LOCAL album.defer_song_details = on;")
+                cur.execute(IMPORT_STAGING_SQL)
+                for table, spool in zip(IMPORT_STAGING_TABLES, spools):
+                    spool.seek(0)
+                    cur.copy_expert(f"COPY {table} FROM STDIN;", spool)
+                cur.execute("ANALYZE import_tracks; ANALYZE import_track_artists; ANALYZE import_track_categories;")
+                staged = time.perf_counter()
+
+                for table, statement in IMPORT_STATEMENTS:
+                    cur.execute(statement)
+                    print(f"{table}: {cur.rowcount} new rows")
+
+                # Refresh the imported songs' details once, with statistics that include the new rows
+                cur.execute("ANALYZE Songs; ANALYZE SongAlbums; ANALYZE SongArtists; ANALYZE SongCategories;")
+                cur.execute(IMPORT_SONG_DETAILS_SQL)
+                print(f"SongDetails: {cur.fetchone()[0]} songs refreshed")
+
+                clean_search_indexes(cur)
 
-    category_name = input("Enter the category name to edit: ")
-    with conn.cursor() as cur:
-        cur.execute("SELECT CategoryID FROM Categories WHERE Name = %s;", (category_name,))
-        category = cur.fetchone()
-        if not category:
-            print("Category not found.")
-            return
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"An error occurred while importing the catalog: {e}. Import canceled.")
+                return 1
+    finally:
+        for spool in spools:
+            spool.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Imported {count} tracks in {elapsed:.1f}s ({count / elapsed:.0f} rows/s, "
+          f"{staged - start:.1f}s staging, {elapsed - (staged - start):.1f}s resolving).")
+    return 0
+
+# Parallel imports split the dump into chunks by each track's first artist, so
+# an artist's albums and songs load together. Worker processes load one chunk
+# per transaction and checkpoint it; rerunning an interrupted import of the
+# same file skips the chunks that already committed
+IMPORT_PARTITIONS = 16
+IMPORT_CHUNK_TRACKS = 50000
+# Attempts per chunk when two workers deadlock on keys they both insert
+IMPORT_RETRIES = 3
+IMPORT_DIMENSIONS = "dimensions"
+
+def import_key(path):
+    # Identifies the dump by path, size and modification time, so an edited
+    # file starts over instead of resuming someone else's checkpoints
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def chunk_files(directory, chunk):
+    return [os.path.join(directory, f"{chunk}.{table}") for table in IMPORT_STAGING_TABLES]
+
+def split_catalog(path, directory, done):
+    # Writes the COPY files of every chunk not in done, plus every artist and
+    # category name for the dimension load; returns the chunks and track count
+    names = [open(os.path.join(directory, f"{IMPORT_DIMENSIONS}.{table}"), "w", encoding="utf-8", newline="")
+             for table in IMPORT_STAGING_TABLES[1:]]
+    partitions = {}
+    chunks = []
+    count = 0
+    start = time.perf_counter()
+    try:
+        for count, track in enumerate(read_catalog(path), start=1):
+            song, album, year, artists, categories = parse_track(count, track)
+            for artist in artists:
+                copy_row(names[0], None, None, None, artist)
+            for category in categories:
+                copy_row(names[1], None, category)
+
+            number = zlib.crc32(artists[0].encode()) % IMPORT_PARTITIONS
+            partition = partitions.setdefault(number, {"sequence": -1, "tracks": IMPORT_CHUNK_TRACKS, "files": []})
+            if partition["tracks"] == IMPORT_CHUNK_TRACKS:
+                for f in partition["files"]:
+                    f.close()
+                partition["sequence"] += 1
+                partition["tracks"] = 0
+                chunk = f"{number:02d}-{partition['sequence']:04d}"
+                chunks.append(chunk)
+                partition["files"] = [] if chunk in done else [
+                    open(name, "w", encoding="utf-8", newline="") for name in chunk_files(directory, chunk)]
+            partition["tracks"] += 1
+            if partition["files"]:
+                write_track(*partition["files"], song, album, year, artists, categories)
+
+            if count % IMPORT_PROGRESS_EVERY == 0:
+                elapsed = time.perf_counter() - start
+                print(f"Split {count} tracks ({count / elapsed:.0f} rows/s)...")
+    finally:
+        for f in names + [f for partition in partitions.values() for f in partition["files"]]:
+            f.close()
+    return chunks, count
 
-        new_name = input("Enter the new category name: ")
-        cur.execute("SELECT 1 FROM Categories WHERE Name = %s;", (new_name,))
-        if cur.fetchone():
-            print(f"A category with the name '{new_name}' already exists. Operation canceled.")
-            return
-        cur.execute("UPDATE Categories SET Name = %s WHERE CategoryID = %s;", (new_name, category[0]))
-        conn.commit()
-        print("Category name updated successfully.")
+def worker_connection(dsn):
+    return psycopg2.connect(dsn, connection_factory=CatalogConnection,
+                            options=f"-c statement_timeout={DB_STATEMENT_TIMEOUT}")
 
-def edit_song(conn):
-    with conn.cursor() as cur:
-        # Show all available songs
+def retry_deadlocks(conn, work):
+    for attempt in range(1, IMPORT_RETRIES + 1):
+        try:
+            with conn.cursor() as cur:
+                result = work(cur)
+            conn.commit()
+            return result
+        except (psycopg2.errors.DeadlockDetected, psycopg2.errors.SerializationFailure):
+            conn.rollback()
+            if attempt == IMPORT_RETRIES:
+                raise
+
+def stage_files(cur, paths):
+    cur.execute(IMPORT_STAGING_SQL)
+    for table, path in zip(IMPORT_STAGING_TABLES, paths):
+        with open(path, encoding="utf-8", newline="") as f:
+            cur.copy_expert(f"COPY {table} FROM STDIN;", f)
+    cur.execute("ANALYZE import_tracks; ANALYZE import_track_artists; ANALYZE import_track_categories;")
+
+def import_chunk(dsn, key, chunk, directory):
+    # Runs in a worker process. Artists and categories are already loaded, so
+    # only albums, songs and links are inserted; SongDetails is left to the
+    # coordinator. The rows are visible once the chunk commits, so the chunk
+    # bumps the catalog version itself rather than once per statement
+    def load(cur):
+        cur.execute("SET LOCAL work_mem = %s;", (IMPORT_WORK_MEM,))
+        cur.execute("SET LOCAL album.defer_song_details = on;")
+        cur.execute("SET LOCAL album.defer_catalog_version = on;")
+        stage_files(cur, chunk_files(directory, chunk))
+        rows = {}
+        for table, statement in IMPORT_STATEMENTS:
+            if table not in ("Artists", "Categories"):
+                cur.execute(statement)
+                rows[table] = cur.rowcount
         cur.execute("""
-            SELECT s.Title
-            FROM Songs s
-            ORDER BY s.Title;
-        """)
-        all_songs = cur.fetchall()
-        if not all_songs:
-            print("No songs found in the database.")
-            return
+            INSERT INTO ImportCheckpoints (ImportKey, Chunk, Tracks, SongIDs)
+            SELECT %s, %s, (SELECT count(*) FROM import_tracks),
+                   ARRAY(SELECT DISTINCT s.SongID FROM Songs s JOIN import_tracks t ON t.Song = s.Title)
+            RETURNING Tracks;
+        """, (key, chunk))
+        tracks = cur.fetchone()[0]
+        # Last, so concurrent chunks only queue on the version row while committing
+        cur.execute("UPDATE CatalogVersion SET Version = Version + 1;")
+        return chunk, tracks, rows
+
+    conn = worker_connection(dsn)
+    try:
+        return retry_deadlocks(conn, load)
+    finally:
+        conn.close()
 
-        print("Available Songs:")
-        for song_row in all_songs:
-            title = song_row[0]
-            print(f"- {title}")
+def refresh_chunk(dsn, key, chunk):
+    # Every chunk has committed by now, so a refresh sees all of a song's
+    # links; songs shared between chunks are simply refreshed twice
+    def refresh(cur):
+        cur.execute("""
+            UPDATE ImportCheckpoints SET Refreshed = true
+            WHERE ImportKey = %s AND Chunk = %s AND NOT Refreshed
+            RETURNING SongIDs;
+        """, (key, chunk))
+        row = cur.fetchone()
+        if row is None:
+            return 0
+        cur.execute("SELECT refresh_song_details(%s);", (row[0],))
+        cur.execute("UPDATE CatalogVersion SET Version = Version + 1;")
+        return len(row[0])
+
+    conn = worker_connection(dsn)
+    try:
+        return retry_deadlocks(conn, refresh)
+    finally:
+        conn.close()
 
-    song_title = input("Enter the song title to edit: ")
+def run_workers(workers, function, calls, describe):
+    # Fresh interpreters rather than forks, so no worker shares the parent's sockets
+    with concurrent.futures.ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(function, *call) for call in calls]
+        try:
+            for done, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+                describe(done, len(futures), future.result())
+        except BaseException:
+            pool.shutdown(cancel_futures=True)
+            raise
+
+def import_catalog_parallel(conn, path, workers):
+    start = time.perf_counter()
+    try:
+        key = import_key(path)
+    except OSError as e:
+        print(f"Could not read catalog '{path}': {e}. Import canceled.")
+        return 1
     with conn.cursor() as cur:
-        cur.execute("SELECT SongID FROM Songs WHERE Title = %s;", (song_title,))
-        song = cur.fetchone()
-        if not song:
-            print("Song not found.")
-            return
+        cur.execute("SELECT Chunk, Refreshed FROM ImportCheckpoints WHERE ImportKey = %s;", (key,))
+        done = dict(cur.fetchall())
+    conn.rollback()
+    if done:
+        print(f"Resuming the import of '{path}': {len(done)} checkpoints found.")
+
+    with tempfile.TemporaryDirectory(prefix="album-import-") as directory:
+        try:
+            chunks, count = split_catalog(path, directory, done)
+        except (OSError, ValueError, csv.Error) as e:
+            print(f"Could not read catalog '{path}': {e}. Import canceled.")
+            return 1
+        if not count:
+            print("The catalog file contains no tracks.")
+            return 0
+        print(f"Split {count} tracks into {len(chunks)} chunks.")
 
-        new_title = input("Enter the new song title: ")
-        cur.execute("SELECT 1 FROM Songs WHERE Title = %s;", (new_title,))
-        if cur.fetchone():
-            print(f"A song with the title '{new_title}' already exists. Operation canceled.")
+        try:
+            # Shared dimensions first, in one transaction, so workers never race to create them
+            if IMPORT_DIMENSIONS not in done:
+                with conn.cursor() as cur:
+                    cur.execute("SET LOCAL album.defer_catalog_version = on;")
+                    stage_files(cur, [os.devnull] + [os.path.join(directory, f"{IMPORT_DIMENSIONS}.{table}")
+                                                     for table in IMPORT_STAGING_TABLES[1:]])
+                    for table, statement in IMPORT_STATEMENTS[:2]:
+                        cur.execute(statement)
+                        print(f"{table}: {cur.rowcount} new rows")
+                    cur.execute("UPDATE CatalogVersion SET Version = Version + 1;")
+                    cur.execute("INSERT INTO ImportCheckpoints (ImportKey, Chunk, Tracks, Refreshed) "
+                                "VALUES (%s, %s, 0, true);", (key, IMPORT_DIMENSIONS))
+                conn.commit()
+            staged = time.perf_counter()
+
+            totals = {"tracks": 0}
+            def chunk_loaded(finished, total, result):
+                chunk, tracks, rows = result
+                for table, rowcount in {"tracks": tracks, **rows}.items():
+                    totals[table] = totals.get(table, 0) + rowcount
+                elapsed = time.perf_counter() - staged
+                print(f"Chunk {chunk}: {tracks} tracks ({finished}/{total} chunks, "
+                      f"{totals['tracks'] / elapsed:.0f} tracks/s)")
+            run_workers(workers, import_chunk, [(DB_DSN, key, chunk, directory) for chunk in chunks
+                                                if chunk not in done], chunk_loaded)
+            for table, rowcount in totals.items():
+                if table != "tracks":
+                    print(f"{table}: {rowcount} new rows")
+
+            with conn.cursor() as cur:
+                cur.execute("ANALYZE Songs; ANALYZE SongAlbums; ANALYZE SongArtists; ANALYZE SongCategories;")
+            conn.commit()
+            refreshed = []
+            run_workers(workers, refresh_chunk, [(DB_DSN, key, chunk) for chunk in chunks if not done.get(chunk)],
+                        lambda finished, total, songs: refreshed.append(songs))
+            print(f"SongDetails: {sum(refreshed)} songs refreshed")
+
+            # Every committed step has bumped the version; the checkpoints are no longer needed
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM ImportCheckpoints WHERE ImportKey = %s;", (key,))
+                clean_search_indexes(cur)
+            conn.commit()
+        except KeyboardInterrupt:
+            conn.rollback()
+            print("Import interrupted. Committed chunks are kept; run the import again to resume.")
+            return 1
+        except Exception as e:
+            conn.rollback()
+            print(f"An error occurred while importing the catalog: {e}. "
+                  f"Committed chunks are kept; run the import again to resume.")
+            return 1
+
+    elapsed = time.perf_counter() - start
+    print(f"Imported {count} tracks in {elapsed:.1f}s with {workers} workers ({count / elapsed:.0f} rows/s, "
+          f"{staged - start:.1f}s splitting, {elapsed - (staged - start):.1f}s loading).")
+    return 0
+
+# Exports stream one entity through COPY TO STDOUT (CSV) or a server-side
+# cursor (JSON lines, Parquet), so memory stays flat however large the catalog.
+# The tracks entity has the import format, so an export can be imported again
+EXPORT_FORMATS = ("jsonl", "csv", "parquet")
+EXPORT_PARQUET_ROWS = 50000
+
+EXPORT_TRACKS_SQL = """
+    SELECT d.Title, al.Title, al.Year, d.Artists, d.Categories
+    FROM SongAlbums t
+    JOIN SongDetails d ON d.SongID = t.SongID
+    JOIN Albums al ON al.AlbumID = t.AlbumID
+    {where}
+    ORDER BY t.SongID, t.AlbumID
+    {limit};
+"""
+
+# entity -> query, field names, list-valued fields, and the song ID expression,
+# or the junction table and key column linking a row to its songs
+EXPORT_ENTITIES = {
+    "tracks": (EXPORT_TRACKS_SQL, ("song", "album", "year", "artists", "categories"), ("artists", "categories"),
+               "t.SongID"),
+    "songs": (LIST_SONGS_SQL, LISTING_FIELDS["song"], ("albums", "artists", "categories"), "d.SongID"),
+    "albums": (LIST_ALBUMS_SQL, LISTING_FIELDS["album"], ("artists", "songs"), ("SongAlbums", "AlbumID", "al.AlbumID")),
+    "artists": (LIST_ARTISTS_SQL, LISTING_FIELDS["artist"], ("albums",), ("SongArtists", "ArtistID", "a.ArtistID")),
+    "categories": (LIST_CATEGORIES_SQL, LISTING_FIELDS["category"], ("songs",),
+                   ("SongCategories", "CategoryID", "c.CategoryID")),
+}
+
+# Song filters, shared with the query functions' meaning: songs by an artist,
+# songs on an album released in a year, songs in a category
+EXPORT_SONG_FILTERS = {
+    "artist": """EXISTS (SELECT 1 FROM SongArtists fa JOIN Artists fx ON fx.ArtistID = fa.ArtistID
+                         WHERE fa.SongID = {song} AND fx.Name = %(artist)s)""",
+    "year": """EXISTS (SELECT 1 FROM SongAlbums fa JOIN Albums fx ON fx.AlbumID = fa.AlbumID
+                       WHERE fa.SongID = {song} AND fx.Year = %(year)s)""",
+    "category": """EXISTS (SELECT 1 FROM SongCategories fa JOIN Categories fx ON fx.CategoryID = fa.CategoryID
+                           WHERE fa.SongID = {song} AND fx.Name = %(category)s)""",
+}
+# Filters that apply to an entity's own columns rather than through its songs
+EXPORT_DIRECT_FILTERS = {
+    ("tracks", "year"): "al.Year = %(year)s",
+    ("albums", "year"): "al.Year = %(year)s",
+    ("artists", "artist"): "a.Name = %(artist)s",
+    ("categories", "category"): "c.Name = %(category)s",
+}
+
+def export_query(entity, filters):
+    sql, fields, _, songs = EXPORT_ENTITIES[entity]
+    conditions = [EXPORT_DIRECT_FILTERS[entity, name] for name in filters if (entity, name) in EXPORT_DIRECT_FILTERS]
+    song_filters = [EXPORT_SONG_FILTERS[name] for name in filters if (entity, name) not in EXPORT_DIRECT_FILTERS]
+    if song_filters and isinstance(songs, str):
+        conditions += [song_filter.format(song=songs) for song_filter in song_filters]
+    elif song_filters:
+        table, column, row_id = songs
+        conditions.append(f"EXISTS (SELECT 1 FROM {table} fs WHERE fs.{column} = {row_id} AND "
+                          + " AND ".join(song_filter.format(song="fs.SongID") for song_filter in song_filters) + ")")
+    where = "WHERE " + " AND ".join(conditions) if conditions else ""
+    return sql.format(where=where, limit="").strip().rstrip(";"), fields
+
+def parquet_writer(path, entity):
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise CatalogError("Parquet export needs pyarrow: pip install pyarrow.")
+    _, fields, list_fields, _ = EXPORT_ENTITIES[entity]
+    types = {"id": pyarrow.int32(), "year": pyarrow.int32()}
+    schema = pyarrow.schema([(field, pyarrow.list_(pyarrow.string()) if field in list_fields
+                              else types.get(field, pyarrow.string())) for field in fields])
+    return pyarrow, pyarrow.parquet.ParquetWriter(path, schema), schema
+
+def export_catalog(conn, entity, output, export_format, filters):
+    # output is a path or a text stream; returns the number of exported rows
+    sql, fields = export_query(entity, filters)
+    _, _, list_fields, _ = EXPORT_ENTITIES[entity]
+    count = 0
+    if export_format == "csv":
+        # Lists are joined the way the importer splits them
+        columns = ", ".join(f"array_to_string(q.{field}, ', ') AS {field}" if field in list_fields else f"q.{field}"
+                            for field in fields)
+        with conn.cursor() as cur:
+            query = cur.mogrify(f"SELECT {columns} FROM ({sql}) AS q ({', '.join(fields)})", filters).decode()
+            cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER);", output)
+            count = cur.rowcount
+    elif export_format == "jsonl":
+        for row in stream_rows(conn, sql, filters):
+            output.write(json.dumps(dict(zip(fields, row)), ensure_ascii=False) + "\n")
+            count += 1
+    else:
+        pyarrow, writer, schema = parquet_writer(output, entity)
+        with writer:
+            rows = []
+            for row in stream_rows(conn, sql, filters):
+                rows.append(dict(zip(fields, row)))
+                if len(rows) == EXPORT_PARQUET_ROWS:
+                    writer.write_batch(pyarrow.RecordBatch.from_pylist(rows, schema=schema))
+                    count += len(rows)
+                    rows = []
+            if rows:
+                writer.write_batch(pyarrow.RecordBatch.from_pylist(rows, schema=schema))
+                count += len(rows)
+    return count
+
+def export(conn, args):
+    extension = os.path.splitext(args.output)[1].lstrip(".").lower()
+    export_format = args.format or (extension if extension in EXPORT_FORMATS else "jsonl")
+    if export_format == "parquet" and args.output == "-":
+        raise CatalogError("Parquet exports need an output file.")
+    filters = {name: getattr(args, name) for name in EXPORT_SONG_FILTERS if getattr(args, name) is not None}
+    start = time.perf_counter()
+    with conn.cursor() as cur:
+        # Runs in one read-only snapshot, so concurrent writes never tear the export
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;")
+    try:
+        if args.output == "-" or export_format == "parquet":
+            count = export_catalog(conn, args.entity, sys.stdout if args.output == "-" else args.output,
+                                   export_format, filters)
+        else:
+            with open(args.output, "w", encoding="utf-8", newline="") as f:
+                count = export_catalog(conn, args.entity, f, export_format, filters)
+    finally:
+        conn.rollback()
+    print(f"Exported {count} {args.entity} as {export_format} in {time.perf_counter() - start:.1f}s.",
+          file=sys.stderr)
+    return 0
+
+# Catalog profile in one statement, so every figure comes from one snapshot.
+# Each junction table is read once with GROUPING SETS giving the link counts
+# of both of its sides, Albums once with a ROLLUP over Year; entities missing
+# from a side of a junction are the gaps. Snapshots have no version
+STATS_TOP = 20
+# name -> junction table, left column, right column
+STATS_LINKS = {
+    "song_artists": ("SongArtists", "SongID", "ArtistID"),
+    "song_albums": ("SongAlbums", "SongID", "AlbumID"),
+    "album_artists": ("AlbumArtists", "AlbumID", "ArtistID"),
+    "song_categories": ("SongCategories", "SongID", "CategoryID"),
+}
+STATS_GAPS = (
+    ("artists_without_songs", "artists", "song_artists", "ArtistID"),
+    ("artists_without_albums", "artists", "album_artists", "ArtistID"),
+    ("albums_without_songs", "albums", "song_albums", "AlbumID"),
+    ("songs_without_artists", "songs", "song_artists", "SongID"),
+    ("songs_without_albums", "songs", "song_albums", "SongID"),
+    ("songs_without_categories", "songs", "song_categories", "SongID"),
+    ("categories_without_songs", "categories", "song_categories", "CategoryID"),
+)
+
+def stats_sql(schema=""):
+    ctes = [f"""
+        totals AS (
+            SELECT (SELECT count(*) FROM {schema}Artists) AS artists,
+                   (SELECT count(*) FROM {schema}Songs) AS songs,
+                   (SELECT count(*) FROM {schema}Categories) AS categories
+        ), albums_per_year AS (
+            SELECT Year, GROUPING(Year) AS total, count(*) AS albums
+            FROM {schema}Albums
+            GROUP BY ROLLUP (Year)
+        )"""]
+    for name, (table, left, right) in STATS_LINKS.items():
+        ctes.append(f"""
+        {name} AS (
+            SELECT {left}, {right}, GROUPING({left}) AS by_{right.lower()}, count(*) AS links
+            FROM {schema}{table}
+            GROUP BY GROUPING SETS (({left}), ({right}))
+        )""")
+    albums = "(SELECT albums FROM albums_per_year WHERE total = 1)"
+    totals = {"artists": "(SELECT artists FROM totals)", "albums": f"COALESCE({albums}, 0)",
+              "songs": "(SELECT songs FROM totals)", "categories": "(SELECT categories FROM totals)"}
+    links = ", ".join(f"'{name}', (SELECT COALESCE(sum(links), 0) FROM {name} WHERE by_{right.lower()} = 0)"
+                      for name, (_, _, right) in STATS_LINKS.items())
+    gaps = ", ".join(f"'{gap}', {totals[entity]} - (SELECT count({column}) FROM {link} WHERE {column} IS NOT NULL)"
+                     for gap, entity, link, column in STATS_GAPS)
+    return f"""
+        WITH {",".join(ctes)}
+        SELECT json_build_object(
+            'totals', json_build_object({", ".join(f"'{key}', {value}" for key, value in totals.items())}),
+            'links', json_build_object({links}),
+            'songs_per_artist', (
+                SELECT json_build_object(
+                    'min', COALESCE(min(links), 0), 'median', COALESCE(percentile_disc(0.5) WITHIN GROUP (ORDER BY links), 0),
+                    'mean', COALESCE(round(avg(links), 2), 0), 'max', COALESCE(max(links), 0))
+                FROM song_artists WHERE by_artistid = 1),
+            'top_artists', (
+                SELECT COALESCE(json_agg(json_build_array(Name, links) ORDER BY links DESC, Name), '[]')
+                FROM (SELECT a.Name, sa.links
+                      FROM song_artists sa JOIN {schema}Artists a ON a.ArtistID = sa.ArtistID
+                      WHERE sa.by_artistid = 1
+                      ORDER BY sa.links DESC, a.Name
+                      LIMIT {STATS_TOP}) top),
+            'albums_per_year', (
+                SELECT COALESCE(json_object_agg(COALESCE(Year::text, 'unknown'), albums ORDER BY Year), '{{}}')
+                FROM albums_per_year WHERE total = 0),
+            'songs_per_category', (
+                SELECT COALESCE(json_object_agg(c.Name, COALESCE(sc.links, 0) ORDER BY c.Name), '{{}}')
+                FROM {schema}Categories c
+                LEFT JOIN song_categories sc ON sc.CategoryID = c.CategoryID AND sc.by_categoryid = 1),
+            'gaps', json_build_object({gaps})
+        ), {"NULL::bigint" if schema else "(SELECT Version FROM CatalogVersion)"};
+    """
+
+def catalog_stats(cur, snapshot=None):
+    # The profile of the live catalog, or of a saved snapshot, as a dict
+    start = time.perf_counter()
+    if snapshot is None:
+        cur.execute(stats_sql())
+    else:
+        if not snapshot_exists(cur, snapshot):
+            raise CatalogError(f"Snapshot '{snapshot}' does not exist.")
+        cur.execute(stats_sql(f"{snapshot_schema(snapshot)}."))
+    figures, version = cur.fetchone()
+    profile = {"version": version, "snapshot": snapshot, **figures}
+    profile["seconds"] = round(time.perf_counter() - start, 3)
+    return profile
+
+def flatten_stats(profile, prefix=""):
+    # Numeric figures by dotted path, e.g. gaps.songs_without_albums
+    figures = {}
+    for key, value in profile.items():
+        if key in ("version", "seconds", "changes"):
+            continue
+        if isinstance(value, dict):
+            figures.update(flatten_stats(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            figures[f"{prefix}{key}"] = value
+    return figures
+
+def stats_changes(previous, current):
+    # path -> [before, after] for every figure that moved
+    before, after = flatten_stats(previous), flatten_stats(current)
+    return {key: [before.get(key, 0), after.get(key, 0)]
+            for key in sorted(before.keys() | after.keys()) if before.get(key, 0) != after.get(key, 0)}
+
+def print_stats(profile):
+    source = f"snapshot '{profile['snapshot']}'" if profile["snapshot"] else f"version {profile['version']}"
+    print(f"Catalog statistics ({source}, {profile['seconds']:.2f}s)")
+    print("Totals: " + ", ".join(f"{count} {key}" for key, count in profile["totals"].items()))
+    print("Links: " + ", ".join(f"{count} {key.replace('_', '-')}" for key, count in profile["links"].items()))
+    spread = profile["songs_per_artist"]
+    print(f"Songs per artist: min {spread['min']}, median {spread['median']}, mean {spread['mean']}, max {spread['max']}")
+    if profile["top_artists"]:
+        print("Top artists by songs:")
+        for name, songs in profile["top_artists"]:
+            print(f"  {songs:8} {name}")
+    if profile["albums_per_year"]:
+        print("Albums per year:")
+        for year, albums in profile["albums_per_year"].items():
+            print(f"  {year:>8} {albums}")
+    categories = sorted(profile["songs_per_category"].items(), key=lambda item: (-item[1], item[0]))
+    if categories:
+        print("Songs per category:")
+        for name, songs in categories[:STATS_TOP]:
+            print(f"  {songs:8} {name}")
+        if len(categories) > STATS_TOP:
+            print(f"  ... and {len(categories) - STATS_TOP} more categories")
+    print("Gaps:")
+    for key, count in profile["gaps"].items():
+        print(f"  {count:8} {key.replace('_', ' ')}")
+    if "changes" in profile:
+        print(f"Changes since {profile['compared_with']}:")
+        for key, (before, after) in profile["changes"].items():
+            print(f"  {key}: {before} -> {after} ({round(after - before, 2):+})")
+        if not profile["changes"]:
+            print("  none")
+
+# Benchmarks run every catalog operation against a synthetic catalog; each
+# run is rolled back, so every repeat sees the same data
+BENCH_REPEAT = 20
+BENCH_YEARS = (1950, 2025)
+
+def skewed_count(rng, mean, skew):
+    # Pareto-distributed count >= 1 with roughly the given mean; a lower skew
+    # gives a longer tail of very large artists and albums
+    if mean <= 1:
+        return 1
+    return max(1, round(mean * rng.paretovariate(skew) * (skew - 1) / skew))
+
+def zipf_weights(count, skew):
+    return list(itertools.accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+
+def generate_catalog(path, artists, albums_per_artist, songs_per_album, categories, categories_per_song,
+                     skew=1.5, seed=1):
+    # Writes a JSON-lines catalog dump; popular categories and artists (for
+    # guest appearances) are drawn from a Zipf distribution
+    rng = random.Random(seed)
+    category_names = [f"Category {i}" for i in range(1, categories + 1)]
+    category_weights = zipf_weights(categories, skew)
+    artist_weights = zipf_weights(artists, skew)
+    tracks = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for artist in range(1, artists + 1):
+            for album in range(1, skewed_count(rng, albums_per_artist, skew) + 1):
+                year = rng.randint(*BENCH_YEARS)
+                for song in range(1, skewed_count(rng, songs_per_album, skew) + 1):
+                    artist_names = [f"Artist {artist}"]
+                    if rng.random() < 0.1:
+                        guest = rng.choices(range(1, artists + 1), cum_weights=artist_weights)[0]
+                        if guest != artist:
+                            artist_names.append(f"Artist {guest}")
+                    song_categories = rng.choices(category_names, cum_weights=category_weights,
+                                                  k=min(categories, skewed_count(rng, categories_per_song, skew)))
+                    f.write(json.dumps({"song": f"Song {artist}-{album}-{song}", "album": f"Album {artist}-{album}",
+                                        "year": year, "artists": artist_names,
+                                        "categories": list(dict.fromkeys(song_categories))}) + "\n")
+                    tracks += 1
+    return tracks
+
+# Operation name -> function(cur, sample); the sample holds one random
+# existing artist, album, year, category and song plus a unique number n
+BENCH_OPERATIONS = {
+    "create_artist": lambda cur, s: add_artist(
+        cur, f"Bench Artist {s['n']}", [(f"Bench Song {s['n']}", [s['album'], f"Bench Album {s['n']}"], [s['category']])],
+        {f"Bench Album {s['n']}": s['year']}),
+    "create_album": lambda cur, s: add_album(
+        cur, f"Bench Album {s['n']}", s['year'], [s['artist']], [(f"Bench Song {s['n']}", [s['category']])]),
+    "create_category": lambda cur, s: add_category(cur, f"Bench Category {s['n']}"),
+    "create_song": lambda cur, s: add_song(cur, f"Bench Song {s['n']}", [s['artist']], [s['album']], [s['category']]),
+    "list_artists": lambda cur, s: list_artists(cur.connection, page_size=0),
+    "list_albums": lambda cur, s: list_albums(cur.connection, page_size=0),
+    "list_categories": lambda cur, s: list_categories(cur.connection, page_size=0),
+    "list_songs": lambda cur, s: list_songs(cur.connection, page_size=0),
+    "edit_artist": lambda cur, s: rename_artist(cur, s['artist'], f"Bench Artist {s['n']}"),
+    "edit_album": lambda cur, s: rename_album(cur, s['album'], f"Bench Album {s['n']}"),
+    "edit_album_year": lambda cur, s: set_album_year(cur, s['album'], s['year'] + 1000),
+    "edit_category": lambda cur, s: rename_category(cur, s['category'], f"Bench Category {s['n']}"),
+    "edit_song": lambda cur, s: rename_song(cur, s['song'], f"Bench Song {s['n']}"),
+    "delete_artist": lambda cur, s: remove(cur, "artist", s['artist']),
+    "delete_album": lambda cur, s: remove(cur, "album", s['album']),
+    "delete_category": lambda cur, s: remove(cur, "category", s['category']),
+    "delete_song": lambda cur, s: remove(cur, "song", s['song']),
+    "list_songs_by_artist": lambda cur, s: songs_by_artist(cur, s['artist']),
+    "list_artists_with_albums_by_year": lambda cur, s: artists_by_year(cur, s['year']),
+    "list_albums_by_category": lambda cur, s: albums_by_category(cur, s['category']),
+    "collect_orphans": lambda cur, s: collect_orphans(cur.connection, dry_run=True),
+}
+
+def catalog_sizes(cur):
+    cur.execute("""
+        SELECT (SELECT count(*) FROM Artists), (SELECT count(*) FROM Albums),
+               (SELECT count(*) FROM Songs), (SELECT count(*) FROM Categories),
+               (SELECT count(*) FROM SongArtists) + (SELECT count(*) FROM SongAlbums)
+               + (SELECT count(*) FROM SongCategories) + (SELECT count(*) FROM AlbumArtists);
+    """)
+    return dict(zip(("artists", "albums", "songs", "categories", "links"), cur.fetchone()))
+
+def bench_samples(cur, count, seed):
+    # Draws the per-repeat targets up front so every operation sees the same ones
+    rng = random.Random(seed)
+    names = {}
+    for key, query in (("artist", "SELECT Name FROM Artists ORDER BY ArtistID;"),
+                       ("album", "SELECT Title, Year FROM Albums ORDER BY AlbumID;"),
+                       ("category", "SELECT Name FROM Categories ORDER BY CategoryID;"),
+                       ("song", "SELECT Title FROM Songs ORDER BY SongID;")):
+        cur.execute(query)
+        names[key] = cur.fetchall()
+    samples = []
+    for n in range(1, count + 1):
+        album, year = rng.choice(names["album"])
+        samples.append({"n": n, "artist": rng.choice(names["artist"])[0], "album": album, "year": year,
+                        "category": rng.choice(names["category"])[0], "song": rng.choice(names["song"])[0]})
+    return samples
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+def time_operation(conn, operation, samples):
+    timings = []
+    statements = 0
+    errors = 0
+    with open(os.devnull, "w") as devnull:
+        for sample in samples:
+            before = conn.statement_count
+            start = time.perf_counter()
+            try:
+                with redirect_stdout(devnull), conn.cursor() as cur:
+                    operation(cur, sample)
+            except (CatalogError, psycopg2.Error):
+                errors += 1
+            timings.append(time.perf_counter() - start)
+            statements += conn.statement_count - before
+            conn.rollback()
+    timings.sort()
+    return {"runs": len(timings), "errors": errors,
+            "mean_ms": sum(timings) / len(timings) * 1000, "median_ms": percentile(timings, 0.5) * 1000,
+            "p95_ms": percentile(timings, 0.95) * 1000, "min_ms": timings[0] * 1000, "max_ms": timings[-1] * 1000,
+            "statements": statements / len(timings)}
+
+def run_benchmark(conn, operations=None, repeat=None, seed=1):
+    repeat = repeat or BENCH_REPEAT
+    with conn.cursor() as cur:
+        sizes = catalog_sizes(cur)
+        if not sizes["songs"]:
+            raise CatalogError("The catalog is empty; generate one first.")
+        samples = bench_samples(cur, repeat, seed)
+        cur.execute("SHOW server_version;")
+        server_version = cur.fetchone()[0]
+    conn.rollback()
+
+    results = {}
+    for name in operations or BENCH_OPERATIONS:
+        results[name] = time_operation(conn, BENCH_OPERATIONS[name], samples)
+        print(f"{name:34} {results[name]['median_ms']:10.2f} ms median {results[name]['p95_ms']:10.2f} ms p95 "
+              f"{results[name]['statements']:8.1f} statements" +
+              (f" ({results[name]['errors']} errors)" if results[name]['errors'] else ""))
+    return {"created": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "server_version": server_version,
+            "catalog": sizes, "repeat": repeat, "seed": seed, "operations": results}
+
+ASYNC_BENCH_QUERIES = (("songs_by_artist", "artist"), ("artists_by_year", "year"),
+                       ("albums_by_category", "category"))
+
+async def async_read_benchmark(samples, clients, pipeline=1, rounds=None):
+    # Every client replays the sampled read queries; with pipeline > 1 it sends
+    # that many per round trip through query_many
+    calls = [(name, sample[key]) for sample in samples for name, key in ASYNC_BENCH_QUERIES]
+    rounds = rounds or max(1, 1000 // (clients * pipeline))
+    latencies = []
+
+    async def client(catalog, offset):
+        for n in range(rounds):
+            start = offset + n * pipeline
+            batch = [calls[(start + i) % len(calls)] for i in range(pipeline)]
+            began = time.perf_counter()
+            await catalog.query_many(batch)
+            latencies.append(time.perf_counter() - began)
+
+    # Clients queue for the pool for as long as the run takes
+    try:
+        catalog = AsyncCatalog(DB_DSN, min_size=DB_MIN_CONNECTIONS, max_size=min(clients, DB_MAX_CONNECTIONS),
+                               statement_timeout=DB_STATEMENT_TIMEOUT, timeout=3600, page_size=LIST_PAGE_SIZE)
+    except ImportError as e:
+        raise CatalogError(str(e))
+    async with catalog:
+        began = time.perf_counter()
+        await asyncio.gather(*(client(catalog, offset) for offset in range(clients)))
+        elapsed = time.perf_counter() - began
+    latencies.sort()
+    queries = len(latencies) * pipeline
+    result = {"clients": clients, "pipeline": pipeline, "queries": queries, "seconds": elapsed,
+              "queries_per_second": queries / elapsed, "median_ms": percentile(latencies, 0.5) * 1000,
+              "p95_ms": percentile(latencies, 0.95) * 1000}
+    print(f"{'async reads':34} {result['median_ms']:10.2f} ms median {result['p95_ms']:10.2f} ms p95 "
+          f"{result['queries_per_second']:8.0f} queries/s ({clients} clients, {pipeline} per round trip)")
+    return result
+
+def compare_benchmarks(previous, current):
+    print(f"{'operation':34} {'before':>10} {'after':>10} {'change':>8}")
+    for name, result in current["operations"].items():
+        before = previous.get("operations", {}).get(name)
+        if before:
+            change = result["median_ms"] / before["median_ms"] - 1 if before["median_ms"] else 0.0
+            print(f"{name:34} {before['median_ms']:10.2f} {result['median_ms']:10.2f} {change:+8.0%}")
+
+def benchmark(conn, args):
+    global PREPARED_STATEMENTS
+    PREPARED_STATEMENTS = PREPARED_STATEMENTS and not args.unprepared
+    with conn.cursor() as cur:
+        sizes = catalog_sizes(cur)
+    conn.rollback()
+    if sizes["songs"] and not args.reuse:
+        print("The catalog is not empty. Use --reuse to benchmark it as it is, or wipe it first.")
+        return 1
+    if args.skew <= 1:
+        print("The skew must be greater than 1.")
+        return 1
+    unknown = [name for name in args.operation or () if name not in BENCH_OPERATIONS]
+    if unknown:
+        print(f"Unknown operations: {', '.join(unknown)}. Choose from: {', '.join(BENCH_OPERATIONS)}.")
+        return 1
+
+    generator = None
+    with conn.cursor() as cur:
+        fixture = args.fixture and snapshot_exists(cur, args.fixture)
+    conn.rollback()
+    if not sizes["songs"] and fixture:
+        if apply(conn, restore_snapshot, args.fixture) is None:
+            return 1
+        print(f"Restored the catalog from snapshot '{args.fixture}'.")
+        generator = {"snapshot": args.fixture}
+    elif not sizes["songs"]:
+        generator = {key: getattr(args, key) for key in ("artists", "albums_per_artist", "songs_per_album",
+                                                          "categories", "categories_per_song", "skew")}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "catalog.jsonl")
+            tracks = generate_catalog(path, args.artists, args.albums_per_artist, args.songs_per_album,
+                                      args.categories, args.categories_per_song, args.skew, args.seed)
+            print(f"Generated a synthetic catalog with {tracks} tracks.")
+            if import_catalog(conn, path):
+                return 1
+        if args.fixture and apply(conn, save_snapshot, args.fixture) is not None:
+            print(f"Saved the generated catalog as snapshot '{args.fixture}'.")
+
+    report = run_benchmark(conn, args.operation, args.repeat, args.seed)
+    if args.async_clients:
+        with conn.cursor() as cur:
+            samples = bench_samples(cur, args.repeat, args.seed)
+        conn.rollback()
+        report["async_reads"] = asyncio.run(async_read_benchmark(samples, args.async_clients, args.pipeline))
+    report["label"] = args.label
+    report["prepared_statements"] = PREPARED_STATEMENTS
+    report["generator"] = generator
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare_benchmarks(json.load(f), report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}.")
+    return 0
+
+# Read-only HTTP/JSON service. Responses carry the catalog version as a weak
+# ETag, so a client revalidating an unchanged resource costs one single-row read
+SERVE_WORKERS = DB_MAX_CONNECTIONS
+SERVE_MAX_LIMIT = 1000
+SERVE_GZIP_MIN_BYTES = 1024
+SERVE_GZIP_LEVEL = 6
+
+SERVE_LISTINGS = {"artists": "artist", "albums": "album", "categories": "category", "songs": "song"}
+
+def query_param(query, name, convert=str, default=None):
+    values = query.get(name)
+    if not values:
+        return default
+    try:
+        return convert(values[-1])
+    except ValueError:
+        raise CatalogError(f"Invalid value for '{name}'.")
+
+def serve_listing(cur, path, query, plural):
+    kind = SERVE_LISTINGS[plural]
+    limit = query_param(query, "limit", int, LIST_PAGE_SIZE or SERVE_MAX_LIMIT)
+    if not 0 < limit <= SERVE_MAX_LIMIT:
+        raise CatalogError(f"'limit' must be between 1 and {SERVE_MAX_LIMIT}.")
+    after = query_param(query, "after")
+    after_id = query_param(query, "after_id", int)
+    if (after is None) != (after_id is None):
+        raise CatalogError("'after' and 'after_id' must be given together.")
+
+    sql, key_columns = LISTING_QUERIES[kind]
+    cur.execute(*page_query(sql, key_columns, None if after is None else (after, after_id), limit))
+    rows = cur.fetchall()
+    page = {"items": [dict(zip(LISTING_FIELDS[kind], row)) for row in rows], "next": None}
+    if len(rows) == limit:
+        page["next"] = f"{path}?" + urllib.parse.urlencode({"after": rows[-1][0], "after_id": rows[-1][1],
+                                                           "limit": limit})
+    return page
+
+def serve_songs_by_artist(cur, path, query, artist_name):
+    return {"artist": artist_name, "songs": songs_by_artist(cur, artist_name)}
+
+def serve_artists_by_year(cur, path, query, year):
+    return {"year": int(year), "artists": artists_by_year(cur, int(year))}
+
+def serve_albums_by_category(cur, path, query, category_name):
+    return {"category": category_name,
+            "albums": [{"title": title, "artists": artists} for title, artists in albums_by_category(cur, category_name)]}
+
+# Matched against the still-encoded path, so names may contain an encoded '/'
+SERVE_ROUTES = (
+    (re.compile(r"/(artists|albums|categories|songs)/?"), serve_listing),
+    (re.compile(r"/artists/([^/]+)/songs"), serve_songs_by_artist),
+    (re.compile(r"/years/(-?\d+)/artists"), serve_artists_by_year),
+    (re.compile(r"/categories/([^/]+)/albums"), serve_albums_by_category),
+)
+
+def accepts_gzip(header):
+    for coding in (header or "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            quality = params.strip().lower()
+            if not quality.startswith("q="):
+                return True
+            try:
+                return float(quality[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
+def etag_matches(header, etag):
+    # If-None-Match uses weak comparison: W/"7" and "7" name the same version
+    tags = [tag.strip().removeprefix("W/") for tag in (header or "").split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+class CatalogRequestHandler(http.server.BaseHTTPRequestHandler):
+    server_version = "AlbumCatalog/1.0"
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        for pattern, route in SERVE_ROUTES:
+            match = pattern.fullmatch(url.path)
+            if match:
+                break
+        else:
+            self.send_json(404, {"error": "Not found."})
             return
 
-        cur.execute("UPDATE Songs SET Title = %s WHERE SongID = %s;", (new_title, song[0]))
-        conn.commit()
-        print("Song name updated successfully.")
+        try:
+            with transaction() as conn, conn.cursor() as cur, traced(conn, f"GET {route.__name__}"):
+                # The version and the rows come from one snapshot, so an ETag never labels older data
+                cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;")
+                etag = f'W/"{catalog_version(cur)}"'
+                if etag_matches(self.headers.get("If-None-Match"), etag):
+                    payload = None
+                else:
+                    payload = route(cur, url.path, urllib.parse.parse_qs(url.query),
+                                    *map(urllib.parse.unquote, match.groups()))
+        except CatalogError as e:
+            self.send_json(400, {"error": str(e)})
+        except psycopg2.Error as e:
+            self.send_json(503 if isinstance(e, psycopg2.OperationalError) else 500, {"error": str(e).strip()})
+        else:
+            self.send_json(304 if payload is None else 200, payload, etag)
+
+    def send_json(self, status, payload, etag=None):
+        body = b"" if payload is None else json.dumps(payload, separators=(",", ":")).encode()
+        gzipped = len(body) >= SERVE_GZIP_MIN_BYTES and accepts_gzip(self.headers.get("Accept-Encoding"))
+        if gzipped:
+            body = gzip.compress(body, SERVE_GZIP_LEVEL)
+        self.send_response(status)
+        if payload is not None:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class CatalogServer(http.server.HTTPServer):
+    # Requests are handed to a fixed set of worker threads instead of a thread
+    # per request, so a burst queues up rather than exhausting the database pool
+    def __init__(self, address, workers):
+        super().__init__(address, CatalogRequestHandler)
+        self.workers = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="catalog-worker")
+
+    def process_request(self, request, client_address):
+        self.workers.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.workers.shutdown(wait=True)
+
+def serve(args):
+    global DB_MAX_CONNECTIONS
+    # Each worker holds at most one pooled connection at a time
+    DB_MAX_CONNECTIONS = max(DB_MAX_CONNECTIONS, args.workers)
+    server = CatalogServer((args.host, args.port), args.workers)
+    host, port = server.server_address[:2]
+    print(f"Serving the catalog on http://{host}:{port}/ with {args.workers} workers. Press Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+def show_cache_stats(conn):
+    for table, cache in ID_CACHES.items():
+        stats = cache.stats()
+        print(f"{table}: {stats['size']} cached IDs, {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.0%} hit rate)")
+    stats = RESULT_CACHE.stats()
+    print(f"Query results: {stats['size']} cached, {stats['hits']} hits, {stats['misses']} misses "
+          f"({stats['hit_rate']:.0%} hit rate)")
+    graph = _catalog_graph
+    if graph is not None:
+        print(f"Catalog graph: {sum(len(links) for links in graph.links.values())} links, "
+              f"{graph.changes} logged changes applied, built in {graph.seconds:.2f}s")
+
+def show_operation_profile(conn):
+    if OPERATION_STATS.snapshot():
+        print(OPERATION_STATS.summary())
+    else:
+        print("No operations recorded yet.")
+
+MENU_ACTIONS = {
+    '1': ("Create Artist", create_artist),
+    '2': ("Create Album", create_album),
+    '3': ("Create Category", create_category),
+    '4': ("Create Song", create_song),
+    '5': ("List Artists", list_artists),
+    '6': ("List Albums", list_albums),
+    '7': ("List Categories", list_categories),
+    '8': ("List Songs", list_songs),
+    '9': ("Delete Artist", delete_artist),
+    '10': ("Delete Album", delete_album),
+    '11': ("Delete Category", delete_category),
+    '12': ("Delete Song", delete_song),
+    '13': ("List Songs by Artist", list_songs_by_artist),
+    '14': ("List Artists with Albums by Year", list_artists_with_albums_by_year),
+    '15': ("List Albums by Category", list_albums_by_category),
+    '16': ("Wipe Entire Database", wipe_database),
+    '17': ("Edit Artist", edit_artist),
+    '18': ("Edit Album", edit_album),
+    '19': ("Edit Category", edit_category),
+    '20': ("Edit Song", edit_song),
+    '21': ("Collect Orphaned Albums and Artists", collect_orphans),
+    '22': ("Show ID Cache Statistics", show_cache_stats),
+    '23': ("Show Operation Profile", show_operation_profile),
+    '24': ("List Collaborators of an Artist", list_collaborators),
+    '25': ("List Songs Similar to a Song", list_similar_songs),
+    '26': ("List Top Categories of an Artist", list_top_categories),
+}
 
 def main_menu():
-    conn = connect_db()
+    try:
+        get_pool()
+    except psycopg2.Error as e:
+        print(f"Error connecting to the database: {e}")
+        return
+
     try:
         while True:
-            print("\n1. Create Artist")
-            print("2. Create Album")
-            print("3. Create Category")
-            print("4. Create Song")
-            print("5. List Artists")
-            print("6. List Albums")
-            print("7. List Categories")
-            print("8. List Songs")
-            print("9. Delete Artist")
-            print("10. Delete Album")
-            print("11. Delete Category")
-            print("12. Delete Song")
-            print("13. List Songs by Artist")
-            print("14. List Artists with Albums by Year")
-            print("15. List Albums by Category")
-            print("16. Wipe Entire Database")
-            print("17. Edit Artist")
-            print("18. Edit Album")
-            print("19. Edit Category")
-            print("20. Edit Song")
+            print()
+            for key, (label, _) in MENU_ACTIONS.items():
+                print(f"{key}. {label}")
             print("0. Exit")
 
             choice = input("Enter choice: ")
-            if choice == '1':
-                create_artist(conn)
-            elif choice == '2':
-                create_album(conn)
-            elif choice == '3':
-                create_category(conn)
-            elif choice == '4':
-                create_song(conn)
-            elif choice == '5':
-                list_artists(conn)
-            elif choice == '6':
-                list_albums(conn)
-            elif choice == '7':
-                list_categories(conn)
-            elif choice == '8':
-                list_songs(conn)
-            elif choice == '9':
-                delete_artist(conn)
-            elif choice == '10':
-                delete_album(conn)
-            elif choice == '11':
-                delete_category(conn)
-            elif choice == '12':
-                delete_song(conn)
-            elif choice == '13':
-                list_songs_by_artist(conn)
-            elif choice == '14':
-                list_artists_with_albums_by_year(conn)
-            elif choice == '15':
-                list_albums_by_category(conn)
-            elif choice == '16':
-                wipe_database(conn)
-            elif choice == '17':
-                edit_artist(conn)
-            elif choice == '18':
-                edit_album(conn)
-            elif choice == '19':
-                edit_category(conn)
-            elif choice == '20':
-                edit_song(conn)
-            elif choice == '0':
+            if choice == '0':
                 break
-            else:
+            if choice not in MENU_ACTIONS:
                 print("Invalid choice. Please try again.")
+                continue
+
+            # Each action gets its own pooled connection; a dropped one is replaced next time
+            try:
+                with connection() as conn:
+                    action = MENU_ACTIONS[choice][1]
+                    with traced(conn, action.__name__):
+                        action(conn)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                print(f"Lost the database connection: {e}")
     finally:
-        conn.close()
+        close_pool()
+
+def new_album_years(args):
+    # --year applies to every album the command has to create
+    return {album_title: args.year for album_title in args.album} if args.year is not None else None
+
+def cli_add_artist(cur, args):
+    songs = [(song_title, args.album, args.category) for song_title in args.song]
+    artist_id = add_artist(cur, args.name, songs, new_album_years(args))
+    print(f"Artist '{args.name}' created (ID {artist_id}).")
+
+def cli_add_album(cur, args):
+    songs = [(song_title, args.category) for song_title in args.song]
+    album_id = add_album(cur, args.title, args.year, args.artist, songs)
+    print(f"Album '{args.title}' created (ID {album_id}).")
+
+def cli_add_category(cur, args):
+    category_id = add_category(cur, args.name)
+    print(f"Category '{args.name}' created (ID {category_id}).")
+
+def cli_add_song(cur, args):
+    song_id = add_song(cur, args.title, args.artist, args.album, args.category, new_album_years(args))
+    print(f"Song '{args.title}' created (ID {song_id}).")
+
+def cli_delete(cur, args):
+    counts = remove(cur, args.command, args.name, args.dry_run)
+    print(f"{'Would delete' if args.dry_run else 'Deleted'} {describe_counts(counts)}.")
+
+def cli_rename(cur, args):
+    RENAMES[args.command](cur, args.name, args.new_name)
+    print(f"Renamed {args.command} '{args.name}' to '{args.new_name}'.")
+
+def cli_bulk_edit(cur, args):
+    report = bulk_edit(cur, args.command, args.path, args.dry_run)
+    for line, name, new_name, new_year, outcome in report:
+        change = [f"'{new_name}'"] if new_name else []
+        change += [f"year {new_year}"] if new_year is not None else []
+        print(f"{line}: '{name}' -> {', '.join(change) or 'no change'}: {outcome}")
+    updated = sum(outcome in ("updated", "would be updated") for *_, outcome in report)
+    print(f"{'Would update' if args.dry_run else 'Updated'} {updated} of {len(report)} {args.command} entries.")
+
+def cli_set_album_year(cur, args):
+    set_album_year(cur, args.title, args.year)
+    print(f"Album '{args.title}' is now from {args.year}.")
+
+def cli_list(cur, args):
+    LISTINGS[args.command](cur.connection, page_size=0)
+
+def cli_songs_by_artist(cur, args):
+    print_songs_by_artist(args.name, songs_by_artist(cur, args.name))
+
+def cli_artists_by_year(cur, args):
+    print_artists_by_year(args.year, artists_by_year(cur, args.year))
+
+def cli_albums_by_category(cur, args):
+    print_albums_by_category(args.name, albums_by_category(cur, args.name))
+
+def cli_collaborators(cur, args):
+    print_collaborators(args.name, collaborators(cur, args.name, args.hops, args.limit))
+
+def cli_similar_songs(cur, args):
+    print_similar_songs(args.title, similar_songs(cur, args.title, args.limit))
+
+def cli_top_categories(cur, args):
+    print_top_categories(args.name, top_categories(cur, args.name, args.limit))
+
+def cli_search(cur, args):
+    matches = search(cur, args.text, args.kind, args.mode, args.limit)
+    for kind, _, name, score in matches:
+        print(f"{kind:8} {name} ({score:.2f})")
+    if not matches:
+        print("No matches found.")
+
+def cli_stats(cur, args):
+    # With --previous, an unchanged catalog version reuses the earlier profile,
+    # so polling costs a single-row read until something is written
+    previous = None
+    if args.previous and os.path.exists(args.previous):
+        with open(args.previous, encoding="utf-8") as f:
+            previous = json.load(f)
+    if previous and previous.get("snapshot") is None and previous.get("version") == catalog_version(cur):
+        profile = {**previous, "seconds": 0.0}
+    else:
+        profile = catalog_stats(cur)
+
+    if args.snapshot:
+        profile["changes"] = stats_changes(catalog_stats(cur, args.snapshot), profile)
+        profile["compared_with"] = f"snapshot '{args.snapshot}'"
+    elif previous:
+        profile["changes"] = stats_changes(previous, profile)
+        profile["compared_with"] = f"version {previous.get('version')}"
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(profile, f, indent=2)
+    if args.format == "json":
+        print(json.dumps(profile, indent=2))
+    else:
+        print_stats(profile)
+
+def cli_wipe(cur, args):
+    wipe_catalog(cur)
+    print("Database wiped successfully.")
+
+def cli_snapshot_save(cur, args):
+    print(f"Saved snapshot '{args.name}' with {save_snapshot(cur, args.name)} songs.")
+
+def cli_snapshot_restore(cur, args):
+    print(f"Restored snapshot '{args.name}' with {restore_snapshot(cur, args.name)} songs.")
+
+def cli_snapshot_delete(cur, args):
+    delete_snapshot(cur, args.name)
+    print(f"Deleted snapshot '{args.name}'.")
+
+def cli_snapshot_list(cur, args):
+    snapshots = list_snapshots(cur)
+    for name, songs in snapshots:
+        print(f"{name}: {songs} songs")
+    if not snapshots:
+        print("No snapshots found.")
+
+RENAMES = {"artist": rename_artist, "album": rename_album, "category": rename_category, "song": rename_song}
+LISTINGS = {"artist": list_artists, "album": list_albums, "category": list_categories, "song": list_songs}
+
+def add_catalog_parsers(subparsers):
+    # Catalog commands run a (cur, args) handler; they never prompt or dump the catalog
+    actions = {}
+    for kind in ("artist", "album", "category", "song"):
+        actions[kind] = subparsers.add_parser(kind, help=f"add, delete, rename or list {kind} entries").add_subparsers(
+            dest="action", required=True)
+
+    parser = actions["artist"].add_parser("add", help="create an artist with their songs")
+    parser.add_argument("--name", required=True)
+    parser.add_argument("--song", action="append", required=True,
+                        help="song title, repeatable; every song gets each --album and --category")
+    parser.add_argument("--album", action="append", required=True, help="album title, repeatable")
+    parser.add_argument("--category", action="append", required=True, help="category name, repeatable")
+    parser.add_argument("--year", type=int, help="release year for albums that do not exist yet")
+    parser.set_defaults(handler=cli_add_artist)
+
+    parser = actions["album"].add_parser("add", help="create an album with its artists and songs")
+    parser.add_argument("--title", required=True)
+    parser.add_argument("--year", type=int, required=True)
+    parser.add_argument("--artist", action="append", required=True, help="artist name, repeatable")
+    parser.add_argument("--song", action="append", required=True, help="song title, repeatable")
+    parser.add_argument("--category", action="append", required=True,
+                        help="category name for every song, repeatable")
+    parser.set_defaults(handler=cli_add_album)
+
+    parser = actions["album"].add_parser("set-year", help="change an album's release year")
+    parser.add_argument("title")
+    parser.add_argument("year", type=int)
+    parser.set_defaults(handler=cli_set_album_year)
+
+    parser = actions["category"].add_parser("add", help="create a category")
+    parser.add_argument("--name", required=True)
+    parser.set_defaults(handler=cli_add_category)
+
+    parser = actions["song"].add_parser("add", help="create a song")
+    parser.add_argument("--title", required=True)
+    parser.add_argument("--artist", action="append", required=True, help="artist name, repeatable")
+    parser.add_argument("--album", action="append", required=True, help="album title, repeatable")
+    parser.add_argument("--category", action="append", required=True, help="category name, repeatable")
+    parser.add_argument("--year", type=int, help="release year for albums that do not exist yet")
+    parser.set_defaults(handler=cli_add_song)
+
+    for kind, kind_actions in actions.items():
+        parser = kind_actions.add_parser("delete", help=f"delete a {kind} and everything only it kept in the catalog")
+        parser.add_argument("name", help=f"{kind} name or title")
+        parser.add_argument("--dry-run", action="store_true", help="only report what would be deleted")
+        parser.set_defaults(handler=cli_delete)
+        parser = kind_actions.add_parser("rename", help=f"rename a {kind}")
+        parser.add_argument("name", help=f"current {kind} name or title")
+        parser.add_argument("new_name")
+        parser.set_defaults(handler=cli_rename)
+        parser = kind_actions.add_parser("bulk-edit", help=f"rename many {kind} entries from a mapping file")
+        parser.add_argument("path", help="CSV or JSON-lines file with name and new_name columns"
+                                         + (", and year for a new release year" if kind == "album" else ""))
+        parser.add_argument("--dry-run", action="store_true", help="only report what each row would do")
+        parser.set_defaults(handler=cli_bulk_edit)
+        parser = kind_actions.add_parser("list", help=f"list every {kind}")
+        parser.set_defaults(handler=cli_list)
+
+    query = subparsers.add_parser("query", help="catalog reports").add_subparsers(dest="action", required=True)
+    parser = query.add_parser("songs-by-artist", help="songs credited to an artist")
+    parser.add_argument("name")
+    parser.set_defaults(handler=cli_songs_by_artist)
+    parser = query.add_parser("artists-by-year", help="artists with albums released in a year")
+    parser.add_argument("year", type=int)
+    parser.set_defaults(handler=cli_artists_by_year)
+    parser = query.add_parser("albums-by-category", help="albums with songs in a category")
+    parser.add_argument("name")
+    parser.set_defaults(handler=cli_albums_by_category)
+    parser = query.add_parser("collaborators", help="artists sharing songs or albums with an artist, up to --hops away")
+    parser.add_argument("name")
+    parser.add_argument("--hops", type=int, default=1, help="steps through shared songs and albums (default: %(default)s)")
+    parser.add_argument("--limit", type=int, default=GRAPH_LIMIT, help="artists shown (default: %(default)s)")
+    parser.set_defaults(handler=cli_collaborators)
+    parser = query.add_parser("similar-songs", help="songs sharing the most categories with a song")
+    parser.add_argument("title")
+    parser.add_argument("--limit", type=int, default=GRAPH_LIMIT, help="songs shown (default: %(default)s)")
+    parser.set_defaults(handler=cli_similar_songs)
+    parser = query.add_parser("top-categories", help="the categories an artist's songs are most often filed under")
+    parser.add_argument("name")
+    parser.add_argument("--limit", type=int, default=GRAPH_LIMIT, help="categories shown (default: %(default)s)")
+    parser.set_defaults(handler=cli_top_categories)
+
+    parser = subparsers.add_parser("search", help="find artists, albums, songs and categories by name")
+    parser.add_argument("text")
+    parser.add_argument("--kind", action="append", choices=list(SEARCH_KINDS), help="only search this entity; may be repeated")
+    parser.add_argument("--mode", choices=SEARCH_MODES, default="auto",
+                        help="prefix, full-text word prefixes, fuzzy (needs pg_trgm) or all of them (default: %(default)s)")
+    parser.add_argument("--limit", type=int, default=SEARCH_LIMIT, help="matches shown (default: %(default)s)")
+    parser.set_defaults(handler=cli_search)
+
+    parser = subparsers.add_parser("stats", help="counts, distributions and gaps of the whole catalog")
+    parser.add_argument("--format", choices=("table", "json"), default="table", help="output format (default: %(default)s)")
+    parser.add_argument("--output", help="also write the profile to this JSON file")
+    parser.add_argument("--previous", metavar="FILE",
+                        help="an earlier --output file: report what changed, and reuse it if the catalog has not")
+    parser.add_argument("--snapshot", metavar="NAME", help="report what changed since a saved snapshot")
+    parser.set_defaults(handler=cli_stats)
+
+    parser = subparsers.add_parser("wipe", help="delete the whole catalog")
+    parser.add_argument("--yes", action="store_true", required=True, help="confirm the wipe")
+    parser.set_defaults(handler=cli_wipe)
+
+    snapshot_actions = subparsers.add_parser(
+        "snapshot", help="save the catalog as a named fixture on the server, or reset the catalog to one"
+    ).add_subparsers(dest="action", required=True)
+    for action, handler, help_text in (
+            ("save", cli_snapshot_save, "copy the current catalog into a new snapshot"),
+            ("restore", cli_snapshot_restore, "replace the whole catalog with a snapshot"),
+            ("delete", cli_snapshot_delete, "drop a snapshot")):
+        parser = snapshot_actions.add_parser(action, help=help_text)
+        parser.add_argument("name", help="letters, digits and underscores")
+        parser.set_defaults(handler=handler)
+    snapshot_actions.add_parser("list", help="show the saved snapshots").set_defaults(handler=cli_snapshot_list)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Manage the album collection database.")
+    parser.add_argument("--dsn", default=DB_DSN,
+                        help="libpq connection string (default: $ALBUM_DB_DSN or the local AlbumCollection database)")
+    parser.add_argument("--page-size", type=int, default=LIST_PAGE_SIZE,
+                        help="rows shown per listing page, 0 to list everything at once (default: %(default)s)")
+    parser.add_argument("--itersize", type=int, default=LIST_ITERSIZE,
+                        help="rows fetched per round trip by listing cursors (default: %(default)s)")
+    parser.add_argument("--slow-ms", type=float, default=TRACE_SLOW_MS,
+                        help="log statements slower than this with their EXPLAIN (ANALYZE, BUFFERS) plan, 0 to disable "
+                             "(default: $ALBUM_TRACE_SLOW_MS or %(default)s)")
+    parser.add_argument("--profile", action="store_true",
+                        help="print statements, rows and database/client time per operation on exit")
+    parser.add_argument("--prometheus", metavar="FILE",
+                        help="write the per-operation profile to FILE in the Prometheus text format on exit")
+    subparsers = parser.add_subparsers(dest="command")
+    import_parser = subparsers.add_parser("import", help="bulk import a CSV or JSON-lines catalog dump")
+    import_parser.add_argument("path", help="catalog file with song, album, year, artists and categories columns")
+    import_parser.add_argument("--workers", type=int, default=1,
+                               help="load the catalog in chunks through this many processes, each with its own "
+                                    "connection; interrupted parallel imports resume when run again "
+                                    "(default: %(default)s, a single transaction)")
+    export_parser = subparsers.add_parser("export", help="stream one entity of the catalog to a file")
+    export_parser.add_argument("--entity", choices=EXPORT_ENTITIES, default="tracks",
+                               help="what to export; tracks use the import format (default: %(default)s)")
+    export_parser.add_argument("--format", choices=EXPORT_FORMATS,
+                               help="file format (default: from the output file's extension, else jsonl)")
+    export_parser.add_argument("--output", default="-", help="file to write, '-' for stdout (default: %(default)s)")
+    export_parser.add_argument("--artist", help="only songs by this artist, and what they link to")
+    export_parser.add_argument("--year", type=int, help="only songs on albums released in this year")
+    export_parser.add_argument("--category", help="only songs in this category")
+    subparsers.add_parser("migrate", aliases=["init"], help="create the schema or upgrade it to the latest version")
+    gc_parser = subparsers.add_parser("gc", help="delete albums without songs and artists without songs")
+    gc_parser.add_argument("--dry-run", action="store_true", help="only report what would be deleted")
+    bench_parser = subparsers.add_parser("bench", help="time every catalog operation on a synthetic catalog")
+    bench_parser.add_argument("--artists", type=int, default=200, help="artists to generate (default: %(default)s)")
+    bench_parser.add_argument("--albums-per-artist", type=float, default=3,
+                              help="mean albums per artist (default: %(default)s)")
+    bench_parser.add_argument("--songs-per-album", type=float, default=10,
+                              help="mean songs per album (default: %(default)s)")
+    bench_parser.add_argument("--categories", type=int, default=50, help="categories to generate (default: %(default)s)")
+    bench_parser.add_argument("--categories-per-song", type=float, default=2,
+                              help="mean categories per song (default: %(default)s)")
+    bench_parser.add_argument("--skew", type=float, default=1.5,
+                              help="Pareto/Zipf exponent of the generated sizes, above 1; lower is more skewed "
+                                   "(default: %(default)s)")
+    bench_parser.add_argument("--seed", type=int, default=1, help="random seed (default: %(default)s)")
+    bench_parser.add_argument("--repeat", type=int, default=BENCH_REPEAT,
+                              help="runs per operation (default: %(default)s)")
+    bench_parser.add_argument("--operation", action="append", help="only time this operation; may be repeated")
+    bench_parser.add_argument("--async-clients", type=int, default=0,
+                              help="also time the read queries from this many concurrent asyncio clients "
+                                   "(needs psycopg 3)")
+    bench_parser.add_argument("--pipeline", type=int, default=1,
+                              help="queries each asyncio client pipelines per round trip (default: %(default)s)")
+    bench_parser.add_argument("--unprepared", action="store_true",
+                              help="send every statement as plain SQL instead of preparing the hot ones, to "
+                                   "measure what preparing saves")
+    bench_parser.add_argument("--fixture", metavar="NAME",
+                              help="restore an empty catalog from this snapshot instead of generating one, or "
+                                   "save the generated catalog under this name if there is no such snapshot")
+    bench_parser.add_argument("--reuse", action="store_true", help="benchmark the existing catalog as it is")
+    bench_parser.add_argument("--label", help="free-form tag stored with the results, e.g. a commit hash")
+    bench_parser.add_argument("--output", help="write the results to this JSON file")
+    bench_parser.add_argument("--compare", help="print the change against an earlier JSON results file")
+    serve_parser = subparsers.add_parser("serve", help="serve the listings and queries as read-only HTTP/JSON")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: %(default)s)")
+    serve_parser.add_argument("--port", type=int, default=8080, help="port to listen on (default: %(default)s)")
+    serve_parser.add_argument("--workers", type=int, default=SERVE_WORKERS,
+                              help="requests handled at the same time (default: %(default)s)")
+    run_parser = subparsers.add_parser("run", help="run a file of catalog commands in one transaction")
+    run_parser.add_argument("path", help="one command per line, e.g. song add --title ...; '#' starts a comment")
+    add_catalog_parsers(subparsers)
+    return parser
+
+def parse_args(argv=None):
+    return build_parser().parse_args(argv)
+
+def run_script(cur, path):
+    # Every line runs on the same cursor, so the caller's transaction covers the file
+    parser = build_parser()
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()
+    except (OSError, ValueError) as e:
+        raise CatalogError(f"Could not read script '{path}': {e}.")
+    for line_number, line in enumerate(lines, 1):
+        try:
+            argv = shlex.split(line, comments=True)
+        except ValueError as e:
+            raise CatalogError(f"{path}:{line_number}: {e}.")
+        if not argv:
+            continue
+        try:
+            args = parser.parse_args(argv)
+        except SystemExit:
+            raise CatalogError(f"{path}:{line_number}: invalid command.")
+        if getattr(args, "handler", None) is None:
+            raise CatalogError(f"{path}:{line_number}: '{argv[0]}' cannot be used in a script.")
+        try:
+            with traced(cur.connection, command_name(args)):
+                args.handler(cur, args)
+        except CatalogError as e:
+            raise CatalogError(f"{path}:{line_number}: {e}")
+    return True
+
+def command_name(args):
+    return " ".join(name for name in (args.command, getattr(args, "action", None)) if name)
+
+def run_command(args):
+    if args.command is None:
+        main_menu()
+        return 0
+
+    try:
+        if args.command == "serve":
+            return serve(args)
+        if args.command in ("import", "export", "gc", "migrate", "init", "bench"):
+            with connection() as conn, traced(conn, args.command):
+                if args.command == "bench":
+                    return benchmark(conn, args)
+                if args.command == "export":
+                    return export(conn, args)
+                if args.command == "import" and args.workers > 1:
+                    return import_catalog_parallel(conn, args.path, args.workers)
+                if args.command == "import":
+                    return import_catalog(conn, args.path)
+                if args.command in ("migrate", "init"):
+                    return migrate_schema(conn)
+                # collect_orphans reports its own failures and returns None for them
+                if collect_orphans(conn, dry_run=args.dry_run, confirm=False) is None:
+                    return 1
+            return 0
+
+        with transaction() as conn, conn.cursor() as cur:
+            if args.command == "run":
+                run_script(cur, args.path)
+            else:
+                with traced(conn, command_name(args)):
+                    args.handler(cur, args)
+        return 0
+    except CatalogError as e:
+        print(f"{e} Operation canceled.")
+        return 1
+    except psycopg2.Error as e:
+        print(f"An error occurred: {e}. Operation canceled.")
+        return 1
+    finally:
+        close_pool()
+
+def main(argv=None):
+    global DB_DSN, LIST_PAGE_SIZE, LIST_ITERSIZE, TRACE_SLOW_MS
+    args = parse_args(argv)
+    DB_DSN = args.dsn
+    LIST_PAGE_SIZE = args.page_size
+    LIST_ITERSIZE = args.itersize
+    TRACE_SLOW_MS = args.slow_ms
+    try:
+        return run_command(args)
+    finally:
+        if args.profile and OPERATION_STATS.snapshot():
+            print(OPERATION_STATS.summary())
+        if args.prometheus:
+            write_prometheus(args.prometheus)
 
 if __name__ == "__main__":
-    main_menu()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
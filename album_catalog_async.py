@@ -0,0 +1,184 @@
+# Asyncio access to the album catalog, and the read-only statements it shares
+# with album-manager.py. psycopg 3 (pip install "psycopg[binary,pool]") is only
+# imported when an AsyncCatalog is created, so the CLI can import this module
+# without it:
+#
+#     async with AsyncCatalog("dbname=AlbumCollection user=postgres") as catalog:
+#         songs = await catalog.songs_by_artist("Alice")
+
+def page_query(query, key_columns, last_key, page_size):
+    # Keyset pagination: query has {where} and {limit} slots and must select
+    # the key_columns first, so the last row of a page bounds the next one
+    if last_key is None:
+        return query.format(where="", limit="LIMIT %s"), (page_size,)
+    return (query.format(where=f"WHERE ({', '.join(key_columns)}) > (%s, %s)", limit="LIMIT %s"),
+            (*last_key, page_size))
+
+LIST_ARTISTS_SQL = """
+    SELECT a.Name, a.ArtistID,
+           ARRAY(SELECT al.Title
+                 FROM AlbumArtists aa
+                 JOIN Albums al ON aa.AlbumID = al.AlbumID
+                 WHERE aa.ArtistID = a.ArtistID
+                 ORDER BY al.Title) AS Albums
+    FROM Artists a
+    {where}
+    ORDER BY a.Name, a.ArtistID
+    {limit};
+"""
+
+LIST_ALBUMS_SQL = """
+    SELECT al.Title, al.AlbumID, al.Year,
+           ARRAY(SELECT DISTINCT a.Name
+                 FROM AlbumArtists aa
+                 JOIN Artists a ON aa.ArtistID = a.ArtistID
+                 WHERE aa.AlbumID = al.AlbumID
+                 ORDER BY a.Name) AS Artists,
+           ARRAY(SELECT DISTINCT s.Title
+                 FROM SongAlbums sa
+                 JOIN Songs s ON sa.SongID = s.SongID
+                 WHERE sa.AlbumID = al.AlbumID
+                 ORDER BY s.Title) AS Songs
+    FROM Albums al
+    {where}
+    ORDER BY al.Title, al.AlbumID
+    {limit};
+"""
+
+LIST_CATEGORIES_SQL = """
+    SELECT c.Name, c.CategoryID,
+           ARRAY(SELECT s.Title
+                 FROM SongCategories sc
+                 JOIN Songs s ON sc.SongID = s.SongID
+                 WHERE sc.CategoryID = c.CategoryID
+                 ORDER BY s.Title) AS Songs
+    FROM Categories c
+    {where}
+    ORDER BY c.Name, c.CategoryID
+    {limit};
+"""
+
+LIST_SONGS_SQL = """
+    SELECT d.Title, d.SongID, d.Albums, d.Artists, d.Categories
+    FROM SongDetails d
+    {where}
+    ORDER BY d.Title, d.SongID
+    {limit};
+"""
+
+# Listing statements and their keyset columns by kind
+LISTING_QUERIES = {
+    "artist": (LIST_ARTISTS_SQL, ("a.Name", "a.ArtistID")),
+    "album": (LIST_ALBUMS_SQL, ("al.Title", "al.AlbumID")),
+    "category": (LIST_CATEGORIES_SQL, ("c.Name", "c.CategoryID")),
+    "song": (LIST_SONGS_SQL, ("d.Title", "d.SongID")),
+}
+
+SONGS_BY_ARTIST_SQL = """
+    SELECT s.Title
+    FROM Songs s
+    JOIN SongArtists sa ON s.SongID = sa.SongID
+    JOIN Artists a ON sa.ArtistID = a.ArtistID
+    WHERE a.Name = %s;
+"""
+
+ARTISTS_BY_YEAR_SQL = """
+    SELECT DISTINCT a.Name
+    FROM Artists a
+    JOIN AlbumArtists aa ON a.ArtistID = aa.ArtistID
+    JOIN Albums al ON aa.AlbumID = al.AlbumID
+    WHERE al.Year = %s;
+"""
+
+ALBUMS_BY_CATEGORY_SQL = """
+    SELECT al.Title, array_agg(DISTINCT a.Name) AS Artists
+    FROM Albums al
+    JOIN SongAlbums sa ON al.AlbumID = sa.AlbumID
+    JOIN Songs s ON sa.SongID = s.SongID
+    JOIN SongCategories sc ON s.SongID = sc.SongID
+    JOIN Categories c ON sc.CategoryID = c.CategoryID
+    JOIN AlbumArtists aa ON al.AlbumID = aa.AlbumID
+    JOIN Artists a ON aa.ArtistID = a.ArtistID
+    WHERE c.Name = %s
+    GROUP BY al.AlbumID
+    ORDER BY al.Title;
+"""
+
+# Read-only statements served by AsyncCatalog, with the shape of their results
+CATALOG_QUERIES = {
+    "songs_by_artist": (SONGS_BY_ARTIST_SQL, lambda rows: [title for title, in rows]),
+    "artists_by_year": (ARTISTS_BY_YEAR_SQL, lambda rows: [name for name, in rows]),
+    "albums_by_category": (ALBUMS_BY_CATEGORY_SQL, lambda rows: [(title, artists) for title, artists in rows]),
+}
+
+def async_driver():
+    # psycopg 3 is only needed by the asyncio API, so it is imported on first use
+    try:
+        import psycopg
+        import psycopg_pool
+    except ImportError:
+        raise ImportError('The asyncio API needs psycopg 3: pip install "psycopg[binary,pool]".')
+    return psycopg, psycopg_pool
+
+class AsyncCatalog:
+    # Serves the catalog queries and listings to many coroutines from one
+    # process; each call borrows a pooled connection in autocommit mode.
+    # statement_timeout is in milliseconds (0 leaves statements unbounded) and
+    # page_size is the default listing page (0 returns every row)
+    def __init__(self, dsn, min_size=1, max_size=10, statement_timeout=0, timeout=30.0, page_size=50):
+        _, psycopg_pool = async_driver()
+        self.page_size = page_size
+        self.pool = psycopg_pool.AsyncConnectionPool(
+            dsn, min_size=min_size, max_size=max_size,
+            kwargs={"autocommit": True, "options": f"-c statement_timeout={statement_timeout}"},
+            timeout=timeout, check=psycopg_pool.AsyncConnectionPool.check_connection, open=False)
+
+    async def open(self):
+        await self.pool.open(wait=True)
+
+    async def close(self):
+        await self.pool.close()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def fetch(self, query, params=None):
+        async with self.pool.connection() as conn:
+            cur = await conn.execute(query, params)
+            return await cur.fetchall()
+
+    async def fetch_many(self, statements):
+        # Pipeline mode sends every (query, params) pair before reading any
+        # result, so a batch costs one round trip instead of one per statement
+        async with self.pool.connection() as conn:
+            async with conn.pipeline():
+                cursors = [await conn.execute(query, params) for query, params in statements]
+            return [await cur.fetchall() for cur in cursors]
+
+    async def query(self, name, *params):
+        query, shape = CATALOG_QUERIES[name]
+        return shape(await self.fetch(query, params))
+
+    async def query_many(self, calls):
+        # calls are (query name, *params) tuples, answered in order over one connection
+        rows = await self.fetch_many([(CATALOG_QUERIES[name][0], params) for name, *params in calls])
+        return [CATALOG_QUERIES[name][1](result) for (name, *_), result in zip(calls, rows)]
+
+    async def songs_by_artist(self, artist_name):
+        return await self.query("songs_by_artist", artist_name)
+
+    async def artists_by_year(self, year):
+        return await self.query("artists_by_year", year)
+
+    async def albums_by_category(self, category_name):
+        return await self.query("albums_by_category", category_name)
+
+    async def listing(self, kind, after=None, limit=None):
+        # One keyset page; pass the key of the last row (name, ID) to get the next.
+        # A page size of 0 binds LIMIT NULL, which returns every row
+        query, key_columns = LISTING_QUERIES[kind]
+        return await self.fetch(*page_query(query, key_columns, after, limit or self.page_size or None))